@@ -5,6 +5,9 @@ class Settings(BaseSettings):
     # 数据库配置
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "ai_reviewer"
+    SQLITE_DB_PATH: str = "ai_reviewer.db"
+    # 业务数据的存储后端：sqlite（本地文件，单节点）/ mongodb（多个API节点共用 MONGODB_URL）；缓存与知识库索引始终保存在本地SQLite
+    STORAGE_BACKEND: str = "sqlite"
     
     # 应用配置
     APP_NAME: str = "AI Reviewer"
@@ -23,6 +26,117 @@ class Settings(BaseSettings):
     # 默认使用的AI模型类型（openai或dashscope）
     AI_PROVIDER: str = "openai"
     
+    # 大模型调用重试（限流、超时、连接及5xx错误）
+    AI_MAX_RETRIES: int = 2
+    AI_RETRY_BACKOFF_SECONDS: float = 0.5
+    
+    # 规则校验时并发调用大模型的文件数
+    VALIDATION_CONCURRENCY: int = 4
+    
+    # 大模型调用调度：全局并发上限，其中 AI_INTERACTIVE_RESERVED 个名额只留给交互式调用（规则校验、优化）；
+    # 批量审核按场景、任务加权公平排队，AI_SCENE_MAX_CONCURRENCY 为单个场景同时进行的批量调用上限（0表示不限制）
+    AI_MAX_CONCURRENCY: int = 8
+    AI_INTERACTIVE_RESERVED: int = 2
+    AI_SCENE_MAX_CONCURRENCY: int = 4
+    
+    # 提示词大小限制：单次调用的token上限，超出时内容分片审核，分片数超过上限则直接拒绝
+    AI_MAX_PROMPT_TOKENS: int = 6000
+    AI_MAX_CONTENT_CHUNKS: int = 20
+    
+    # 模型级联：AI_CASCADE_MODEL 非空时审核先使用该（低成本）模型，结论为 warning 或置信度低于阈值
+    # （审核项未设置 confidence_threshold 时使用 AI_CASCADE_CONFIDENCE_THRESHOLD）时再用当前配置的模型复审
+    AI_CASCADE_MODEL: str = ""
+    AI_CASCADE_CONFIDENCE_THRESHOLD: float = 0.8
+    
+    # 离线批量审核（OpenAI兼容的Batch API）：单个批次的请求数与输入文件大小上限（超出时拆成多个批次）、
+    # 完成时限，以及后台轮询批次状态的间隔（0表示不在后台轮询，只在查询任务批次状态时刷新）；
+    # 提交或导入中的任务超过 AI_BATCH_CLAIM_TIMEOUT_SECONDS 没有进展时视为进程已退出，恢复到之前的状态
+    AI_BATCH_MAX_REQUESTS: int = 50000
+    AI_BATCH_MAX_FILE_MB: int = 190
+    AI_BATCH_COMPLETION_WINDOW: str = "24h"
+    AI_BATCH_POLL_INTERVAL_SECONDS: int = 60
+    AI_BATCH_CLAIM_TIMEOUT_SECONDS: int = 1800
+    
+    # 审核任务默认token预算（0表示不限制），超出后的处理方式：pause 暂停任务 / truncate 截断剩余工作并结束
+    TASK_TOKEN_BUDGET: int = 0
+    TASK_BUDGET_ACTION: str = "pause"
+    
+    # 图片审核：发送给视觉模型前缩放到最长边 IMAGE_MAX_SIDE 并重新编码，处理结果按文件哈希缓存；
+    # AI_VISION_MODEL 为空时使用当前配置的模型，IMAGE_WORKERS 为0时使用CPU核数
+    AI_VISION_MODEL: str = ""
+    IMAGE_MAX_SIDE: int = 1024
+    IMAGE_THUMBNAIL_SIDE: int = 256
+    IMAGE_FORMAT: str = "jpeg"
+    IMAGE_QUALITY: int = 85
+    IMAGE_DETAIL: str = "auto"
+    IMAGE_WORKERS: int = 0
+    IMAGE_CACHE_DIR: str = "image_cache"
+    
+    # OCR：PDF中文字层不足 OCR_MIN_TEXT_CHARS 个字符的扫描页与图片在进程池中用tesseract识别（PDF页面渲染需要pypdfium2），
+    # 识别结果按 (文件哈希, 页码, OCR参数) 缓存；OCR_WORKERS 为0时使用CPU核数，OCR_TESSERACT_CMD 为空时从PATH查找
+    OCR_ENABLED: bool = True
+    OCR_LANG: str = "chi_sim+eng"
+    OCR_DPI: int = 300
+    OCR_PSM: int = 3
+    OCR_MIN_TEXT_CHARS: int = 20
+    OCR_WORKERS: int = 0
+    OCR_TESSERACT_CMD: str = ""
+    
+    # 重复/近似内容复用已有审核结论：off 关闭 / reuse 直接复用 / confirm 近似内容只把差异发给大模型确认（完全相同的内容直接复用）
+    AUDIT_DEDUP_MODE: str = "confirm"
+    AUDIT_DEDUP_THRESHOLD: float = 0.9
+    AUDIT_DEDUP_CONFIRM_MAX_TOKENS: int = 800
+    
+    # 审核内容按内容哈希只保存一份（contents表），审核结果通过 content_hash 引用；
+    # 压缩算法 zstd（需安装zstandard，未安装时使用zlib）/ zlib / none，级别对zstd为1-22，对zlib为1-9
+    CONTENT_COMPRESSION: str = "zstd"
+    CONTENT_COMPRESSION_LEVEL: int = 3
+    
+    # 审核结果归档：完成超过 ARCHIVE_AFTER_DAYS 天的任务，其结果按任务创建月份移入 ARCHIVE_DIR/YYYY-MM/ 下的压缩JSONL文件，
+    # 读取时透明地从归档文件返回；ARCHIVE_ENABLED 开启后台定时归档（每 ARCHIVE_INTERVAL_SECONDS 秒，每次最多 ARCHIVE_BATCH_TASKS 个任务）。
+    # 多节点共用MongoDB时 ARCHIVE_DIR 需为各节点共享的目录
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_DIR: str = "archives"
+    ARCHIVE_AFTER_DAYS: int = 90
+    ARCHIVE_INTERVAL_SECONDS: int = 3600
+    ARCHIVE_BATCH_TASKS: int = 20
+    # 归档或恢复中的任务超过 ARCHIVE_CLAIM_TIMEOUT_SECONDS 未结束时视为进程已退出，可被重新归档或恢复
+    ARCHIVE_CLAIM_TIMEOUT_SECONDS: int = 1800
+    
+    # 参考资料知识库：向量存放目录、本地向量模型（为空时使用哈希TF-IDF）、切片大小与检索参数
+    KNOWLEDGE_BASE_DIR: str = "knowledge_base"
+    KB_EMBEDDING_MODEL: str = ""
+    KB_VECTOR_DIM: int = 1024
+    KB_CHUNK_TOKENS: int = 300
+    KB_TOP_K: int = 4
+    KB_CONTEXT_TOKENS: int = 1200
+    # 片段数达到该值后启用近似最近邻索引，检索时扫描的簇数
+    KB_IVF_MIN_VECTORS: int = 4096
+    KB_IVF_NPROBE: int = 8
+    
+    # 响应压缩：按 Accept-Encoding 协商 br（需安装brotli）或gzip，小于 COMPRESSION_MIN_SIZE 字节的响应不压缩
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    
+    # 日志配置
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json 或 text
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLING_WINDOW_SECONDS: float = 1.0
+    LOG_SAMPLING_BURST: int = 20
+    LOG_SAMPLING_RATE: float = 0.1
+    
+    # 链路追踪配置（OTLP/JSON 文件导出，每行一条trace）：默认关闭；
+    # 文件超过 TRACE_EXPORT_MAX_MB 时轮转为 .1 文件（只保留一份）
+    TRACING_ENABLED: bool = False
+    TRACE_EXPORT_PATH: str = "traces/traces.jsonl"
+    TRACE_EXPORT_MAX_MB: int = 100
+    
+    # 文件上传目录
+    UPLOAD_DIR: str = "uploads"
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
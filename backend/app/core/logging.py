@@ -1,5 +1,17 @@
 import re
+import sys
+import json
+import time
+import queue
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 from typing import Optional
+from app.core.tracing import current_trace_id
 
 SENSITIVE_PATTERNS = [
     (r'sk-[a-zA-Z0-9]{20,}', lambda m: '*' * len(m.group(0))),
@@ -17,9 +29,205 @@ def sanitize_log_message(message: str) -> str:
     """
     if not isinstance(message, str):
         return str(message)
-    
+
     sanitized = message
     for pattern, replacement in SENSITIVE_PATTERNS:
         sanitized = re.sub(pattern, replacement, sanitized)
-    
+
     return sanitized
+
+# 请求级上下文：关联ID与审核任务ID，随协程自动传递
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+task_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("task_id", default=None)
+
+# LogRecord 的标准属性，格式化时用于区分 extra 字段
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "task_id", "trace_id", "sampled"}
+
+@contextmanager
+def log_context(request_id: Optional[str] = None, task_id: Optional[str] = None):
+    """
+    在当前上下文中绑定关联ID/任务ID，退出时恢复
+    :param request_id: 请求关联ID
+    :param task_id: 审核任务ID
+    """
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if task_id is not None:
+        tokens.append((task_id_var, task_id_var.set(task_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+class ContextFilter(logging.Filter):
+    """在调用方线程中捕获上下文变量，写入日志记录"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.task_id = task_id_var.get()
+        record.trace_id = current_trace_id()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    高频日志采样：同一消息模板在一个时间窗口内只完整放行前 burst 条，
+    其余按 sample_rate 比例放行。ERROR 及以上级别始终放行。
+    """
+    def __init__(self, window_seconds: float = 1.0, burst: int = 20, sample_rate: float = 0.1):
+        super().__init__()
+        self.window_seconds = window_seconds
+        self.burst = burst
+        self.every = max(1, int(round(1 / sample_rate))) if sample_rate > 0 else 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._counts: dict = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window_seconds:
+                self._window_start = now
+                self._counts.clear()
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+        if count <= self.burst:
+            return True
+        if self.every and (count - self.burst) % self.every == 0:
+            # 记录本条代表的被丢弃条数，便于还原真实频率
+            record.sampled = self.every
+            return True
+        return False
+
+class JsonFormatter(logging.Formatter):
+    """将日志记录格式化为单行JSON"""
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "task_id": getattr(record, "task_id", None),
+        }
+        if getattr(record, "trace_id", None):
+            payload["trace_id"] = record.trace_id
+        if getattr(record, "sampled", None):
+            payload["sampled"] = record.sampled
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        elif record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    只在调用方做最少的工作（合并消息参数），不做格式化与脱敏；
+    队列满时直接丢弃并计数，避免阻塞事件循环
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class RedactingQueueListener(QueueListener):
+    """后台写日志线程，统一在此处进行一次敏感信息脱敏"""
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = sanitize_log_message(record.msg)
+        if record.exc_info:
+            record.exc_text = sanitize_log_message(self._exc_formatter.formatException(record.exc_info))
+            record.exc_info = None
+        return record
+
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[RedactingQueueListener] = None
+
+def setup_logging() -> None:
+    """初始化结构化异步日志：业务线程只入队，由后台线程格式化、脱敏并输出"""
+    global _queue_handler, _listener
+    if _listener is not None:
+        return
+    from app.core.config import settings
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [request_id=%(request_id)s task_id=%(task_id)s] %(message)s"
+        ))
+
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(ContextFilter())
+    _queue_handler.addFilter(SamplingFilter(
+        window_seconds=settings.LOG_SAMPLING_WINDOW_SECONDS,
+        burst=settings.LOG_SAMPLING_BURST,
+        sample_rate=settings.LOG_SAMPLING_RATE
+    ))
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.addHandler(_queue_handler)
+
+    _listener = RedactingQueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging() -> None:
+    """停止后台日志线程并刷新队列中剩余的日志"""
+    global _queue_handler, _listener
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    _listener = None
+    _queue_handler = None
+
+class RequestContextMiddleware:
+    """为每个请求生成/透传关联ID（X-Request-ID），写入日志上下文与响应头"""
+    header_name = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == self.header_name:
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((self.header_name, request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_request_id)
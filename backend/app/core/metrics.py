@@ -0,0 +1,267 @@
+import time
+import bisect
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+# 默认耗时分桶（秒），覆盖毫秒级的数据库语句到数十秒的大模型调用
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """只增计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    """分桶直方图，输出 _bucket/_sum/_count"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., +Inf计数], 总和
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels) -> "_Timer":
+        """上下文管理器：记录代码块耗时"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1]) for key, state in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+class MetricsRegistry:
+    """指标注册表，按 Prometheus 文本格式导出"""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+registry = MetricsRegistry()
+
+# HTTP 指标
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP请求总数", ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时（秒）", ("method", "route")
+)
+http_requests_in_progress = registry.gauge(
+    "http_requests_in_progress", "正在处理的HTTP请求数", ("method",)
+)
+
+# 大模型调用指标
+ai_request_duration_seconds = registry.histogram(
+    "ai_request_duration_seconds", "大模型调用耗时（秒）", ("provider", "model", "prompt", "outcome")
+)
+ai_tokens_total = registry.counter(
+    "ai_tokens_total", "大模型token用量", ("provider", "model", "kind")
+)
+ai_retries_total = registry.counter(
+    "ai_retries_total", "大模型调用重试次数", ("provider", "model", "reason")
+)
+ai_fallback_total = registry.counter(
+    "ai_fallback_total", "大模型调用失败后返回默认结果的次数", ("provider", "prompt")
+)
+ai_cascade_total = registry.counter(
+    "ai_cascade_total", "模型级联的审核调用：accepted 采用小模型结论 / warning、low_confidence 升级到主模型复审", ("prompt", "outcome")
+)
+ai_batch_requests_total = registry.counter(
+    "ai_batch_requests_total", "批量审核（Batch API）的请求数：submitted 提交 / succeeded 成功 / failed 失败 / unfinished 未完成（过期或取消）", ("outcome",)
+)
+
+# 大模型调用调度指标
+ai_scheduler_wait_seconds = registry.histogram(
+    "ai_scheduler_wait_seconds", "大模型调用排队等待耗时（秒）", ("priority",)
+)
+ai_scheduler_queue_depth = registry.gauge(
+    "ai_scheduler_queue_depth", "排队等待的大模型调用数", ("priority",)
+)
+ai_scheduler_in_flight = registry.gauge(
+    "ai_scheduler_in_flight", "正在进行的大模型调用数", ("priority",)
+)
+
+# OCR指标
+ocr_pages_total = registry.counter(
+    "ocr_pages_total", "文件页面的文本来源：text_layer 自带文字层 / cache 缓存 / ocr 识别 / failed 识别失败", ("source",)
+)
+
+# 审核结论复用指标
+audit_dedup_total = registry.counter(
+    "audit_dedup_total", "重复/近似内容查找结果", ("outcome",)
+)
+
+# 审核结果归档指标
+audit_archive_tasks_total = registry.counter(
+    "audit_archive_tasks_total", "审核任务结果的归档与恢复次数：archived / restored / failed", ("outcome",)
+)
+
+# 数据库指标
+db_statement_duration_seconds = registry.histogram(
+    "db_statement_duration_seconds", "SQLite语句耗时（秒）", ("operation", "table")
+)
+db_lock_wait_seconds = registry.histogram(
+    "db_lock_wait_seconds", "等待SQLite写锁的耗时（秒）", ("operation",)
+)
+db_lock_errors_total = registry.counter(
+    "db_lock_errors_total", "SQLite返回database is locked的次数", ("operation",)
+)
+
+class MetricsMiddleware:
+    """按路由模板记录请求耗时直方图，避免把路径参数展开成高基数标签"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc(method=method)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_progress.dec(method=method)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration_seconds.observe(time.perf_counter() - start, method=method, route=route_path)
+            http_requests_total.inc(method=method, route=route_path, status=str(status_code))
@@ -0,0 +1,20 @@
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+def _default(value: Any) -> Any:
+    """orjson无法直接序列化的对象：pydantic模型按别名导出为JSON兼容的字典"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", by_alias=True)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class ORJSONResponse(JSONResponse):
+    """
+    使用orjson序列化的JSON响应，作为应用的默认响应类。
+    直接返回的pydantic模型（或其列表、字典）也无需先经过 jsonable_encoder
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
@@ -9,7 +9,7 @@ class InputValidator:
     , re.IGNORECASE)
     
     XSS_PATTERN = re.compile(
-        r"<script.*?>|<\/script>|<iframe.*?>|<\/iframe>|<object.*?>|<\/object>|", re.IGNORECASE | re.DOTALL)
+        r"<script.*?>|<\/script>|<iframe.*?>|<\/iframe>|<object.*?>|<\/object>", re.IGNORECASE | re.DOTALL)
 
     @staticmethod
     def sanitize_string(value: str, max_length: Optional[int] = None) -> str:
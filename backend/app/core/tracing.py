@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import queue
+import secrets
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# OTLP 状态码
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+def _otlp_value(value: Any) -> dict:
+    """将Python值转换为OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+class Span:
+    """一次操作的计时区间，字段与OTLP Span保持一致"""
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"], attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[dict] = []
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        # 根span所在的trace是否已经导出
+        self.exported = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes) -> None:
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def set_status(self, code: int, message: str = "") -> None:
+        self.status_code = code
+        self.status_message = message
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+            "events": [
+                {"timeUnixNano": str(event["time_ns"]), "name": event["name"], "attributes": _otlp_attributes(event["attributes"])}
+                for event in self.events
+            ],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+class OTLPJsonFileExporter:
+    """
+    OTLP/JSON 文件导出器：每条trace一行 ExportTraceServiceRequest JSON，
+    由后台线程写文件，不阻塞事件循环；文件超过 max_bytes 时轮转为 .1 文件
+    """
+    def __init__(self, path: str, service_name: str, max_queue: int = 1000, max_bytes: int = 0):
+        self.path = path
+        self.service_name = service_name
+        self.max_bytes = max_bytes
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="otlp-file-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def export(self, spans: List[Span]) -> None:
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                break
+            payload = {
+                "resourceSpans": [{
+                    "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                    "scopeSpans": [{
+                        "scope": {"name": "app.core.tracing"},
+                        "spans": [span.to_otlp() for span in spans],
+                    }],
+                }]
+            }
+            try:
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            except OSError:
+                logger.exception("Error exporting trace")
+
+class Tracer:
+    """
+    轻量的链路追踪器：按trace收集span，本地根span结束时整体导出；
+    根span结束后才结束的子span（如提前退出时仍在运行的预取任务）单独导出
+    """
+    def __init__(self):
+        self.exporter: Optional[OTLPJsonFileExporter] = None
+        self._pending: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        开启一个子span（无父span时开启新trace）
+        :param name: span名称
+        :param attributes: span属性
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        span = Span(name, trace_id, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_status(STATUS_ERROR, f"{type(e).__name__}: {e}")
+            span.add_event("exception", **{"exception.type": type(e).__name__, "exception.message": str(e)})
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        root = span
+        while root.parent is not None:
+            root = root.parent
+        with self._lock:
+            if root.exported:
+                spans = [span]
+            else:
+                spans = self._pending.setdefault(span.trace_id, [])
+                spans.append(span)
+                if span is not root:
+                    return
+                del self._pending[span.trace_id]
+                root.exported = True
+        self.exporter.export(spans)
+
+tracer = Tracer()
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes) -> None:
+        pass
+
+    def set_status(self, code: int, message: str = "") -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+def current_trace_id() -> Optional[str]:
+    """当前上下文所属的trace ID，用于日志关联"""
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+def setup_tracing() -> None:
+    """按配置启用OTLP/JSON文件导出"""
+    from app.core.config import settings
+    if not settings.TRACING_ENABLED or tracer.exporter is not None:
+        return
+    tracer.exporter = OTLPJsonFileExporter(settings.TRACE_EXPORT_PATH, settings.APP_NAME, max_bytes=settings.TRACE_EXPORT_MAX_MB * 1024 * 1024)
+    tracer.exporter.start()
+
+def shutdown_tracing() -> None:
+    """停止导出线程，写出剩余的trace"""
+    if tracer.exporter is None:
+        return
+    tracer.exporter.stop()
+    tracer.exporter = None
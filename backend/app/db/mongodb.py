@@ -0,0 +1,239 @@
+import re
+import random
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+from pymongo import ASCENDING, DeleteMany, IndexModel, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from app.core.config import settings
+from app.db.repository import COLLECTIONS, Filters, Repository, Sort, WriteOp
+from app.db.sqlite import TABLE_VERSION_EPOCH, local_table_versions
+
+logger = logging.getLogger(__name__)
+
+# 各集合的索引，与SQLite中的索引及常用查询对应
+INDEXES = {
+    "rules": [IndexModel([("scene_id", ASCENDING), ("created_at", ASCENDING)])],
+    "rule_reference_materials": [
+        IndexModel([("rule_id", ASCENDING), ("position", ASCENDING)], unique=True),
+        IndexModel([("file_key", ASCENDING)]),
+    ],
+    "audit_items": [IndexModel([("rule_id", ASCENDING), ("created_at", ASCENDING)])],
+    "audit_tasks": [IndexModel([("scene_id", ASCENDING)]), IndexModel([("created_at", ASCENDING)])],
+    "audit_results": [
+        IndexModel([("task_id", ASCENDING), ("created_at", ASCENDING)]),
+        IndexModel([("task_id", ASCENDING), ("file_name", ASCENDING), ("audit_item_id", ASCENDING)]),
+        IndexModel([("rule_id", ASCENDING)]),
+        IndexModel([("audit_item_id", ASCENDING)]),
+        IndexModel([("content_hash", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING)]),
+    ],
+}
+
+# 没有业务主键 _id 的集合，读取时不返回MongoDB生成的 _id
+KEYLESS_COLLECTIONS = {"rule_reference_materials"}
+
+# 集合变更计数器所在的集合，ETag使用
+VERSIONS_COLLECTION = "table_versions"
+
+def _query(filters: Optional[Filters]) -> dict:
+    """将查询条件转换为MongoDB查询，list/tuple/set 转换为 $in"""
+    return {
+        field: {"$in": list(value)} if isinstance(value, (list, tuple, set)) else value
+        for field, value in (filters or {}).items()
+    }
+
+def _projection(collection: str, fields: Optional[Sequence[str]]) -> Optional[dict]:
+    if fields:
+        projection = {field: 1 for field in fields}
+        if "_id" not in fields:
+            projection["_id"] = 0
+        return projection
+    return {"_id": 0} if collection in KEYLESS_COLLECTIONS else None
+
+class MongoRepository(Repository):
+    """
+    基于MongoDB（motor异步驱动）的存储实现，多个API节点可共用同一个数据库。
+    批量写入使用 bulk_write，流式读取使用游标分批获取；每次写入后递增集合的变更计数器，ETag在各节点间一致
+    """
+    name = "mongodb"
+
+    def __init__(self, client=None, db_name: Optional[str] = None):
+        """
+        :param client: 已创建的 AsyncIOMotorClient 或兼容对象（如 mongomock_motor.AsyncMongoMockClient），默认按 MONGODB_URL 创建
+        :param db_name: 数据库名，默认 MONGODB_DB_NAME
+        """
+        self._client = client
+        self._owns_client = client is None
+        self._db_name = db_name or settings.MONGODB_DB_NAME
+        self.db = None
+
+    async def init(self):
+        if self._client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self._client = AsyncIOMotorClient(settings.MONGODB_URL, tz_aware=False)
+        self.db = self._client[self._db_name]
+        for collection, indexes in INDEXES.items():
+            await self.db[collection].create_indexes(indexes)
+        # 数据库实例标识，数据库重建后ETag不会与旧库重复
+        await self.db[VERSIONS_COLLECTION].update_one(
+            {"_id": TABLE_VERSION_EPOCH}, {"$setOnInsert": {"version": random.getrandbits(62)}}, upsert=True
+        )
+        logger.info("MongoDB存储初始化完成: %s", self._db_name)
+
+    async def close(self):
+        if self._client is not None and self._owns_client:
+            self._client.close()
+        self._client = None
+        self.db = None
+
+    async def _bump(self, collections: Iterable[str]):
+        """递增集合的变更计数器"""
+        for collection in set(collections):
+            await self.db[VERSIONS_COLLECTION].update_one({"_id": collection}, {"$inc": {"version": 1}}, upsert=True)
+
+    async def find(self, collection: str, filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                   sort: Optional[Sort] = None, limit: Optional[int] = None) -> List[dict]:
+        cursor = self.db[collection].find(_query(filters), _projection(collection, fields))
+        if sort:
+            cursor = cursor.sort(list(sort))
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def stream(self, collection: str, filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                     sort: Optional[Sort] = None, batch_size: int = 500) -> AsyncIterator[dict]:
+        cursor = self.db[collection].find(_query(filters), _projection(collection, fields), batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort(list(sort))
+        async for document in cursor:
+            yield document
+
+    async def count(self, collection: str, filters: Optional[Filters] = None) -> int:
+        return await self.db[collection].count_documents(_query(filters))
+
+    async def count_by(self, collection: str, field: str, filters: Optional[Filters] = None,
+                       created_from: Optional[str] = None, created_before: Optional[str] = None) -> Dict[Any, int]:
+        match = _query(filters)
+        created = {}
+        if created_from:
+            created["$gte"] = created_from
+        if created_before:
+            created["$lt"] = created_before
+        if created:
+            match["created_at"] = created
+        pipeline = [{"$match": match}, {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+        return {group["_id"]: group["count"] async for group in self.db[collection].aggregate(pipeline)}
+
+    async def find_matching(self, collection: str, columns: Sequence[str], terms: Sequence[str],
+                            filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                            sort: Optional[Sort] = None, limit: Optional[int] = None, offset: int = 0) -> List[dict]:
+        # 文本索引不能对中文分词，按转义后的正则做不区分大小写的子串匹配
+        match = _query(filters)
+        if terms:
+            match["$and"] = [
+                {"$or": [{column: {"$regex": re.escape(term), "$options": "i"}} for column in columns]}
+                for term in terms
+            ]
+        cursor = self.db[collection].find(match, _projection(collection, fields))
+        if sort:
+            cursor = cursor.sort(list(sort))
+        if offset:
+            cursor = cursor.skip(offset)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def insert_many(self, collection: str, documents: List[dict]) -> int:
+        if not documents:
+            return 0
+        # insert_many 会为文档补充 _id，传入副本以免修改调用方的字典
+        result = await self.db[collection].insert_many([dict(document) for document in documents], ordered=True)
+        await self._bump([collection])
+        return len(result.inserted_ids)
+
+    async def insert_missing(self, collection: str, documents: List[dict]) -> int:
+        if not documents:
+            return 0
+        # 按 _id upsert，只在文档不存在时写入，并发节点同时保存同一内容也不会冲突
+        result = await self.db[collection].bulk_write(
+            [
+                UpdateOne({"_id": document["_id"]}, {"$setOnInsert": {k: v for k, v in document.items() if k != "_id"}}, upsert=True)
+                for document in documents
+            ],
+            ordered=False
+        )
+        if result.upserted_count:
+            await self._bump([collection])
+        return result.upserted_count
+
+    async def upsert_many(self, collection: str, documents: List[dict]) -> int:
+        if not documents:
+            return 0
+        requests = []
+        for document in documents:
+            values = {k: v for k, v in document.items() if k not in ("_id", "created_at")}
+            update = {"$set": values}
+            if "created_at" in document:
+                update["$setOnInsert"] = {"created_at": document["created_at"]}
+            requests.append(UpdateOne({"_id": document["_id"]}, update, upsert=True))
+        await self.db[collection].bulk_write(requests, ordered=True)
+        await self._bump([collection])
+        return len(requests)
+
+    async def update_one(self, collection: str, filters: Filters, values: dict) -> Optional[dict]:
+        document = await self.db[collection].find_one_and_update(
+            _query(filters), {"$set": values},
+            projection=_projection(collection, None), return_document=ReturnDocument.AFTER
+        )
+        if document is not None:
+            await self._bump([collection])
+        return document
+
+    async def update_many(self, collection: str, filters: Filters, values: dict) -> int:
+        result = await self.db[collection].update_many(_query(filters), {"$set": values})
+        if result.matched_count:
+            await self._bump([collection])
+        return result.matched_count
+
+    async def increment(self, collection: str, filters: Filters, field: str, amount: int) -> int:
+        result = await self.db[collection].update_many(_query(filters), {"$inc": {field: amount}})
+        if result.matched_count:
+            await self._bump([collection])
+        return result.matched_count
+
+    async def delete_many(self, collection: str, filters: Filters) -> int:
+        result = await self.db[collection].delete_many(_query(filters))
+        if result.deleted_count:
+            await self._bump([collection])
+        return result.deleted_count
+
+    async def bulk_write(self, operations: Iterable[WriteOp]):
+        # 连续的同集合操作合并为一次有序的 bulk_write
+        groups: List[tuple] = []
+        for operation in operations:
+            if operation.kind == "insert":
+                request = InsertOne(dict(operation.document))
+            elif operation.kind == "update":
+                request = UpdateMany(_query(operation.filters), {"$set": operation.document})
+            elif operation.kind == "delete":
+                request = DeleteMany(_query(operation.filters))
+            else:
+                raise ValueError(f"未知的写操作: {operation.kind}")
+            if groups and groups[-1][0] == operation.collection:
+                groups[-1][1].append(request)
+            else:
+                groups.append((operation.collection, [request]))
+        for collection, requests in groups:
+            await self.db[collection].bulk_write(requests, ordered=True)
+        await self._bump(collection for collection, _ in groups)
+
+    async def table_versions(self, tables: Iterable[str]) -> Dict[str, int]:
+        tables = set(tables)
+        shared = sorted((tables & set(COLLECTIONS)) | {TABLE_VERSION_EPOCH})
+        versions = dict.fromkeys(shared, 0)
+        async for document in self.db[VERSIONS_COLLECTION].find({"_id": {"$in": shared}}):
+            versions[document["_id"]] = document["version"]
+        # 知识库等节点本地的表仍由本地SQLite的触发器计数
+        local = tables - set(COLLECTIONS)
+        if local:
+            versions.update({f"local:{name}": version for name, version in (await local_table_versions(local)).items()})
+        return versions
@@ -0,0 +1,194 @@
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ("sqlite", "mongodb")
+
+# 业务数据集合（表），由存储后端统一管理；其余表（OCR/图片缓存、知识库索引等）是各节点本地的，始终使用SQLite
+COLLECTIONS = ("business_scenes", "rules", "rule_reference_materials", "audit_items", "audit_tasks", "audit_results", "contents")
+
+# 查询条件：{字段: 值} 表示相等，值为 list/tuple/set 时表示 IN；排序：[(字段, 1 升序 / -1 降序)]
+Filters = Dict[str, Any]
+Sort = Sequence[Tuple[str, int]]
+
+class WriteOp:
+    """bulk_write 中的一个写操作"""
+    __slots__ = ("kind", "collection", "filters", "document")
+
+    def __init__(self, kind: str, collection: str, filters: Optional[Filters] = None, document: Optional[dict] = None):
+        self.kind = kind
+        self.collection = collection
+        self.filters = filters or {}
+        self.document = document
+
+    @classmethod
+    def insert(cls, collection: str, document: dict) -> "WriteOp":
+        return cls("insert", collection, document=document)
+
+    @classmethod
+    def update(cls, collection: str, filters: Filters, values: dict) -> "WriteOp":
+        return cls("update", collection, filters, values)
+
+    @classmethod
+    def delete(cls, collection: str, filters: Filters) -> "WriteOp":
+        return cls("delete", collection, filters)
+
+class Repository:
+    """
+    业务数据的存储接口，以文档（字典）的形式读写 COLLECTIONS 中的集合，文档的 _id 为字符串。
+    SQLiteRepository 使用本地数据库文件，MongoRepository 使用 motor 连接共享的 MongoDB，多个API节点可共用同一份数据
+    """
+    name = ""
+
+    async def init(self):
+        """建立连接并创建索引"""
+
+    async def close(self):
+        """关闭连接"""
+
+    async def find(self, collection: str, filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                   sort: Optional[Sort] = None, limit: Optional[int] = None) -> List[dict]:
+        """
+        查询文档
+        :param collection: 集合名
+        :param filters: 查询条件
+        :param fields: 返回的字段，默认全部
+        :param sort: 排序
+        :param limit: 最多返回的文档数
+        :return: 文档列表
+        """
+        raise NotImplementedError
+
+    async def find_one(self, collection: str, filters: Filters, fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        """查询一个文档，不存在时返回None"""
+        documents = await self.find(collection, filters, fields, limit=1)
+        return documents[0] if documents else None
+
+    def stream(self, collection: str, filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+               sort: Optional[Sort] = None, batch_size: int = 500) -> AsyncIterator[dict]:
+        """
+        按批读取并逐个返回文档，大结果集不会一次加载到内存
+        :param batch_size: 每批读取的文档数
+        :return: 文档的异步迭代器
+        """
+        raise NotImplementedError
+
+    async def count(self, collection: str, filters: Optional[Filters] = None) -> int:
+        """统计文档数"""
+        raise NotImplementedError
+
+    async def count_by(self, collection: str, field: str, filters: Optional[Filters] = None,
+                       created_from: Optional[str] = None, created_before: Optional[str] = None) -> Dict[Any, int]:
+        """
+        按字段值分组统计文档数
+        :param field: 分组字段
+        :param filters: 查询条件
+        :param created_from: created_at 不早于该值（含）
+        :param created_before: created_at 早于该值（不含）
+        :return: 字段值 -> 文档数
+        """
+        raise NotImplementedError
+
+    async def find_matching(self, collection: str, columns: Sequence[str], terms: Sequence[str],
+                            filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                            sort: Optional[Sort] = None, limit: Optional[int] = None, offset: int = 0) -> List[dict]:
+        """
+        子串检索：每个词（不区分大小写）至少出现在 columns 的一个字段中
+        :param columns: 参与匹配的字段
+        :param terms: 查询词，需全部命中
+        :param offset: 跳过的文档数
+        :return: 文档列表
+        """
+        raise NotImplementedError
+
+    async def insert_one(self, collection: str, document: dict):
+        """插入一个文档"""
+        await self.insert_many(collection, [document])
+
+    async def insert_many(self, collection: str, documents: List[dict]) -> int:
+        """批量插入文档，返回插入数"""
+        raise NotImplementedError
+
+    async def insert_missing(self, collection: str, documents: List[dict]) -> int:
+        """插入 _id 尚不存在的文档，已存在的忽略（用于按内容哈希去重保存），返回实际插入数"""
+        raise NotImplementedError
+
+    async def upsert_many(self, collection: str, documents: List[dict]) -> int:
+        """按 _id 插入或更新文档，已存在的文档保留原 created_at，返回写入数"""
+        raise NotImplementedError
+
+    async def update_one(self, collection: str, filters: Filters, values: dict) -> Optional[dict]:
+        """
+        更新一个文档并返回更新后的文档
+        :return: 更新后的文档，没有匹配的文档时返回None
+        """
+        raise NotImplementedError
+
+    async def update_many(self, collection: str, filters: Filters, values: dict) -> int:
+        """更新所有匹配的文档，返回匹配数"""
+        raise NotImplementedError
+
+    async def increment(self, collection: str, filters: Filters, field: str, amount: int) -> int:
+        """对匹配文档的数值字段做原子增量，返回匹配数"""
+        raise NotImplementedError
+
+    async def delete_many(self, collection: str, filters: Filters) -> int:
+        """删除所有匹配的文档，返回删除数"""
+        raise NotImplementedError
+
+    async def bulk_write(self, operations: Iterable[WriteOp]):
+        """
+        按顺序批量执行写操作。SQLite在一个事务中执行；MongoDB将连续的同集合操作合并为一次 bulk_write，
+        不同集合之间不保证原子性
+        :param operations: 写操作
+        """
+        raise NotImplementedError
+
+    async def table_versions(self, tables: Iterable[str]) -> Dict[str, int]:
+        """
+        读取各集合的变更计数器，用于生成列表接口的ETag
+        :param tables: 集合（表）名
+        :return: 名称 -> 版本号，从未变更过的为0
+        """
+        raise NotImplementedError
+
+_repository: Optional[Repository] = None
+
+def get_repository() -> Repository:
+    """按 STORAGE_BACKEND 配置创建（首次调用时）并返回存储实现"""
+    global _repository
+    if _repository is None:
+        backend = settings.STORAGE_BACKEND.lower()
+        if backend == "sqlite":
+            from app.db.sqlite import SQLiteRepository
+            _repository = SQLiteRepository()
+        elif backend == "mongodb":
+            from app.db.mongodb import MongoRepository
+            _repository = MongoRepository()
+        else:
+            raise ValueError(f"未知的存储后端: {settings.STORAGE_BACKEND}，可选值: {', '.join(STORAGE_BACKENDS)}")
+    return _repository
+
+async def init_repository(repository: Optional[Repository] = None):
+    """
+    初始化存储，在应用启动时调用
+    :param repository: 指定的存储实现（例如测试中使用 mongomock 客户端的 MongoRepository），默认按配置创建
+    """
+    global _repository
+    if repository is not None:
+        _repository = repository
+    await get_repository().init()
+    logger.info("存储后端: %s", get_repository().name)
+
+async def close_repository():
+    """关闭存储连接"""
+    global _repository
+    if _repository is not None:
+        await _repository.close()
+        _repository = None
+
+def using_sqlite() -> bool:
+    """业务数据是否保存在本地SQLite中"""
+    return get_repository().name == "sqlite"
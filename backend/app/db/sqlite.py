@@ -1,21 +1,322 @@
+import os
 import sqlite3
 from sqlite3 import Connection, Cursor
 import json
+import re
+import time
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+from urllib.request import pathname2url
+import logging
+from app.core.config import settings
+from app.core.metrics import db_statement_duration_seconds, db_lock_wait_seconds, db_lock_errors_total
+from app.db.repository import Filters, Repository, Sort, WriteOp
+
+logger = logging.getLogger(__name__)
 
 # SQLite 数据库连接
 conn: Connection = None
 
+# 写事务互斥锁：同一连接上的事务必须串行，等待时间计入 db_lock_wait_seconds。
+# 线程中的写操作直接等待该锁；事件循环中的写操作先在所属事件循环的 asyncio.Lock 上排队，
+# 再在线程池中等待该锁，线程持有写锁期间不会阻塞事件循环
+_write_lock = threading.Lock()
+_loop_write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+def _statement_table(sql: str) -> str:
+    """从SQL语句中提取主表名，作为指标标签"""
+    match = _TABLE_PATTERN.search(sql)
+    return match.group(1) if match else "unknown"
+
+@contextmanager
+def _timed(operation: str, table: str):
+    """记录单条语句耗时，并统计database is locked错误"""
+    start = time.perf_counter()
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if "locked" in str(e):
+            db_lock_errors_total.inc(operation=operation)
+        raise
+    finally:
+        db_statement_duration_seconds.observe(time.perf_counter() - start, operation=operation, table=table)
+
+@contextmanager
+def _write_locked(operation: str):
+    """获取写锁并记录等待耗时"""
+    start = time.perf_counter()
+    _write_lock.acquire()
+    db_lock_wait_seconds.observe(time.perf_counter() - start, operation=operation)
+    try:
+        yield
+    finally:
+        _write_lock.release()
+
+async def _acquire_write_lock():
+    """在线程池中等待写锁，等待期间不阻塞事件循环；等待中被取消时，获取到锁后立即释放"""
+    if _write_lock.acquire(blocking=False):
+        return
+    future = asyncio.get_running_loop().run_in_executor(None, _write_lock.acquire)
+    try:
+        await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda _: _write_lock.release())
+        raise
+
+@asynccontextmanager
+async def _write_locked_async(operation: str):
+    """在事件循环中获取写锁并记录等待耗时"""
+    loop = asyncio.get_running_loop()
+    loop_lock = _loop_write_locks.get(loop)
+    if loop_lock is None:
+        loop_lock = _loop_write_locks[loop] = asyncio.Lock()
+    start = time.perf_counter()
+    async with loop_lock:
+        await _acquire_write_lock()
+        db_lock_wait_seconds.observe(time.perf_counter() - start, operation=operation)
+        try:
+            yield
+        finally:
+            _write_lock.release()
+
+def _counter_upsert(scope: str, scope_id: str, day: str, metric: str, delta: int) -> str:
+    """生成统计计数器的增量UPSERT语句（用于触发器内）"""
+    return f"""
+        INSERT INTO audit_stat_counters (scope, scope_id, day, metric, value)
+        VALUES ('{scope}', COALESCE({scope_id}, ''), substr({day}, 1, 10), {metric}, {delta})
+        ON CONFLICT(scope, scope_id, day, metric) DO UPDATE SET value = value + excluded.value;"""
+
+def _task_counter_statements(row: str, delta: int) -> str:
+    metric = f"'task:' || {row}.status"
+    return (_counter_upsert("all", "''", f"{row}.created_at", metric, delta)
+            + _counter_upsert("scene", f"{row}.scene_id", f"{row}.created_at", metric, delta))
+
+def _result_counter_statements(row: str, delta: int) -> str:
+    metric = f"'result:' || {row}.result"
+    scene_id = f"(SELECT scene_id FROM audit_tasks WHERE _id = {row}.task_id)"
+    return (_counter_upsert("all", "''", f"{row}.created_at", metric, delta)
+            + _counter_upsert("scene", scene_id, f"{row}.created_at", metric, delta)
+            + _counter_upsert("rule", f"{row}.rule_id", f"{row}.created_at", metric, delta))
+
+def _task_not_archived(row: str) -> str:
+    return f"(SELECT archived_at FROM audit_tasks WHERE _id = {row}.task_id) IS NULL"
+
+def _create_stat_counters(cursor: Cursor):
+    """
+    创建按 维度/日期/指标 预聚合的统计计数器表，由触发器在任务状态变化与结果写入时增量维护，
+    统计接口只读取计数器而不扫描明细表
+    """
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audit_stat_counters'").fetchone()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS audit_stat_counters (
+        scope TEXT NOT NULL,
+        scope_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        value INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, scope_id, day, metric)
+    ) WITHOUT ROWID
+    ''')
+    
+    triggers = {
+        "trg_audit_tasks_stats_insert": ("AFTER INSERT ON audit_tasks", _task_counter_statements("NEW", 1)),
+        "trg_audit_tasks_stats_status": (
+            "AFTER UPDATE OF status ON audit_tasks WHEN OLD.status IS NOT NEW.status",
+            _task_counter_statements("OLD", -1) + _task_counter_statements("NEW", 1)
+        ),
+        "trg_audit_tasks_stats_delete": ("AFTER DELETE ON audit_tasks", _task_counter_statements("OLD", -1)),
+        # 已归档任务的结果移出/恢复时不改变计数器（统计仍包含归档的结果）
+        "trg_audit_results_stats_insert": (
+            f"AFTER INSERT ON audit_results WHEN {_task_not_archived('NEW')}", _result_counter_statements("NEW", 1)
+        ),
+        "trg_audit_results_stats_result": (
+            "AFTER UPDATE OF result ON audit_results WHEN OLD.result IS NOT NEW.result",
+            _result_counter_statements("OLD", -1) + _result_counter_statements("NEW", 1)
+        ),
+        "trg_audit_results_stats_delete": (
+            f"AFTER DELETE ON audit_results WHEN {_task_not_archived('OLD')}", _result_counter_statements("OLD", -1)
+        ),
+    }
+    # 触发器条件可能随版本变化，每次启动时重建
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+    
+    # 首次创建时根据已有数据回填
+    if not exists:
+        rebuild_stat_counters(cursor)
+
+def rebuild_stat_counters(cursor: Cursor):
+    """根据明细表全量重建统计计数器（已归档任务的结果不在明细表中，重建后不再计入）"""
+    cursor.execute("DELETE FROM audit_stat_counters")
+    cursor.execute('''
+    INSERT INTO audit_stat_counters (scope, scope_id, day, metric, value)
+    SELECT 'all', '', substr(created_at, 1, 10), 'task:' || status, COUNT(*) FROM audit_tasks GROUP BY 3, 4
+    UNION ALL
+    SELECT 'scene', scene_id, substr(created_at, 1, 10), 'task:' || status, COUNT(*) FROM audit_tasks GROUP BY 2, 3, 4
+    UNION ALL
+    SELECT 'all', '', substr(r.created_at, 1, 10), 'result:' || r.result, COUNT(*) FROM audit_results r GROUP BY 3, 4
+    UNION ALL
+    SELECT 'scene', COALESCE(t.scene_id, ''), substr(r.created_at, 1, 10), 'result:' || r.result, COUNT(*)
+    FROM audit_results r LEFT JOIN audit_tasks t ON t._id = r.task_id GROUP BY 2, 3, 4
+    UNION ALL
+    SELECT 'rule', r.rule_id, substr(r.created_at, 1, 10), 'result:' || r.result, COUNT(*) FROM audit_results r GROUP BY 2, 3, 4
+    ''')
+
+def _create_fingerprints(cursor: Cursor):
+    """
+    创建审核内容指纹表（精确哈希 + MinHash签名）与LSH分段表，用于查找可复用结论的重复/近似内容；
+    审核结果删除时由触发器删除对应指纹
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS audit_fingerprints (
+        result_id TEXT PRIMARY KEY,
+        audit_key TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        signature BLOB NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS audit_fingerprint_bands (
+        band_key TEXT NOT NULL,
+        result_id TEXT NOT NULL,
+        PRIMARY KEY (band_key, result_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_fingerprints_key_hash ON audit_fingerprints(audit_key, content_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_fingerprint_bands_result_id ON audit_fingerprint_bands(result_id)")
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_audit_results_fingerprints_delete AFTER DELETE ON audit_results BEGIN "
+        "DELETE FROM audit_fingerprint_bands WHERE result_id = OLD._id; "
+        "DELETE FROM audit_fingerprints WHERE result_id = OLD._id; END"
+    )
+
+# table_versions 中记录数据库实例标识的行
+TABLE_VERSION_EPOCH = "*epoch*"
+
+# 列表接口ETag所依赖的表，增删改时由触发器递增各自的版本号
+VERSIONED_TABLES = (
+    "business_scenes", "rules", "rule_reference_materials", "audit_items",
+    "audit_tasks", "audit_results", "kb_documents"
+)
+
+def _create_table_versions(cursor: Cursor):
+    """创建表级变更计数器及其触发器，并写入数据库实例标识（ETag中使用，数据库重建后ETag不会与旧库重复）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, abs(random()))", (TABLE_VERSION_EPOCH,))
+    for table in VERSIONED_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table} BEGIN "
+                f"INSERT INTO table_versions (table_name, version) VALUES ('{table}', 1) "
+                f"ON CONFLICT(table_name) DO UPDATE SET version = version + 1; END"
+            )
+
+# 全文检索的表及其被索引的列
+SEARCH_INDEXES = {
+    "rules": ("name", "description"),
+    "audit_items": ("name", "criteria"),
+    "audit_results": ("reason",),
+}
+
+def _create_search_index(cursor: Cursor):
+    """
+    为规则、审核项与审核结果创建FTS5全文索引（外部内容表，trigram分词以支持中文子串匹配），
+    由触发器随原表的增删改同步；首次创建时为已有数据建立索引
+    """
+    for table, columns in SEARCH_INDEXES.items():
+        fts = f"{table}_fts"
+        names = ", ".join(columns)
+        new_values = ", ".join(f"NEW.{column}" for column in columns)
+        old_values = ", ".join(f"OLD.{column}" for column in columns)
+        try:
+            exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone()
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', content_rowid='rowid', tokenize='trigram')"
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning("当前SQLite不支持FTS5 trigram分词，全文检索不可用: %s", e)
+            return
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts} (rowid, {names}) VALUES (NEW.rowid, {new_values}); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.rowid, {old_values}); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_update AFTER UPDATE OF {names} ON {table} BEGIN "
+            f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.rowid, {old_values}); "
+            f"INSERT INTO {fts} (rowid, {names}) VALUES (NEW.rowid, {new_values}); END"
+        )
+        if not exists:
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def rebuild_search_index(cursor: Cursor):
+    """按原表重建全文索引（VACUUM 可能改变rowid，执行后需重建）"""
+    for table in SEARCH_INDEXES:
+        cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+def _ensure_column(cursor: Cursor, table: str, column: str, definition: str):
+    """为已存在的旧表补充新增列"""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _migrate_result_contents(cursor: Cursor, batch_size: int = 1000):
+    """把旧版本直接保存在审核结果行中的内容迁移到 contents 表（相同内容只保存一份）"""
+    from app.services.content_service import content_hash, encode_content
+    migrated = 0
+    while True:
+        rows = cursor.execute(
+            "SELECT _id, content FROM audit_results WHERE content_hash IS NULL AND content != '' LIMIT ?", (batch_size,)
+        ).fetchall()
+        if not rows:
+            break
+        now = datetime.utcnow().isoformat()
+        contents, references = {}, []
+        for result_id, content in rows:
+            key = content_hash(content)
+            if key not in contents:
+                contents[key] = (key, *encode_content(content), len(content), now)
+            references.append((key, result_id))
+        cursor.execute("BEGIN TRANSACTION")
+        cursor.executemany("INSERT OR IGNORE INTO contents (_id, encoding, body, size, created_at) VALUES (?, ?, ?, ?, ?)", list(contents.values()))
+        cursor.executemany("UPDATE audit_results SET content_hash = ?, content = '' WHERE _id = ?", references)
+        cursor.execute("COMMIT")
+        migrated += len(rows)
+    if migrated:
+        logger.info("已将 %d 条审核结果的内容迁移到contents表，可执行VACUUM回收空间（之后需调用 POST /api/search/rebuild 重建全文索引）", migrated)
+
 # 初始化数据库
 async def init_sqlite_db():
     """初始化SQLite数据库"""
     global conn
     # 创建连接
-    conn = sqlite3.connect('ai_reviewer.db', check_same_thread=False)
+    conn = sqlite3.connect(settings.SQLITE_DB_PATH, check_same_thread=False)
     
     # 启用外键约束
     conn.execute("PRAGMA foreign_keys = ON")
     
+    # 其他连接持有锁时等待而不是立即报错
+    conn.execute("PRAGMA busy_timeout = 5000")
+    
+    # WAL模式下读连接不阻塞写入，导出等长时间读取不会卡住审核任务
+    conn.execute("PRAGMA journal_mode = WAL")
+    
     # 开启事务模式
     conn.isolation_level = None
     
@@ -46,6 +347,19 @@ async def init_sqlite_db():
     )
     ''')
     
+    # 规则参考材料关联表，file_key 为上传目录中的文件名
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rule_reference_materials (
+        rule_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        file_path TEXT NOT NULL,
+        file_key TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (rule_id, position),
+        FOREIGN KEY (rule_id) REFERENCES rules(_id)
+    )
+    ''')
+    
     # 创建审核项表
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS audit_items (
@@ -54,11 +368,13 @@ async def init_sqlite_db():
         rule_id TEXT NOT NULL,
         type TEXT NOT NULL,
         criteria TEXT NOT NULL,
+        confidence_threshold REAL,
         created_at TEXT NOT NULL,
         updated_at TEXT NOT NULL,
         FOREIGN KEY (rule_id) REFERENCES rules(_id)
     )
     ''')
+    _ensure_column(cursor, "audit_items", "confidence_threshold", "REAL")
     
     # 创建审核任务表
     cursor.execute('''
@@ -70,9 +386,27 @@ async def init_sqlite_db():
         status TEXT NOT NULL,
         created_at TEXT NOT NULL,
         updated_at TEXT NOT NULL,
-        completed_at TEXT
+        completed_at TEXT,
+        files TEXT NOT NULL DEFAULT '[]',
+        token_budget INTEGER,
+        budget_action TEXT,
+        tokens_used INTEGER NOT NULL DEFAULT 0,
+        archived_at TEXT,
+        batch_status TEXT,
+        batch TEXT,
+        batch_claim TEXT,
+        archive_claim TEXT
     )
     ''')
+    _ensure_column(cursor, "audit_tasks", "files", "TEXT NOT NULL DEFAULT '[]'")
+    _ensure_column(cursor, "audit_tasks", "token_budget", "INTEGER")
+    _ensure_column(cursor, "audit_tasks", "budget_action", "TEXT")
+    _ensure_column(cursor, "audit_tasks", "tokens_used", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(cursor, "audit_tasks", "archived_at", "TEXT")
+    _ensure_column(cursor, "audit_tasks", "batch_status", "TEXT")
+    _ensure_column(cursor, "audit_tasks", "batch", "TEXT")
+    _ensure_column(cursor, "audit_tasks", "batch_claim", "TEXT")
+    _ensure_column(cursor, "audit_tasks", "archive_claim", "TEXT")
     
     # 创建审核结果表
     cursor.execute('''
@@ -81,18 +415,41 @@ async def init_sqlite_db():
         task_id TEXT NOT NULL,
         rule_id TEXT NOT NULL,
         audit_item_id TEXT NOT NULL,
-        content TEXT NOT NULL,
+        content TEXT NOT NULL DEFAULT '',
         result TEXT NOT NULL,
         reason TEXT,
         ai_generated BOOLEAN NOT NULL DEFAULT 0,
         edited_by TEXT,
         created_at TEXT NOT NULL,
         updated_at TEXT NOT NULL,
+        file_name TEXT,
+        estimated_tokens INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        reused_from TEXT,
+        content_hash TEXT,
         FOREIGN KEY (task_id) REFERENCES audit_tasks(_id),
         FOREIGN KEY (rule_id) REFERENCES rules(_id),
         FOREIGN KEY (audit_item_id) REFERENCES audit_items(_id)
     )
     ''')
+    _ensure_column(cursor, "audit_results", "file_name", "TEXT")
+    _ensure_column(cursor, "audit_results", "estimated_tokens", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(cursor, "audit_results", "prompt_tokens", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(cursor, "audit_results", "completion_tokens", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(cursor, "audit_results", "reused_from", "TEXT")
+    _ensure_column(cursor, "audit_results", "content_hash", "TEXT")
+    
+    # 审核内容按内容哈希只保存一份（压缩），审核结果通过 content_hash 引用
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS contents (
+        _id TEXT PRIMARY KEY,
+        encoding TEXT NOT NULL,
+        body BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    ''')
     
     # 创建版式模板表
     cursor.execute('''
@@ -105,13 +462,73 @@ async def init_sqlite_db():
     )
     ''')
     
+    # 知识库文件与片段，片段 _id 即向量矩阵中的行号
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS kb_documents (
+        file_key TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        chunks INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS kb_chunks (
+        _id INTEGER PRIMARY KEY,
+        file_key TEXT NOT NULL,
+        chunk_index INTEGER NOT NULL,
+        text TEXT NOT NULL
+    )
+    ''')
+    
+    # 扫描页OCR结果缓存，按文件内容哈希与OCR参数区分
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ocr_page_cache (
+        file_hash TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        settings_key TEXT NOT NULL,
+        text TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (file_hash, page, settings_key)
+    ) WITHOUT ROWID
+    ''')
+    
+    # 常用查询索引
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rules_scene_id ON rules(scene_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_items_rule_id ON audit_items(rule_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_tasks_scene_id ON audit_tasks(scene_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_results_task_id ON audit_results(task_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_results_content_hash ON audit_results(content_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_kb_chunks_file_key ON kb_chunks(file_key)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rule_reference_materials_file_key ON rule_reference_materials(file_key)")
+    
+    # 统计预聚合
+    _create_stat_counters(cursor)
+    
+    # 重复内容的审核结论复用
+    _create_fingerprints(cursor)
+    
+    # 列表接口ETag使用的表级变更计数器
+    _create_table_versions(cursor)
+
+    # 规则、审核项与审核结果的全文检索
+    _create_search_index(cursor)
+
+    # 不再被任何审核结果引用的内容随最后一条结果删除
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_audit_results_contents_delete AFTER DELETE ON audit_results "
+        "WHEN OLD.content_hash IS NOT NULL AND NOT EXISTS (SELECT 1 FROM audit_results WHERE content_hash = OLD.content_hash) "
+        "BEGIN DELETE FROM contents WHERE _id = OLD.content_hash; END"
+    )
+    _migrate_result_contents(cursor)
+    
     # 提交事务
     conn.commit()
     
     # 关闭游标
     cursor.close()
     
-    print("SQLite数据库初始化完成")
+    logger.info("SQLite数据库初始化完成")
 
 # 关闭数据库连接
 async def close_sqlite_db():
@@ -120,7 +537,17 @@ async def close_sqlite_db():
     if conn:
         conn.close()
         conn = None
-        print("SQLite数据库连接已关闭")
+        logger.info("SQLite数据库连接已关闭")
+
+def connect_readonly() -> Connection:
+    """
+    打开独立的只读连接，供流式导出等长时间读取使用，不占用全局连接
+    :return: 只读连接，使用完毕后需调用方关闭
+    """
+    path = pathname2url(os.path.abspath(settings.SQLITE_DB_PATH))
+    read_conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    read_conn.execute("PRAGMA busy_timeout = 5000")
+    return read_conn
 
 # 获取数据库连接
 async def get_db():
@@ -135,8 +562,9 @@ async def query(query: str, params: tuple = ()):
     """执行查询并返回所有结果"""
     conn = await get_db()
     cursor = conn.cursor()
-    cursor.execute(query, params)
-    results = cursor.fetchall()
+    with _timed("select", _statement_table(query)):
+        cursor.execute(query, params)
+        results = cursor.fetchall()
     cursor.close()
     return results
 
@@ -146,17 +574,98 @@ async def execute(query: str, params: tuple = ()):
     conn = await get_db()
     cursor = conn.cursor()
     
-    try:
+    async with _write_locked_async("execute"):
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+            with _timed("execute", _statement_table(query)):
+                cursor.execute(query, params)
+            affected_rows = cursor.rowcount
+            cursor.execute("COMMIT")
+            cursor.close()
+            return affected_rows
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            cursor.close()
+            raise e
+
+@contextmanager
+def transaction(operation: str = "transaction", connection: Optional[Connection] = None):
+    """
+    在一个事务中执行多条语句，出错时整体回滚。只能在线程中使用（会阻塞等待写锁），
+    事件循环中使用 async_transaction。共享连接上的未提交数据对同一连接上的其他读取可见，
+    耗时较长的事务（导入、重建索引）应使用 dedicated_transaction
+    :param operation: 指标中的操作名称
+    :param connection: 执行事务的连接，默认为共享连接
+    :return: 游标
+    """
+    connection = connection or conn
+    if connection is None:
+        raise RuntimeError("数据库未初始化")
+    with _write_locked(operation):
+        cursor = connection.cursor()
         cursor.execute("BEGIN TRANSACTION")
-        cursor.execute(query, params)
-        cursor.execute("COMMIT")
-        affected_rows = cursor.rowcount
-        cursor.close()
-        return affected_rows
-    except Exception as e:
-        cursor.execute("ROLLBACK")
-        cursor.close()
-        raise e
+        try:
+            yield cursor
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+@asynccontextmanager
+async def async_transaction(operation: str = "transaction"):
+    """
+    在事件循环中以一个事务执行多条语句，出错时整体回滚。等待写锁时不阻塞事件循环，
+    事务内只应执行短小的语句
+    :param operation: 指标中的操作名称
+    :return: 游标
+    """
+    if conn is None:
+        raise RuntimeError("数据库未初始化")
+    async with _write_locked_async(operation):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            yield cursor
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+def connect_writer() -> Connection:
+    """
+    打开独立的读写连接，配置与共享连接相同，供长事务使用，使用完毕后需调用方关闭
+    :return: 读写连接
+    """
+    write_conn = sqlite3.connect(settings.SQLITE_DB_PATH, check_same_thread=False)
+    write_conn.execute("PRAGMA foreign_keys = ON")
+    write_conn.execute("PRAGMA busy_timeout = 5000")
+    write_conn.isolation_level = None
+    return write_conn
+
+@contextmanager
+def dedicated_transaction(operation: str = "transaction"):
+    """
+    在独立连接上执行耗时较长的事务（只能在线程中使用）：提交前共享连接上的读取看不到其中的写入
+    （含表版本号），回滚的数据也不会被读到；持有写锁期间事件循环中的写操作异步排队
+    :param operation: 指标中的操作名称
+    :return: 游标
+    """
+    write_conn = connect_writer()
+    try:
+        with transaction(operation, write_conn) as cursor:
+            yield cursor
+    finally:
+        write_conn.close()
+
+def executemany(cursor: Cursor, query: str, rows: list):
+    """在事务游标上批量执行同一语句"""
+    with _timed("executemany", _statement_table(query)):
+        cursor.executemany(query, rows)
+    return cursor.rowcount
 
 # 通用插入函数
 async def insert(table: str, data: dict):
@@ -164,24 +673,26 @@ async def insert(table: str, data: dict):
     conn = await get_db()
     cursor = conn.cursor()
     
-    try:
-        cursor.execute("BEGIN TRANSACTION")
-        
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data.values()])
-        values = tuple(data.values())
-        
-        query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        cursor.execute(query, values)
-        
-        cursor.execute("COMMIT")
-        cursor.close()
-        
-        return cursor.lastrowid
-    except Exception as e:
-        cursor.execute("ROLLBACK")
-        cursor.close()
-        raise e
+    async with _write_locked_async("insert"):
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+            
+            columns = ', '.join(data.keys())
+            placeholders = ', '.join(['?' for _ in data.values()])
+            values = tuple(data.values())
+            
+            query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+            with _timed("insert", table):
+                cursor.execute(query, values)
+            
+            cursor.execute("COMMIT")
+            cursor.close()
+            
+            return cursor.lastrowid
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            cursor.close()
+            raise e
 
 # 通用更新函数
 async def update(table: str, data: dict, where: str, where_params: tuple = ()):
@@ -189,24 +700,53 @@ async def update(table: str, data: dict, where: str, where_params: tuple = ()):
     conn = await get_db()
     cursor = conn.cursor()
     
-    try:
-        cursor.execute("BEGIN TRANSACTION")
-        
-        set_clause = ', '.join([f"{col} = ?" for col in data.keys()])
-        values = tuple(data.values()) + where_params
-        
-        query = f"UPDATE {table} SET {set_clause} WHERE {where}"
-        cursor.execute(query, values)
-        
-        cursor.execute("COMMIT")
-        affected_rows = cursor.rowcount
-        cursor.close()
-        
-        return affected_rows
-    except Exception as e:
-        cursor.execute("ROLLBACK")
-        cursor.close()
-        raise e
+    async with _write_locked_async("update"):
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+            
+            set_clause = ', '.join([f"{col} = ?" for col in data.keys()])
+            values = tuple(data.values()) + where_params
+            
+            query = f"UPDATE {table} SET {set_clause} WHERE {where}"
+            with _timed("update", table):
+                cursor.execute(query, values)
+            affected_rows = cursor.rowcount
+            
+            cursor.execute("COMMIT")
+            cursor.close()
+            
+            return affected_rows
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            cursor.close()
+            raise e
+
+# 更新并返回更新后的行
+async def update_returning(table: str, data: dict, where: str, where_params: tuple = (), columns: str = "*"):
+    """更新数据并通过 RETURNING 返回更新后的行，无需再次查询"""
+    conn = await get_db()
+    cursor = conn.cursor()
+    
+    async with _write_locked_async("update"):
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+            
+            set_clause = ', '.join([f"{col} = ?" for col in data.keys()])
+            values = tuple(data.values()) + where_params
+            
+            query = f"UPDATE {table} SET {set_clause} WHERE {where} RETURNING {columns}"
+            with _timed("update", table):
+                cursor.execute(query, values)
+                rows = cursor.fetchall()
+            
+            cursor.execute("COMMIT")
+            cursor.close()
+            
+            return rows
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            cursor.close()
+            raise e
 
 # 通用删除函数
 async def delete(table: str, where: str, where_params: tuple = ()):
@@ -214,24 +754,237 @@ async def delete(table: str, where: str, where_params: tuple = ()):
     conn = await get_db()
     cursor = conn.cursor()
     
-    try:
-        # 启用外键约束
-        cursor.execute("PRAGMA foreign_keys = ON")
-        
-        # 开始事务
-        cursor.execute("BEGIN TRANSACTION")
-        
-        query = f"DELETE FROM {table} WHERE {where}"
-        cursor.execute(query, where_params)
-        affected_rows = cursor.rowcount
-        
-        # 提交事务
-        cursor.execute("COMMIT")
-        cursor.close()
-        
-        return affected_rows
-    except Exception as e:
-        # 回滚事务
-        cursor.execute("ROLLBACK")
-        cursor.close()
-        raise e
+    async with _write_locked_async("delete"):
+        try:
+            # 启用外键约束
+            cursor.execute("PRAGMA foreign_keys = ON")
+            
+            # 开始事务
+            cursor.execute("BEGIN TRANSACTION")
+            
+            query = f"DELETE FROM {table} WHERE {where}"
+            with _timed("delete", table):
+                cursor.execute(query, where_params)
+            affected_rows = cursor.rowcount
+            
+            # 提交事务
+            cursor.execute("COMMIT")
+            cursor.close()
+            
+            return affected_rows
+        except Exception as e:
+            # 回滚事务
+            cursor.execute("ROLLBACK")
+            cursor.close()
+            raise e
+
+async def local_table_versions(tables: Iterable[str]) -> Dict[str, int]:
+    """
+    读取本地数据库中各表的变更计数器（由触发器在增删改时递增），包含数据库实例标识
+    :param tables: 表名
+    :return: 表名 -> 版本号，从未变更过的表为0
+    """
+    names = sorted(set(tables) | {TABLE_VERSION_EPOCH})
+    rows = await query(
+        f"SELECT table_name, version FROM table_versions WHERE table_name IN ({', '.join('?' for _ in names)})",
+        tuple(names)
+    )
+    versions = dict.fromkeys(names, 0)
+    versions.update(rows)
+    return versions
+
+def _where(filters: Optional[Filters]) -> tuple:
+    """将查询条件转换为 WHERE 子句与参数"""
+    clauses, params = [], []
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            value = list(value)
+            if not value:
+                clauses.append("0")
+                continue
+            clauses.append(f"{column} IN ({', '.join('?' for _ in value)})")
+            params.extend(value)
+        elif value is None:
+            clauses.append(f"{column} IS NULL")
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+def _select_sql(collection: str, filters: Optional[Filters], fields: Optional[Sequence[str]], sort: Optional[Sort], limit: Optional[int]) -> tuple:
+    where, params = _where(filters)
+    sql = f"SELECT {', '.join(fields) if fields else '*'} FROM {collection}{where}"
+    if sort:
+        sql += " ORDER BY " + ", ".join(f"{column} {'DESC' if direction < 0 else 'ASC'}" for column, direction in sort)
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+def _rows_to_dicts(cursor: Cursor, rows: list) -> List[dict]:
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+def _execute_write(cursor: Cursor, operation: WriteOp) -> int:
+    """在事务游标上执行一个写操作"""
+    if operation.kind == "insert":
+        document = operation.document
+        with _timed("insert", operation.collection):
+            cursor.execute(
+                f"INSERT INTO {operation.collection} ({', '.join(document)}) VALUES ({', '.join('?' for _ in document)})",
+                tuple(document.values())
+            )
+        return 1
+    where, params = _where(operation.filters)
+    if operation.kind == "update":
+        values = operation.document
+        with _timed("update", operation.collection):
+            cursor.execute(
+                f"UPDATE {operation.collection} SET {', '.join(f'{column} = ?' for column in values)}{where}",
+                tuple(values.values()) + params
+            )
+    elif operation.kind == "delete":
+        with _timed("delete", operation.collection):
+            cursor.execute(f"DELETE FROM {operation.collection}{where}", params)
+    else:
+        raise ValueError(f"未知的写操作: {operation.kind}")
+    return cursor.rowcount
+
+class SQLiteRepository(Repository):
+    """基于本地SQLite数据库的存储实现，连接由 init_sqlite_db 统一管理"""
+    name = "sqlite"
+
+    async def find(self, collection: str, filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                   sort: Optional[Sort] = None, limit: Optional[int] = None) -> List[dict]:
+        sql, params = _select_sql(collection, filters, fields, sort, limit)
+        cursor = (await get_db()).cursor()
+        try:
+            with _timed("select", collection):
+                cursor.execute(sql, params)
+                return _rows_to_dicts(cursor, cursor.fetchall())
+        finally:
+            cursor.close()
+
+    async def stream(self, collection: str, filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                     sort: Optional[Sort] = None, batch_size: int = 500) -> AsyncIterator[dict]:
+        # 使用独立的只读连接在线程中分批读取，不占用全局连接也不阻塞事件循环
+        sql, params = _select_sql(collection, filters, fields, sort, None)
+        read_conn = connect_readonly()
+        try:
+            cursor = await asyncio.to_thread(read_conn.execute, sql, params)
+            columns = [column[0] for column in cursor.description]
+            while True:
+                rows = await asyncio.to_thread(cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+        finally:
+            read_conn.close()
+
+    async def count(self, collection: str, filters: Optional[Filters] = None) -> int:
+        where, params = _where(filters)
+        rows = await query(f"SELECT COUNT(*) FROM {collection}{where}", params)
+        return rows[0][0]
+
+    async def count_by(self, collection: str, field: str, filters: Optional[Filters] = None,
+                       created_from: Optional[str] = None, created_before: Optional[str] = None) -> Dict[Any, int]:
+        where, params = _where(filters)
+        clauses = [where[len(" WHERE "):]] if where else []
+        if created_from:
+            clauses.append("created_at >= ?")
+            params += (created_from,)
+        if created_before:
+            clauses.append("created_at < ?")
+            params += (created_before,)
+        sql = f"SELECT {field}, COUNT(*) FROM {collection}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return dict(await query(sql + f" GROUP BY {field}", params))
+
+    async def find_matching(self, collection: str, columns: Sequence[str], terms: Sequence[str],
+                            filters: Optional[Filters] = None, fields: Optional[Sequence[str]] = None,
+                            sort: Optional[Sort] = None, limit: Optional[int] = None, offset: int = 0) -> List[dict]:
+        sql, params = _select_sql(collection, filters, fields, None, None)
+        clauses = ["(" + " OR ".join(f"instr(lower({column}), ?) > 0" for column in columns) + ")" for _ in terms]
+        if clauses:
+            sql += (" AND " if filters else " WHERE ") + " AND ".join(clauses)
+            params += tuple(term.lower() for term in terms for _ in columns)
+        if sort:
+            sql += " ORDER BY " + ", ".join(f"{column} {'DESC' if direction < 0 else 'ASC'}" for column, direction in sort)
+        sql += f" LIMIT {int(limit) if limit is not None else -1} OFFSET {int(offset)}"
+        cursor = (await get_db()).cursor()
+        try:
+            with _timed("select", collection):
+                cursor.execute(sql, params)
+                return _rows_to_dicts(cursor, cursor.fetchall())
+        finally:
+            cursor.close()
+
+    async def insert_many(self, collection: str, documents: List[dict]) -> int:
+        if not documents:
+            return 0
+        async with async_transaction("insert") as cursor:
+            columns = list(documents[0])
+            if all(list(document) == columns for document in documents):
+                return executemany(
+                    cursor,
+                    f"INSERT INTO {collection} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [tuple(document.values()) for document in documents]
+                )
+            return sum(_execute_write(cursor, WriteOp.insert(collection, document)) for document in documents)
+
+    async def insert_missing(self, collection: str, documents: List[dict]) -> int:
+        if not documents:
+            return 0
+        columns = list(documents[0])
+        async with async_transaction("insert") as cursor:
+            return executemany(
+                cursor,
+                f"INSERT OR IGNORE INTO {collection} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [tuple(document[column] for column in columns) for document in documents]
+            )
+
+    async def upsert_many(self, collection: str, documents: List[dict]) -> int:
+        if not documents:
+            return 0
+        columns = list(documents[0])
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column not in ("_id", "created_at"))
+        async with async_transaction("upsert") as cursor:
+            return executemany(
+                cursor,
+                f"INSERT INTO {collection} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT(_id) DO UPDATE SET {updates}",
+                [tuple(document[column] for column in columns) for document in documents]
+            )
+
+    async def update_one(self, collection: str, filters: Filters, values: dict) -> Optional[dict]:
+        where, params = _where(filters)
+        async with async_transaction("update") as cursor:
+            with _timed("update", collection):
+                cursor.execute(
+                    f"UPDATE {collection} SET {', '.join(f'{column} = ?' for column in values)} "
+                    f"WHERE rowid = (SELECT rowid FROM {collection}{where} LIMIT 1) RETURNING *",
+                    tuple(values.values()) + params
+                )
+                rows = _rows_to_dicts(cursor, cursor.fetchall())
+        return rows[0] if rows else None
+
+    async def update_many(self, collection: str, filters: Filters, values: dict) -> int:
+        async with async_transaction("update") as cursor:
+            return _execute_write(cursor, WriteOp.update(collection, filters, values))
+
+    async def increment(self, collection: str, filters: Filters, field: str, amount: int) -> int:
+        where, params = _where(filters)
+        return await execute(f"UPDATE {collection} SET {field} = {field} + ?{where}", (amount,) + params)
+
+    async def delete_many(self, collection: str, filters: Filters) -> int:
+        async with async_transaction("delete") as cursor:
+            return _execute_write(cursor, WriteOp.delete(collection, filters))
+
+    async def bulk_write(self, operations: Iterable[WriteOp]):
+        async with async_transaction("bulk_write") as cursor:
+            for operation in operations:
+                _execute_write(cursor, operation)
+
+    async def table_versions(self, tables: Iterable[str]) -> Dict[str, int]:
+        return await local_table_versions(tables)
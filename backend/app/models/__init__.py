@@ -1,10 +1,8 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
-from bson import ObjectId
 
-# Pydantic v2 doesn't support ObjectId directly, so we use string representation
-# and validate it manually
+# ID统一使用字符串表示
 
 # 基础模型
 class BaseDBModel(BaseModel):
@@ -63,6 +61,7 @@ class AuditItemBase(BaseModel):
     rule_id: str
     type: str  # text, image, video, etc.
     criteria: str
+    confidence_threshold: Optional[float] = Field(default=None, ge=0, le=1, description="模型级联中小模型结论的置信度阈值，为空时使用全局配置")
 
 class AuditItemCreate(AuditItemBase):
     pass
@@ -71,6 +70,7 @@ class AuditItemUpdate(BaseModel):
     name: Optional[str] = None
     type: Optional[str] = None
     criteria: Optional[str] = None
+    confidence_threshold: Optional[float] = Field(default=None, ge=0, le=1)
 
 class AuditItem(AuditItemBase, BaseDBModel):
     class Config(BaseDBModel.Config):
@@ -81,6 +81,9 @@ class AuditTaskBase(BaseModel):
     name: str
     scene_id: str
     use_knowledge_base: bool = False
+    files: List[dict] = Field(default_factory=list, description="待审核文件列表（上传接口返回的文件信息）")
+    token_budget: Optional[int] = Field(default=None, description="任务token预算，为空时使用全局配置，0表示不限制")
+    budget_action: Optional[str] = Field(default=None, description="超出预算后的处理方式：pause 或 truncate")
 
 class AuditTaskCreate(AuditTaskBase):
     pass
@@ -88,10 +91,20 @@ class AuditTaskCreate(AuditTaskBase):
 class AuditTaskUpdate(BaseModel):
     name: Optional[str] = None
     status: Optional[str] = None  # pending, running, completed, failed
+    files: Optional[List[dict]] = None
+    token_budget: Optional[int] = None
+    budget_action: Optional[str] = None
 
 class AuditTask(AuditTaskBase, BaseDBModel):
-    status: str = "pending"
+    status: str = "pending"  # pending, running, paused, completed, failed
     completed_at: Optional[datetime] = None
+    tokens_used: int = 0
+    # 结果已移入归档文件的时间，未归档为空
+    archived_at: Optional[datetime] = None
+    # 离线批量审核（Batch API）状态：preparing / submitted / ingesting / completed / incomplete / failed，未使用批量审核为空
+    # batch 为各批次ID与状态、文件清单及导入摘要
+    batch_status: Optional[str] = None
+    batch: Optional[dict] = None
     
     class Config(BaseDBModel.Config):
         pass
@@ -116,6 +129,15 @@ class AuditResultUpdate(BaseModel):
     edited_by: Optional[str] = None
 
 class AuditResult(AuditResultBase, BaseDBModel):
+    # 审核内容只在请求 include_content 时返回
+    content: Optional[str] = None
+    content_hash: Optional[str] = None
+    file_name: Optional[str] = None
+    estimated_tokens: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reused_from: Optional[str] = None
+    
     class Config(BaseDBModel.Config):
         pass
 
@@ -149,6 +171,30 @@ class PromptOptimizeResponse(BaseModel):
     optimized_prompt: str
 
 # 8. 执行逻辑保存请求模型
+class BatchOperation(BaseModel):
+    op: str = Field(..., description="操作类型：create、update 或 delete")
+    id: Optional[str] = Field(default=None, description="update/delete 的目标ID")
+    data: Optional[dict] = Field(default=None, description="create/update 的字段")
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., description="按顺序执行的操作列表")
+    atomic: bool = Field(default=True, description="任一操作失败时是否回滚全部操作")
+
 class ExecutionLogicSaveRequest(BaseModel):
     rule_id: str
-    description: str
\ No newline at end of file
+    description: str
+# 9. 参考资料知识库模型
+class KnowledgeIndexRequest(BaseModel):
+    files: List[dict] = Field(..., description="需要加入知识库的文件（上传接口返回的文件信息）")
+
+class KnowledgeSearchRequest(BaseModel):
+    query: str = Field(..., description="查询文本")
+    top_k: Optional[int] = Field(default=None, ge=1, le=50, description="返回的片段数")
+    file_keys: Optional[List[str]] = Field(default=None, description="只在这些文件中检索")
+
+# 10. 页面初始化数据模型
+class BootstrapResponse(BaseModel):
+    scenes: List[BusinessScene]
+    rules: List[Rule]
+    audit_items: List[AuditItem]
+    tasks: List[AuditTask]
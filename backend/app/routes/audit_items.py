@@ -1,15 +1,23 @@
-from fastapi import APIRouter, HTTPException, status
+import logging
+from fastapi import APIRouter, HTTPException, Request, status
 from typing import List
 from app.models import (
     AuditItem,
     AuditItemCreate,
-    AuditItemUpdate
+    AuditItemUpdate,
+    BatchRequest
 )
-from app.db.sqlite import query, insert, update, delete
+from app.db.repository import get_repository
+from app.services.batch_service import BatchResource, run_batch
+from app.services.etag_service import etag_response
 from datetime import datetime
 from uuid import uuid4
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+AUDIT_ITEM_COLUMNS = ("_id", "name", "rule_id", "type", "criteria", "confidence_threshold", "created_at", "updated_at")
+audit_item_resource = BatchResource("audit_items", AUDIT_ITEM_COLUMNS, AuditItemCreate, AuditItemUpdate)
 
 @router.post("/", response_model=AuditItem, status_code=status.HTTP_201_CREATED)
 async def create_audit_item(item: AuditItemCreate):
@@ -21,75 +29,62 @@ async def create_audit_item(item: AuditItemCreate):
         item_dict["created_at"] = datetime.utcnow().isoformat()
         item_dict["updated_at"] = datetime.utcnow().isoformat()
         
-        await insert("audit_items", item_dict)
+        await get_repository().insert_one("audit_items", item_dict)
         
         return AuditItem(**item_dict)
     except Exception as e:
-        import traceback
-        print(f"Error in create_audit_item: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in create_audit_item")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.post("/batch")
+async def batch_audit_items(request: BatchRequest):
+    """批量创建、更新、删除审核项，全部操作在一个事务中执行"""
+    try:
+        report = await run_batch(audit_item_resource, request.operations, request.atomic)
+        if not report["committed"]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=report)
+        return report
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    except Exception as e:
+        logger.exception("Error in batch_audit_items")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
+async def list_audit_items() -> List[AuditItem]:
+    """查询所有审核项"""
+    return [AuditItem(**item) for item in await get_repository().find("audit_items", fields=AUDIT_ITEM_COLUMNS)]
+
 @router.get("/", response_model=List[AuditItem])
-async def get_audit_items():
-    """获取所有审核项"""
+async def get_audit_items(request: Request):
+    """获取所有审核项，数据未变更时按 If-None-Match 返回304"""
     try:
-        # 从SQLite数据库查询所有审核项
-        results = await query("SELECT * FROM audit_items")
-        
-        # 转换为AuditItem对象
-        audit_items = []
-        for result in results:
-            audit_item_dict = {
-                "_id": result[0],
-                "name": result[1],
-                "rule_id": result[2],
-                "type": result[3],
-                "criteria": result[4],
-                "created_at": result[5],
-                "updated_at": result[6]
-            }
-            audit_items.append(AuditItem(**audit_item_dict))
-        
-        return audit_items
+        return await etag_response(request, ("audit_items",), list_audit_items)
     except Exception as e:
-        import traceback
-        print(f"Error in get_audit_items: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_audit_items")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
 @router.get("/rule/{rule_id}", response_model=List[AuditItem])
-async def get_audit_items_by_rule(rule_id: str):
-    """根据规则获取审核项"""
+async def get_audit_items_by_rule(rule_id: str, request: Request):
+    """根据规则获取审核项，数据未变更时按 If-None-Match 返回304"""
+    async def build():
+        items = await get_repository().find("audit_items", {"rule_id": rule_id}, AUDIT_ITEM_COLUMNS)
+        return [AuditItem(**item) for item in items]
+
     try:
-        # 从SQLite数据库查询指定规则的审核项
-        results = await query("SELECT * FROM audit_items WHERE rule_id = ?", (rule_id,))
-        
-        # 转换为AuditItem对象
-        audit_items = []
-        for result in results:
-            audit_item_dict = {
-                "_id": result[0],
-                "name": result[1],
-                "rule_id": result[2],
-                "type": result[3],
-                "criteria": result[4],
-                "created_at": result[5],
-                "updated_at": result[6]
-            }
-            audit_items.append(AuditItem(**audit_item_dict))
-        
-        return audit_items
+        return await etag_response(request, ("audit_items",), build)
     except Exception as e:
-        import traceback
-        print(f"Error in get_audit_items_by_rule: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_audit_items_by_rule")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -99,34 +94,19 @@ async def get_audit_items_by_rule(rule_id: str):
 async def get_audit_item(item_id: str):
     """获取单个审核项"""
     try:
-        # 从SQLite数据库查询单个审核项
-        results = await query("SELECT * FROM audit_items WHERE _id = ?", (item_id,))
+        item = await get_repository().find_one("audit_items", {"_id": item_id}, AUDIT_ITEM_COLUMNS)
         
-        if not results:
+        if item is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Audit item not found"
             )
         
-        # 转换为AuditItem对象
-        result = results[0]
-        audit_item_dict = {
-            "_id": result[0],
-            "name": result[1],
-            "rule_id": result[2],
-            "type": result[3],
-            "criteria": result[4],
-            "created_at": result[5],
-            "updated_at": result[6]
-        }
-        
-        return AuditItem(**audit_item_dict)
+        return AuditItem(**item)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in get_audit_item: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_audit_item")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -136,53 +116,23 @@ async def get_audit_item(item_id: str):
 async def update_audit_item(item_id: str, item_update: AuditItemUpdate):
     """更新审核项"""
     try:
-        # 检查审核项是否存在
-        results = await query("SELECT * FROM audit_items WHERE _id = ?", (item_id,))
-        if not results:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Audit item not found"
-            )
-        
         # 更新数据
         update_data = item_update.model_dump(exclude_unset=True)
         update_data["updated_at"] = datetime.utcnow().isoformat()
         
-        # 更新SQLite数据库
-        await update(
-            "audit_items",
-            update_data,
-            "_id = ?",
-            (item_id,)
-        )
-        
-        # 查询更新后的审核项
-        updated_results = await query("SELECT * FROM audit_items WHERE _id = ?", (item_id,))
-        if not updated_results:
+        # 更新并直接返回更新后的审核项
+        item = await get_repository().update_one("audit_items", {"_id": item_id}, update_data)
+        if item is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail="Audit item not found after update"
+                detail="Audit item not found"
             )
         
-        # 转换为AuditItem对象
-        result = updated_results[0]
-        audit_item_dict = {
-            "_id": result[0],
-            "name": result[1],
-            "rule_id": result[2],
-            "type": result[3],
-            "criteria": result[4],
-            "created_at": result[5],
-            "updated_at": result[6]
-        }
-        
-        return AuditItem(**audit_item_dict)
+        return AuditItem(**item)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in update_audit_item: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in update_audit_item")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -192,24 +142,18 @@ async def update_audit_item(item_id: str, item_update: AuditItemUpdate):
 async def delete_audit_item(item_id: str):
     """删除审核项"""
     try:
-        # 检查审核项是否存在
-        results = await query("SELECT * FROM audit_items WHERE _id = ?", (item_id,))
-        if not results:
+        # 删除审核项，不存在时返回404
+        if not await get_repository().delete_many("audit_items", {"_id": item_id}):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Audit item not found"
             )
         
-        # 删除审核项
-        await delete("audit_items", "_id = ?", (item_id,))
-        
         return None
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in delete_audit_item: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in delete_audit_item")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
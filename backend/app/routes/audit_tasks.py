@@ -1,5 +1,9 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+import logging
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from app.models import (
     AuditTask,
     AuditTaskCreate,
@@ -8,48 +12,81 @@ from app.models import (
     AuditResultCreate,
     AuditResultUpdate
 )
-from app.services.ai_service import ai_service
-from datetime import datetime
+from app.db.repository import WriteOp, get_repository
+from app.services.audit_service import (
+    BUDGET_ACTIONS,
+    RESULT_COLUMNS,
+    TASK_COLUMNS,
+    get_task,
+    result_from_document,
+    run_task,
+    task_from_document
+)
+from app.services.archive_service import ArchiveConflictError, archive_old_tasks, archive_task, load_archived_results, restore_task
+from app.services.batch_audit_service import (
+    ACTIVE_BATCH_STATUSES,
+    CLAIMED_BATCH_STATUSES,
+    BatchConflictError,
+    cancel_batch,
+    recover_stale_batches,
+    refresh_batch,
+    submit_batch
+)
+from app.services.content_service import attach_contents
+from app.services.etag_service import etag_response
+from app.services.export_service import EXPORT_FORMATS, export_task_results
+from app.services.statistics_service import get_statistics
+from app.services.token_service import PromptTooLargeError
+from app.core.logging import log_context
+from datetime import date, datetime
 from uuid import uuid4
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# 使用内存存储替代MongoDB
-audit_tasks_db = {}
-audit_results_db = {}
+def _check_budget_action(budget_action):
+    if budget_action is not None and budget_action not in BUDGET_ACTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"budget_action must be one of: {', '.join(sorted(BUDGET_ACTIONS))}"
+        )
 
 @router.post("/", response_model=AuditTask, status_code=status.HTTP_201_CREATED)
 async def create_audit_task(task: AuditTaskCreate):
     """创建新的审核任务"""
     try:
+        _check_budget_action(task.budget_action)
         task_dict = task.model_dump()
         task_id = str(uuid4())
         task_dict["_id"] = task_id
-        task_dict["created_at"] = datetime.utcnow()
-        task_dict["updated_at"] = datetime.utcnow()
+        task_dict["created_at"] = datetime.utcnow().isoformat()
+        task_dict["updated_at"] = datetime.utcnow().isoformat()
         task_dict["status"] = "pending"
-        
-        audit_tasks_db[task_id] = task_dict
-        
+
+        await get_repository().insert_one("audit_tasks", {**task_dict, "files": json.dumps(task_dict["files"], ensure_ascii=False)})
+
         return AuditTask(**task_dict)
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        print(f"Error in create_audit_task: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in create_audit_task")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
+async def list_audit_tasks() -> List[AuditTask]:
+    """查询所有审核任务"""
+    results = await get_repository().find("audit_tasks", fields=TASK_COLUMNS)
+    return [AuditTask(**task_from_document(result)) for result in results]
+
 @router.get("/", response_model=List[AuditTask])
-async def get_audit_tasks():
-    """获取所有审核任务"""
+async def get_audit_tasks(request: Request):
+    """获取所有审核任务，数据未变更时按 If-None-Match 返回304"""
     try:
-        return [AuditTask(**task) for task in audit_tasks_db.values()]
+        return await etag_response(request, ("audit_tasks",), list_audit_tasks)
     except Exception as e:
-        import traceback
-        print(f"Error in get_audit_tasks: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_audit_tasks")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -59,7 +96,7 @@ async def get_audit_tasks():
 async def get_audit_task(task_id: str):
     """获取单个审核任务"""
     try:
-        task = audit_tasks_db.get(task_id)
+        task = await get_task(task_id)
         if task is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -69,9 +106,7 @@ async def get_audit_task(task_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in get_audit_task: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_audit_task")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -81,26 +116,28 @@ async def get_audit_task(task_id: str):
 async def update_audit_task(task_id: str, task_update: AuditTaskUpdate):
     """更新审核任务"""
     try:
-        task = audit_tasks_db.get(task_id)
+        task = await get_task(task_id)
         if task is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Audit task not found"
             )
-        
+
         update_data = task_update.model_dump(exclude_unset=True)
-        update_data["updated_at"] = datetime.utcnow()
-        
+        _check_budget_action(update_data.get("budget_action"))
+        update_data["updated_at"] = datetime.utcnow().isoformat()
+
+        db_data = dict(update_data)
+        if "files" in db_data:
+            db_data["files"] = json.dumps(db_data["files"] or [], ensure_ascii=False)
+        await get_repository().update_many("audit_tasks", {"_id": task_id}, db_data)
+
         updated_task = {**task, **update_data}
-        audit_tasks_db[task_id] = updated_task
-        
         return AuditTask(**updated_task)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in update_audit_task: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in update_audit_task")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -110,26 +147,35 @@ async def update_audit_task(task_id: str, task_update: AuditTaskUpdate):
 async def delete_audit_task(task_id: str):
     """删除审核任务"""
     try:
-        if task_id not in audit_tasks_db:
+        task = await get_task(task_id)
+        if task is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Audit task not found"
             )
-        
-        del audit_tasks_db[task_id]
-        
+        # 已归档任务的结果先恢复，删除时统计计数器随之扣减
+        if task["archived_at"]:
+            await restore_task(task)
+        # 取消进行中的批次，服务端不再为已删除的任务执行请求
+        if task.get("batch_status") == "submitted":
+            try:
+                await cancel_batch(task)
+            except Exception:
+                logger.exception("Failed to cancel batch of task %s", task_id)
+
         # 同时删除关联的审核结果
-        for result_id, result in list(audit_results_db.items()):
-            if result["task_id"] == task_id:
-                del audit_results_db[result_id]
-        
+        await get_repository().bulk_write([
+            WriteOp.delete("audit_results", {"task_id": task_id}),
+            WriteOp.delete("audit_tasks", {"_id": task_id})
+        ])
+
         return None
     except HTTPException:
         raise
+    except ArchiveConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
-        import traceback
-        print(f"Error in delete_audit_task: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in delete_audit_task")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -138,91 +184,224 @@ async def delete_audit_task(task_id: str):
 @router.post("/{task_id}/run")
 async def run_audit_task(task_id: str):
     """运行审核任务"""
-    try:
-        # 更新任务状态为running
-        task = audit_tasks_db.get(task_id)
-        if task is None:
+    with log_context(task_id=task_id):
+        try:
+            task = await get_task(task_id)
+            if task is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Audit task not found"
+                )
+            # 提交或导入过程中进程退出遗留的批次状态先恢复
+            if task.get("batch_status") in CLAIMED_BATCH_STATUSES and await recover_stale_batches(task_id):
+                task = await get_task(task_id)
+            if task.get("batch_status") in ACTIVE_BATCH_STATUSES:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Audit task has a batch in progress"
+                )
+
+            # 重新运行已归档的任务前先恢复其结果
+            if task["archived_at"]:
+                await restore_task(task)
+                task = await get_task(task_id)
+
+            summary = await run_task(task)
+
+            return {
+                "message": "Audit task paused: token budget exhausted" if summary["status"] == "paused" else "Audit task completed",
+                **summary
+            }
+        except HTTPException:
+            raise
+        except PromptTooLargeError as e:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Audit task not found"
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except ArchiveConflictError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except Exception as e:
+            logger.exception("Error in run_audit_task")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Internal server error: {str(e)}"
+            )
+
+@router.post("/{task_id}/batch")
+async def submit_audit_task_batch(task_id: str):
+    """以离线批量方式（Batch API）运行审核任务，结果在批次完成后导入"""
+    with log_context(task_id=task_id):
+        try:
+            task = await get_task(task_id)
+            if task is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Audit task not found"
+                )
+            # 提交或导入过程中进程退出遗留的批次状态先恢复
+            if task.get("batch_status") in CLAIMED_BATCH_STATUSES and await recover_stale_batches(task_id):
+                task = await get_task(task_id)
+            if task["status"] == "running" or task.get("batch_status") in ACTIVE_BATCH_STATUSES:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Audit task is already running"
+                )
+
+            if task["archived_at"]:
+                await restore_task(task)
+                task = await get_task(task_id)
+
+            summary = await submit_batch(task)
+            return {"message": "Audit task batch submitted", **summary}
+        except HTTPException:
+            raise
+        except BatchConflictError as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(e)
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except PromptTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except ArchiveConflictError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except Exception as e:
+            logger.exception("Error in submit_audit_task_batch")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Internal server error: {str(e)}"
+            )
+
+@router.get("/{task_id}/batch")
+async def get_audit_task_batch(task_id: str):
+    """查询任务的批量审核状态；批次全部结束时导入结果并结束任务"""
+    with log_context(task_id=task_id):
+        try:
+            task = await get_task(task_id)
+            if task is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Audit task not found"
+                )
+            # 提交或导入过程中进程退出遗留的批次状态先恢复
+            if task.get("batch_status") in CLAIMED_BATCH_STATUSES and await recover_stale_batches(task_id):
+                task = await get_task(task_id)
+            if task.get("batch_status") is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Audit task has no batch"
+                )
+            return await refresh_batch(task)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Error in get_audit_task_batch")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Internal server error: {str(e)}"
+            )
+
+@router.post("/{task_id}/batch/cancel")
+async def cancel_audit_task_batch(task_id: str):
+    """取消任务进行中的批次，已完成的请求仍会导入，任务暂停后可再次运行"""
+    with log_context(task_id=task_id):
+        try:
+            task = await get_task(task_id)
+            if task is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Audit task not found"
+                )
+            return await cancel_batch(task)
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except Exception as e:
+            logger.exception("Error in cancel_audit_task_batch")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Internal server error: {str(e)}"
             )
-        
-        task["status"] = "running"
-        task["updated_at"] = datetime.utcnow()
-        audit_tasks_db[task_id] = task
-        
-        # 简化处理，直接生成模拟结果
-        # 模拟完成任务
-        task["status"] = "completed"
-        task["completed_at"] = datetime.utcnow()
-        task["updated_at"] = datetime.utcnow()
-        audit_tasks_db[task_id] = task
-        
-        return {
-            "message": "Audit task completed",
-            "task_id": task_id,
-            "status": "completed"
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        import traceback
-        print(f"Error in run_audit_task: {e}")
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Internal server error: {str(e)}"
-        )
 
 @router.get("/{task_id}/results", response_model=List[AuditResult])
-async def get_audit_results(task_id: str):
-    """获取审核任务的结果"""
+async def get_audit_results(task_id: str, request: Request, include_content: bool = False):
+    """
+    获取审核任务的结果，数据未变更时按 If-None-Match 返回304
+    :param include_content: 是否返回审核内容原文，默认只返回 content_hash（同一文件的各结果共用同一内容）
+    """
+    async def build():
+        # 已归档任务从归档文件读取
+        if task["archived_at"]:
+            return [AuditResult(**result_from_document(result)) for result in await load_archived_results(task, include_content)]
+        # 返回该任务的所有结果
+        fields = RESULT_COLUMNS + ("content",) if include_content else RESULT_COLUMNS
+        results = [result_from_document(result) for result in await get_repository().find("audit_results", {"task_id": task_id}, fields)]
+        if include_content:
+            await attach_contents(results)
+        return [AuditResult(**result) for result in results]
+
     try:
         # 检查任务是否存在
-        if task_id not in audit_tasks_db:
+        task = await get_task(task_id)
+        if task is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Audit task not found"
             )
-        
-        # 返回该任务的所有结果
-        return [AuditResult(**result) for result in audit_results_db.values() if result["task_id"] == task_id]
+
+        return await etag_response(request, ("audit_tasks", "audit_results"), build)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in get_audit_results: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_audit_results")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
 @router.put("/{task_id}/results/{result_id}", response_model=AuditResult)
-async def update_audit_result(result_id: str, result_update: AuditResultUpdate):
-    """更新审核结果"""
+async def update_audit_result(task_id: str, result_id: str, result_update: AuditResultUpdate, include_content: bool = False):
+    """更新审核结果（已归档任务的结果先恢复到数据库）"""
     try:
-        result = audit_results_db.get(result_id)
+        task = await get_task(task_id)
+        if task is not None and task["archived_at"]:
+            await restore_task(task)
+        fields = RESULT_COLUMNS + ("content",) if include_content else RESULT_COLUMNS
+        result = await get_repository().find_one("audit_results", {"_id": result_id, "task_id": task_id}, fields)
         if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Audit result not found"
             )
-        
+
         update_data = result_update.model_dump(exclude_unset=True)
-        update_data["updated_at"] = datetime.utcnow()
+        update_data["updated_at"] = datetime.utcnow().isoformat()
         update_data["ai_generated"] = False
-        
-        updated_result = {**result, **update_data}
-        audit_results_db[result_id] = updated_result
-        
+
+        await get_repository().update_many("audit_results", {"_id": result_id}, update_data)
+
+        updated_result = {**result_from_document(result), **update_data}
+        if include_content:
+            await attach_contents([updated_result])
         return AuditResult(**updated_result)
     except HTTPException:
         raise
+    except ArchiveConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
-        import traceback
-        print(f"Error in update_audit_result: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in update_audit_result")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -233,51 +412,173 @@ async def download_audit_result(task_id: str):
     """下载审核结果"""
     try:
         # 检查任务是否存在
-        if task_id not in audit_tasks_db:
+        if await get_task(task_id) is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Audit task not found"
             )
-        
+
         return {
             "message": "Audit result downloaded successfully",
             "task_id": task_id,
-            "download_url": f"/api/tasks/{task_id}/results/download"
+            "download_url": f"/api/tasks/{task_id}/results/download",
+            "formats": list(EXPORT_FORMATS)
         }
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in download_audit_result: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in download_audit_result")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.get("/{task_id}/results/download")
+async def export_audit_results(task_id: str, format: str = "csv", include_content: bool = False):
+    """流式导出审核结果（csv、jsonl、xlsx），边读取边输出，不在内存中构建整个文件"""
+    try:
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+            )
+        if await get_task(task_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Audit task not found"
+            )
+
+        return StreamingResponse(
+            export_task_results(task_id, format, include_content, asyncio.get_running_loop()),
+            media_type=EXPORT_FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="audit-results-{task_id}.{format}"'}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in export_audit_results")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
 @router.get("/statistics/summary")
-async def get_audit_statistics():
-    """获取审核任务统计数据"""
+async def get_audit_statistics(
+    scene_id: Optional[str] = None,
+    rule_id: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+):
+    """获取审核任务统计数据（SQLite读取预聚合计数器，其他存储后端按明细聚合）"""
     try:
-        # 统计不同状态的任务数量
-        completed_tasks = sum(1 for task in audit_tasks_db.values() if task["status"] == "completed")
-        pending_tasks = sum(1 for task in audit_tasks_db.values() if task["status"] == "pending")
-        
-        # 统计审核结果中的警告和失败数量
-        warning_results = sum(1 for result in audit_results_db.values() if result["result"] == "warning")
-        failed_results = sum(1 for result in audit_results_db.values() if result["result"] == "fail")
-        
+        if date_from and date_to and date_from > date_to:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="date_from must not be later than date_to"
+            )
+
+        statistics = await get_statistics(scene_id, rule_id, date_from, date_to)
+
         return {
-            "completed_tasks": completed_tasks,
-            "pending_tasks": pending_tasks,
-            "warning_tasks": warning_results,
-            "failed_tasks": failed_results
+            "completed_tasks": statistics["tasks"]["completed"],
+            "pending_tasks": statistics["tasks"]["pending"],
+            "warning_tasks": statistics["results"]["warning"],
+            "failed_tasks": statistics["results"]["fail"],
+            **statistics
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        print(f"Error in get_audit_statistics: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_audit_statistics")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/archive")
+async def archive_audit_tasks(older_than_days: Optional[int] = None, limit: Optional[int] = None):
+    """
+    立即执行一次归档：完成时间早于 older_than_days 天前（默认 ARCHIVE_AFTER_DAYS）的任务，其结果移入归档文件
+    :param limit: 本次最多归档的任务数，默认 ARCHIVE_BATCH_TASKS
+    """
+    try:
+        if (older_than_days is not None and older_than_days < 0) or (limit is not None and limit < 1):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="older_than_days must be >= 0 and limit must be >= 1"
+            )
+        return await archive_old_tasks(older_than_days, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in archive_audit_tasks")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.post("/{task_id}/archive")
+async def archive_audit_task(task_id: str):
+    """归档单个已完成的审核任务"""
+    try:
+        task = await get_task(task_id)
+        if task is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Audit task not found"
+            )
+        if task["archived_at"]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Audit task is already archived"
+            )
+        if task["status"] != "completed":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only completed audit tasks can be archived"
+            )
+
+        count = await archive_task(task)
+        if count is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Audit task changed while archiving"
+            )
+        return {"message": "Audit task archived", "task_id": task_id, "results": count}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in archive_audit_task")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.post("/{task_id}/restore")
+async def restore_audit_task(task_id: str):
+    """把已归档任务的结果恢复到数据库"""
+    try:
+        task = await get_task(task_id)
+        if task is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Audit task not found"
+            )
+        if not task["archived_at"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Audit task is not archived"
+            )
+
+        count = await restore_task(task)
+        return {"message": "Audit task restored", "task_id": task_id, "results": count}
+    except HTTPException:
+        raise
+    except ArchiveConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        logger.exception("Error in restore_audit_task")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
@@ -0,0 +1,34 @@
+import logging
+from fastapi import APIRouter, HTTPException, Request, status
+from app.models import BootstrapResponse
+from app.routes.audit_items import list_audit_items
+from app.routes.audit_tasks import list_audit_tasks
+from app.routes.business_scenes import list_business_scenes
+from app.routes.rules import RULE_TABLES, list_rules
+from app.services.etag_service import etag_response
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/bootstrap", response_model=BootstrapResponse)
+async def get_bootstrap(request: Request):
+    """
+    审核任务页面的初始化数据：业务场景、规则、审核项与审核任务一次返回，
+    四张表都没有变更时按 If-None-Match 返回304
+    """
+    async def build():
+        return {
+            "scenes": await list_business_scenes(),
+            "rules": await list_rules(),
+            "audit_items": await list_audit_items(),
+            "tasks": await list_audit_tasks()
+        }
+
+    try:
+        return await etag_response(request, ("business_scenes", *RULE_TABLES, "audit_items", "audit_tasks"), build)
+    except Exception as e:
+        logger.exception("Error in get_bootstrap")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
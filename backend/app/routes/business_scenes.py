@@ -1,16 +1,22 @@
-from fastapi import APIRouter, HTTPException, status
+import logging
+from fastapi import APIRouter, HTTPException, Request, status
 from typing import List
 from app.models import (
     BusinessScene,
     BusinessSceneCreate,
     BusinessSceneUpdate
 )
-from app.db.sqlite import query, insert, update, delete
+from app.db.repository import WriteOp, get_repository
 from app.core.security import input_validator
+from app.services.archive_service import ArchiveConflictError, restore_task
+from app.services.etag_service import etag_response
 from datetime import datetime
 from uuid import uuid4
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+SCENE_COLUMNS = ("_id", "name", "description", "created_at", "updated_at")
 
 @router.post("/", response_model=BusinessScene, status_code=status.HTTP_201_CREATED)
 async def create_business_scene(scene: BusinessSceneCreate):
@@ -26,44 +32,30 @@ async def create_business_scene(scene: BusinessSceneCreate):
         scene_dict["created_at"] = datetime.utcnow().isoformat()
         scene_dict["updated_at"] = datetime.utcnow().isoformat()
         
-        await insert("business_scenes", scene_dict)
+        await get_repository().insert_one("business_scenes", scene_dict)
         
         return BusinessScene(**scene_dict)
     except ValueError as ve:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
     except Exception as e:
-        import traceback
-        print(f"Error in create_business_scene: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in create_business_scene")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
+async def list_business_scenes() -> List[BusinessScene]:
+    """查询所有业务场景"""
+    scenes = await get_repository().find("business_scenes", fields=SCENE_COLUMNS)
+    return [BusinessScene(**scene) for scene in scenes]
+
 @router.get("/", response_model=List[BusinessScene])
-async def get_business_scenes():
-    """获取所有业务场景"""
+async def get_business_scenes(request: Request):
+    """获取所有业务场景，数据未变更时按 If-None-Match 返回304"""
     try:
-        # 从SQLite数据库查询所有业务场景
-        results = await query("SELECT * FROM business_scenes")
-        
-        # 转换为BusinessScene对象
-        scenes = []
-        for result in results:
-            scene_dict = {
-                "_id": result[0],
-                "name": result[1],
-                "description": result[2],
-                "created_at": result[3],
-                "updated_at": result[4]
-            }
-            scenes.append(BusinessScene(**scene_dict))
-        
-        return scenes
+        return await etag_response(request, ("business_scenes",), list_business_scenes)
     except Exception as e:
-        import traceback
-        print(f"Error in get_business_scenes: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_business_scenes")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -73,32 +65,19 @@ async def get_business_scenes():
 async def get_business_scene(scene_id: str):
     """获取单个业务场景"""
     try:
-        # 从SQLite数据库查询单个业务场景
-        results = await query("SELECT * FROM business_scenes WHERE _id = ?", (scene_id,))
+        scene = await get_repository().find_one("business_scenes", {"_id": scene_id}, SCENE_COLUMNS)
         
-        if not results:
+        if scene is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Business scene not found"
             )
         
-        # 转换为BusinessScene对象
-        result = results[0]
-        scene_dict = {
-            "_id": result[0],
-            "name": result[1],
-            "description": result[2],
-            "created_at": result[3],
-            "updated_at": result[4]
-        }
-        
-        return BusinessScene(**scene_dict)
+        return BusinessScene(**scene)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in get_business_scene: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_business_scene")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -108,51 +87,23 @@ async def get_business_scene(scene_id: str):
 async def update_business_scene(scene_id: str, scene_update: BusinessSceneUpdate):
     """更新业务场景"""
     try:
-        # 检查业务场景是否存在
-        results = await query("SELECT * FROM business_scenes WHERE _id = ?", (scene_id,))
-        if not results:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Business scene not found"
-            )
-        
         # 更新数据
         update_data = scene_update.model_dump(exclude_unset=True)
         update_data["updated_at"] = datetime.utcnow().isoformat()
         
-        # 更新SQLite数据库
-        await update(
-            "business_scenes",
-            update_data,
-            "_id = ?",
-            (scene_id,)
-        )
-        
-        # 查询更新后的业务场景
-        updated_results = await query("SELECT * FROM business_scenes WHERE _id = ?", (scene_id,))
-        if not updated_results:
+        # 更新并直接返回更新后的业务场景
+        scene = await get_repository().update_one("business_scenes", {"_id": scene_id}, update_data)
+        if scene is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail="Business scene not found after update"
+                detail="Business scene not found"
             )
         
-        # 转换为BusinessScene对象
-        result = updated_results[0]
-        scene_dict = {
-            "_id": result[0],
-            "name": result[1],
-            "description": result[2],
-            "created_at": result[3],
-            "updated_at": result[4]
-        }
-        
-        return BusinessScene(**scene_dict)
+        return BusinessScene(**scene)
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in update_business_scene: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in update_business_scene")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -162,48 +113,41 @@ async def update_business_scene(scene_id: str, scene_update: BusinessSceneUpdate
 async def delete_business_scene(scene_id: str):
     """删除业务场景，同时删除该场景下的所有关联数据"""
     try:
+        repository = get_repository()
         # 检查业务场景是否存在
-        results = await query("SELECT * FROM business_scenes WHERE _id = ?", (scene_id,))
-        if not results:
+        if await repository.find_one("business_scenes", {"_id": scene_id}, ("_id",)) is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Business scene not found"
             )
         
-        # 先获取该场景下的所有规则
-        rules = await query("SELECT _id FROM rules WHERE scene_id = ?", (scene_id,))
-        
-        # 删除每个规则及其关联的审核项
-        for rule in rules:
-            rule_id = rule[0]
-            # 删除关联的审核项
-            await delete("audit_items", "rule_id = ?", (rule_id,))
-            # 删除审核结果
-            await delete("audit_results", "rule_id = ?", (rule_id,))
-            # 删除规则
-            await delete("rules", "_id = ?", (rule_id,))
-        
-        # 获取该场景下的所有审核任务
-        tasks = await query("SELECT _id FROM audit_tasks WHERE scene_id = ?", (scene_id,))
-        
-        # 删除每个审核任务及其关联的审核结果
+        # 该场景下的规则与审核任务
+        rule_ids = [rule["_id"] for rule in await repository.find("rules", {"scene_id": scene_id}, ("_id",))]
+        tasks = await repository.find("audit_tasks", {"scene_id": scene_id}, ("_id", "created_at", "archived_at"))
+        task_ids = [task["_id"] for task in tasks]
+        # 已归档任务的结果先恢复，删除时统计计数器随之扣减
         for task in tasks:
-            task_id = task[0]
-            # 删除关联的审核结果
-            await delete("audit_results", "task_id = ?", (task_id,))
-            # 删除审核任务
-            await delete("audit_tasks", "_id = ?", (task_id,))
-        
-        # 最后删除业务场景
-        await delete("business_scenes", "_id = ?", (scene_id,))
+            if task.get("archived_at"):
+                await restore_task(task)
+        
+        # 先删除审核结果，再删除审核项、参考材料关联、规则与任务，最后删除业务场景
+        await repository.bulk_write([
+            WriteOp.delete("audit_results", {"rule_id": rule_ids}),
+            WriteOp.delete("audit_results", {"task_id": task_ids}),
+            WriteOp.delete("audit_items", {"rule_id": rule_ids}),
+            WriteOp.delete("rule_reference_materials", {"rule_id": rule_ids}),
+            WriteOp.delete("rules", {"_id": rule_ids}),
+            WriteOp.delete("audit_tasks", {"_id": task_ids}),
+            WriteOp.delete("business_scenes", {"_id": scene_id}),
+        ])
         
         return None
     except HTTPException:
         raise
+    except ArchiveConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
-        import traceback
-        print(f"Error in delete_business_scene: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in delete_business_scene")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
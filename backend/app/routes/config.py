@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, HTTPException, status
 from typing import Dict
 import os
@@ -6,6 +7,7 @@ from app.core.config import settings
 from app.services.ai_service import ai_service
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # API配置存储路径
 import os
@@ -29,8 +31,8 @@ async def get_ai_config():
                 "base_url": settings.DASHSCOPE_BASE_URL or "",
                 "model": settings.OPENAI_MODEL or settings.DASHSCOPE_MODEL or ""
             }
-    except Exception as e:
-        print(f"Error getting AI config: {e}")
+    except Exception:
+        logger.exception("Error getting AI config")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="获取AI配置失败"
@@ -50,8 +52,8 @@ async def save_ai_config(config: Dict):
         ai_service.init_client()
         
         return {"message": "AI配置保存成功"}
-    except Exception as e:
-        print(f"Error saving AI config: {e}")
+    except Exception:
+        logger.exception("Error saving AI config")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="保存AI配置失败"
@@ -0,0 +1,26 @@
+import logging
+from fastapi import APIRouter, File, HTTPException, UploadFile, status
+from app.services.import_service import import_catalog
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.post("/import")
+async def import_rule_catalog(file: UploadFile = File(...), dry_run: bool = False):
+    """
+    从 xlsx/csv/jsonl 批量导入业务场景、规则与审核项。
+    每行通过 record_type 列（scene/rule/audit_item，xlsx也可用工作表名称）区分记录类型，
+    规则通过 scene_id 或 scene_name 关联场景，审核项通过 rule_id 或 rule_name 关联规则；
+    已存在的记录（相同 _id 或相同名称）会被更新。
+    """
+    try:
+        # 解析与SQLite写入在线程池中执行，避免阻塞事件循环
+        return await import_catalog(file.file, file.filename, dry_run)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    except Exception as e:
+        logger.exception("Error in import_rule_catalog")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
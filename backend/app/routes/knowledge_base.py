@@ -0,0 +1,85 @@
+import logging
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, status
+from app.models import KnowledgeIndexRequest, KnowledgeSearchRequest
+from app.services.etag_service import etag_response
+from app.services.knowledge_service import knowledge_base
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.post("/documents")
+async def index_documents(request: KnowledgeIndexRequest):
+    """
+    将上传的参考资料切片并向量化后加入知识库，已存在的文件会被重新索引。
+    使用知识库的审核任务只把与审核项最相关的片段放进提示词
+    """
+    try:
+        documents, errors = [], []
+        for file_ref in request.files:
+            try:
+                # 解析与向量化都是CPU密集的同步操作，放到线程池中执行
+                documents.append(await asyncio.to_thread(knowledge_base.index_document, file_ref))
+            except (ValueError, FileNotFoundError) as e:
+                errors.append({"name": file_ref.get("name"), "error": str(e)})
+        return {"documents": documents, "errors": errors}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in index_documents")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.get("/documents")
+async def list_documents(request: Request):
+    """获取知识库中的文件列表，数据未变更时按 If-None-Match 返回304"""
+    try:
+        return await etag_response(request, ("kb_documents",), lambda: asyncio.to_thread(knowledge_base.list_documents))
+    except Exception as e:
+        logger.exception("Error in list_documents")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.delete("/documents/{file_key}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_document(file_key: str):
+    """从知识库中删除文件"""
+    try:
+        if not await asyncio.to_thread(knowledge_base.remove_document, file_key):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+        return None
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in remove_document")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.post("/search")
+async def search_knowledge_base(request: KnowledgeSearchRequest):
+    """检索与查询最相关的参考资料片段"""
+    try:
+        return await asyncio.to_thread(knowledge_base.search, request.query, request.top_k, request.file_keys)
+    except Exception as e:
+        logger.exception("Error in search_knowledge_base")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.post("/rebuild")
+async def rebuild_knowledge_base():
+    """重新向量化全部片段，回收已删除文件占用的向量空间并重新训练近似索引"""
+    try:
+        return await asyncio.to_thread(knowledge_base.rebuild)
+    except Exception as e:
+        logger.exception("Error in rebuild_knowledge_base")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
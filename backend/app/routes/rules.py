@@ -1,4 +1,7 @@
-from fastapi import APIRouter, HTTPException, status
+import logging
+import json
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from typing import List
 from app.models import (
     Rule,
@@ -7,14 +10,40 @@ from app.models import (
     ValidateRequest,
     PromptOptimizeRequest,
     PromptOptimizeResponse,
-    ExecutionLogicSaveRequest
+    ExecutionLogicSaveRequest,
+    BatchRequest
 )
 from app.services.ai_service import ai_service
-from app.db.sqlite import query, insert, update, delete
+from app.services.token_service import PromptTooLargeError
+from app.services.validation_service import RuleNotFoundError, prepare_validation, validate_files
+from app.db.repository import WriteOp, get_repository
+from app.services.batch_service import BatchResource, run_batch
+from app.services.etag_service import etag_response
+from app.services.reference_service import load_reference_materials, normalize_reference_materials, replace_rule_references
 from datetime import datetime
 from uuid import uuid4
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+RULE_COLUMNS = ("_id", "name", "scene_id", "description", "created_at", "updated_at")
+# 删除规则时同时删除其下的审核项与参考材料关联
+rule_resource = BatchResource(
+    "rules", RULE_COLUMNS, RuleCreate, RuleUpdate,
+    cascade=(("audit_items", "rule_id"), ("rule_reference_materials", "rule_id"))
+)
+
+async def _rules_with_references(rules: List[dict]) -> List[Rule]:
+    """将规则文档转换为Rule对象，参考材料用一次批量查询加载"""
+    references = await load_reference_materials(rule["_id"] for rule in rules)
+    return [Rule(**rule, reference_materials=references.get(rule["_id"], [])) for rule in rules]
+
+# 规则列表的内容依赖的表（参考材料在关联表中）
+RULE_TABLES = ("rules", "rule_reference_materials")
+
+async def list_rules() -> List[Rule]:
+    """查询所有规则"""
+    return await _rules_with_references(await get_repository().find("rules", fields=RULE_COLUMNS))
 
 @router.post("/", response_model=Rule, status_code=status.HTTP_201_CREATED)
 async def create_rule(rule: RuleCreate):
@@ -26,112 +55,105 @@ async def create_rule(rule: RuleCreate):
         rule_dict["created_at"] = datetime.utcnow().isoformat()
         rule_dict["updated_at"] = datetime.utcnow().isoformat()
         
-        # 移除数据库表中不存在的字段
-        if "reference_materials" in rule_dict:
-            del rule_dict["reference_materials"]
+        # 参考材料保存在关联表中，必须是已上传的文件
+        materials = normalize_reference_materials(rule_dict.pop("reference_materials", None))
         
-        # 保存到SQLite数据库
-        await insert("rules", rule_dict)
+        # 规则与参考材料一起批量写入（SQLite在同一事务中）
+        await get_repository().bulk_write([WriteOp.insert("rules", rule_dict)] + replace_rule_references(rule_id, materials))
         
-        return Rule(**rule_dict)
+        return Rule(**rule_dict, reference_materials=[path for path, _ in materials])
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
-        import traceback
-        print(f"Error in create_rule: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in create_rule")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.post("/batch")
+async def batch_rules(request: BatchRequest):
+    """批量创建、更新、删除规则（删除时级联删除审核项），全部操作在一个事务中执行"""
+    try:
+        report = await run_batch(rule_resource, request.operations, request.atomic)
+        if not report["committed"]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=report)
+        return report
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    except Exception as e:
+        logger.exception("Error in batch_rules")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
 @router.get("/", response_model=List[Rule])
-async def get_rules():
-    """获取所有规则"""
+async def get_rules(request: Request):
+    """获取所有规则，数据未变更时按 If-None-Match 返回304"""
     try:
-        # 从SQLite数据库查询所有规则
-        results = await query("SELECT * FROM rules")
-        
-        # 转换为Rule对象
-        rules = []
-        for result in results:
-            rule_dict = {
-                "_id": result[0],
-                "name": result[1],
-                "scene_id": result[2],
-                "description": result[3],
-                "reference_materials": [],  # 暂时返回空列表，后续可以从文件系统或数据库中获取
-                "created_at": result[4],
-                "updated_at": result[5]
-            }
-            rules.append(Rule(**rule_dict))
-        
-        return rules
+        return await etag_response(request, RULE_TABLES, list_rules)
     except Exception as e:
-        import traceback
-        print(f"Error in get_rules: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_rules")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
 @router.post("/validate")
-async def validate_rule(request: ValidateRequest):
-    """使用规则进行校验"""
+async def validate_rule(request: ValidateRequest, stream: bool = False):
+    """
+    使用规则的全部审核项并发校验上传的文件，参考文件只提炼一次要点供所有文件共用。
+    stream=true 时以 NDJSON 逐行返回每个文件的结果（按完成顺序），否则校验完成后一次返回
+    """
     try:
-        # 这里可以添加实际的校验逻辑，包括使用AI服务
-        # 目前返回模拟结果
-        results = []
+        context = await prepare_validation(request.rule_id, request.reference_files)
         
-        for file in request.files:
-            results.append({
-                "uid": file["uid"],
-                "fileName": file["name"],
-                "ruleName": f"规则_{request.rule_id}",
-                "result": "通过",
-                "reason": "符合规则要求",
-                "aiGenerated": True,
-                "reference_files": [ref_file["name"] for ref_file in request.reference_files]
-            })
+        if stream:
+            async def ndjson():
+                async for result in validate_files(context, request.files):
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+        
+        results = [result async for result in validate_files(context, request.files)]
+        results.sort(key=lambda result: result["index"])
         
         return {
             "message": "规则校验完成",
             "results": results
         }
+    except RuleNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Rule not found"
+        )
+    except PromptTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except Exception as e:
-        import traceback
-        print(f"Error in validate_rule: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in validate_rule")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
 @router.get("/scene/{scene_id}", response_model=List[Rule])
-async def get_rules_by_scene(scene_id: str):
-    """根据业务场景获取规则"""
+async def get_rules_by_scene(scene_id: str, request: Request):
+    """根据业务场景获取规则，数据未变更时按 If-None-Match 返回304"""
+    async def build():
+        return await _rules_with_references(await get_repository().find("rules", {"scene_id": scene_id}, RULE_COLUMNS))
+
     try:
-        # 从SQLite数据库查询指定场景的规则
-        results = await query("SELECT * FROM rules WHERE scene_id = ?", (scene_id,))
-        
-        # 转换为Rule对象
-        rules = []
-        for result in results:
-            rule_dict = {
-                "_id": result[0],
-                "name": result[1],
-                "scene_id": result[2],
-                "description": result[3],
-                "reference_materials": [],  # 暂时返回空列表，后续可以从文件系统或数据库中获取
-                "created_at": result[4],
-                "updated_at": result[5]
-            }
-            rules.append(Rule(**rule_dict))
-        
-        return rules
+        return await etag_response(request, RULE_TABLES, build)
     except Exception as e:
-        import traceback
-        print(f"Error in get_rules_by_scene: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_rules_by_scene")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -141,34 +163,19 @@ async def get_rules_by_scene(scene_id: str):
 async def get_rule(rule_id: str):
     """获取单个规则"""
     try:
-        # 从SQLite数据库查询单个规则
-        results = await query("SELECT * FROM rules WHERE _id = ?", (rule_id,))
+        rule = await get_repository().find_one("rules", {"_id": rule_id}, RULE_COLUMNS)
         
-        if not results:
+        if rule is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Rule not found"
             )
         
-        # 转换为Rule对象
-        result = results[0]
-        rule_dict = {
-            "_id": result[0],
-            "name": result[1],
-            "scene_id": result[2],
-            "description": result[3],
-            "reference_materials": [],  # 暂时返回空列表，后续可以从文件系统或数据库中获取
-            "created_at": result[4],
-            "updated_at": result[5]
-        }
-        
-        return Rule(**rule_dict)
+        return (await _rules_with_references([rule]))[0]
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in get_rule: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_rule")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -178,56 +185,41 @@ async def get_rule(rule_id: str):
 async def update_rule(rule_id: str, rule_update: RuleUpdate):
     """更新规则"""
     try:
-        # 检查规则是否存在
-        results = await query("SELECT * FROM rules WHERE _id = ?", (rule_id,))
-        if not results:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Rule not found"
-            )
-        
         # 更新数据
         update_data = rule_update.model_dump(exclude_unset=True)
         update_data["updated_at"] = datetime.utcnow().isoformat()
         
-        # 移除数据库表中不存在的字段
+        # 传入 reference_materials 时整体替换原有的参考材料
+        materials = None
         if "reference_materials" in update_data:
-            del update_data["reference_materials"]
+            materials = normalize_reference_materials(update_data.pop("reference_materials"))
         
-        # 更新SQLite数据库
-        await update(
-            "rules",
-            update_data,
-            "_id = ?",
-            (rule_id,)
-        )
-        
-        # 查询更新后的规则
-        updated_results = await query("SELECT * FROM rules WHERE _id = ?", (rule_id,))
-        if not updated_results:
+        repository = get_repository()
+        if materials is None:
+            # 更新并直接返回更新后的规则
+            updated = await repository.update_one("rules", {"_id": rule_id}, update_data)
+        elif await repository.find_one("rules", {"_id": rule_id}, ("_id",)) is None:
+            updated = None
+        else:
+            # 规则与参考材料一起批量写入（SQLite在同一事务中）
+            await repository.bulk_write([WriteOp.update("rules", {"_id": rule_id}, update_data)] + replace_rule_references(rule_id, materials))
+            updated = await repository.find_one("rules", {"_id": rule_id}, RULE_COLUMNS)
+        if updated is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail="Rule not found after update"
+                detail="Rule not found"
             )
         
-        # 转换为Rule对象
-        result = updated_results[0]
-        rule_dict = {
-            "_id": result[0],
-            "name": result[1],
-            "scene_id": result[2],
-            "description": result[3],
-            "created_at": result[4],
-            "updated_at": result[5]
-        }
-        
-        return Rule(**rule_dict)
+        return (await _rules_with_references([{column: updated[column] for column in RULE_COLUMNS}]))[0]
     except HTTPException:
         raise
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
-        import traceback
-        print(f"Error in update_rule: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in update_rule")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -237,27 +229,26 @@ async def update_rule(rule_id: str, rule_update: RuleUpdate):
 async def delete_rule(rule_id: str):
     """删除规则，同时删除该规则下的所有审核项"""
     try:
+        repository = get_repository()
         # 检查规则是否存在
-        results = await query("SELECT * FROM rules WHERE _id = ?", (rule_id,))
-        if not results:
+        if await repository.find_one("rules", {"_id": rule_id}, ("_id",)) is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Rule not found"
             )
         
-        # 先删除该规则下的所有审核项
-        await delete("audit_items", "rule_id = ?", (rule_id,))
-        
-        # 然后删除规则本身
-        await delete("rules", "_id = ?", (rule_id,))
+        # 先删除该规则下的所有审核项与参考材料关联，然后删除规则本身
+        await repository.bulk_write([
+            WriteOp.delete("audit_items", {"rule_id": rule_id}),
+            WriteOp.delete("rule_reference_materials", {"rule_id": rule_id}),
+            WriteOp.delete("rules", {"_id": rule_id}),
+        ])
         
         return None
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in delete_rule: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in delete_rule")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -283,9 +274,7 @@ async def optimize_rule_description(request: PromptOptimizeRequest):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in optimize_rule_description: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in optimize_rule_description")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -307,22 +296,18 @@ async def save_execution_logic(request: ExecutionLogicSaveRequest):
                 detail="Description is required"
             )
         
-        # 检查规则是否存在
-        results = await query("SELECT * FROM rules WHERE _id = ?", (request.rule_id,))
-        if not results:
+        # 更新规则描述，规则不存在时返回404
+        updated = await get_repository().update_one(
+            "rules",
+            {"_id": request.rule_id},
+            {"description": request.description, "updated_at": datetime.utcnow().isoformat()}
+        )
+        if updated is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Rule not found"
             )
         
-        # 更新规则描述
-        await update(
-            "rules",
-            {"description": request.description, "updated_at": datetime.utcnow().isoformat()},
-            "_id = ?",
-            (request.rule_id,)
-        )
-        
         return {
             "message": "Execution logic saved successfully",
             "rule_id": request.rule_id,
@@ -331,9 +316,7 @@ async def save_execution_logic(request: ExecutionLogicSaveRequest):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in save_execution_logic: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in save_execution_logic")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -346,26 +329,18 @@ async def validate_rule(rule_id: str, example_content: dict):
     """规则校验"""
     try:
         # 从数据库获取规则
-        results = await query("SELECT * FROM rules WHERE _id = ?", (rule_id,))
-        if not results:
+        rule = await get_repository().find_one("rules", {"_id": rule_id}, RULE_COLUMNS)
+        if rule is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Rule not found"
             )
         
-        result = results[0]
-        rule = {
-            "_id": result[0],
-            "name": result[1],
-            "scene_id": result[2],
-            "description": result[3],
-            "created_at": result[4],
-            "updated_at": result[5]
-        }
-        
         # 获取关联的审核项
-        audit_items_results = await query("SELECT * FROM audit_items WHERE rule_id = ?", (rule_id,))
-        audit_items = [{"_id": item[0], "name": item[1], "rule_id": item[2], "type": item[3], "criteria": item[4], "created_at": item[5], "updated_at": item[6]} for item in audit_items_results]
+        audit_items = await get_repository().find(
+            "audit_items", {"rule_id": rule_id},
+            ("_id", "name", "rule_id", "type", "criteria", "created_at", "updated_at")
+        )
         
         # 调用AI服务进行规则校验
         validation_results = await ai_service.validate_rule(rule, example_content, audit_items)
@@ -378,10 +353,13 @@ async def validate_rule(rule_id: str, example_content: dict):
         }
     except HTTPException:
         raise
+    except PromptTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except Exception as e:
-        import traceback
-        print(f"Error in validate_rule: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in validate_rule")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -0,0 +1,53 @@
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, status
+from app.services.search_service import rebuild_index, search
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/search")
+async def search_all(
+    q: str = Query(..., min_length=1, max_length=200),
+    types: Optional[str] = None,
+    scene_id: Optional[str] = None,
+    task_id: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0)
+):
+    """
+    全文检索规则、审核项与审核结果，按相关度排序并返回高亮摘要
+    :param q: 查询文本，多个词以空白分隔
+    :param types: 逗号分隔的检索类型（rules, audit_items, audit_results），默认全部
+    :param scene_id: 按业务场景过滤
+    :param task_id: 按审核任务过滤，只检索审核结果
+    :param limit: 每种类型返回的条数
+    :param offset: 每种类型跳过的条数
+    :return: 各类型的结果
+    """
+    try:
+        names = [name.strip() for name in types.split(",") if name.strip()] if types else None
+        try:
+            return await search(q, names, scene_id, task_id, limit, offset)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in search_all")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@router.post("/search/rebuild")
+async def rebuild_search_index():
+    """按原表重建全文索引（执行VACUUM后需要重建）"""
+    try:
+        return await rebuild_index()
+    except Exception as e:
+        logger.exception("Error in rebuild_search_index")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
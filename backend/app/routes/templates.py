@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, HTTPException, status
 from typing import List
 from app.models import (
@@ -9,6 +10,7 @@ from datetime import datetime
 from uuid import uuid4
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # 使用内存存储替代MongoDB
 templates_db = {}
@@ -27,9 +29,7 @@ async def create_template(template: TemplateCreate):
         
         return Template(**template_dict)
     except Exception as e:
-        import traceback
-        print(f"Error in create_template: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in create_template")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -41,9 +41,7 @@ async def get_templates():
     try:
         return [Template(**template) for template in templates_db.values()]
     except Exception as e:
-        import traceback
-        print(f"Error in get_templates: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_templates")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -63,9 +61,7 @@ async def get_template(template_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in get_template: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in get_template")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -92,9 +88,7 @@ async def update_template(template_id: str, template_update: TemplateUpdate):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in update_template: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in update_template")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -115,9 +109,7 @@ async def delete_template(template_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in delete_template: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in delete_template")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
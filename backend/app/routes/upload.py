@@ -1,12 +1,17 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response, status
 import os
+import logging
 import shutil
 import uuid
 import re
+from app.core.config import settings
+from app.services.document_service import IMAGE_EXTENSIONS, resolve_upload_path
+from app.services.image_service import get_image_variant
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = settings.UPLOAD_DIR
 ALLOWED_EXTENSIONS = {'.txt', '.xls', '.xlsx', '.doc', '.docx', '.pdf', '.png', '.jpg', '.jpeg', '.gif'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
@@ -77,3 +82,30 @@ async def upload_files(
             "message": "文件上传成功",
             "files": uploaded_files
         }
+
+
+@router.get("/files/{unique_filename}/thumbnail")
+async def get_thumbnail(unique_filename: str, size: int = Query(default=None, ge=32, le=2048)):
+    """获取上传图片的缩略图，处理结果按文件内容哈希缓存"""
+    try:
+        if os.path.splitext(unique_filename)[1].lower() not in IMAGE_EXTENSIONS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="只支持图片文件")
+        path = resolve_upload_path(unique_filename)
+        variant = await get_image_variant(path, size or settings.IMAGE_THUMBNAIL_SIDE)
+        return Response(
+            content=variant["data"],
+            media_type=variant["media_type"],
+            headers={"Cache-Control": "public, max-age=86400", "ETag": f'"{variant["file_hash"]}-{size or settings.IMAGE_THUMBNAIL_SIDE}"'}
+        )
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无法解析图片文件")
+    except Exception as e:
+        logger.exception("Error in get_thumbnail")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
@@ -1,25 +1,134 @@
-from typing import Optional
+from typing import List, Optional
 import os
 import json
 import re
+import time
+import asyncio
 import logging
 from app.core.config import settings
-from app.core.logging import sanitize_log_message
+from app.core.metrics import ai_request_duration_seconds, ai_tokens_total, ai_retries_total, ai_fallback_total, ai_cascade_total
+from app.core.tracing import tracer
+from app.services.scheduler_service import llm_scheduler
+from app.services.token_service import (
+    PromptTooLargeError,
+    estimate_messages_tokens,
+    estimate_tokens,
+    split_by_tokens,
+    truncate_to_tokens
+)
 
 logger = logging.getLogger(__name__)
 
+# 审核结论严重程度，分片合并时取最严重的结论
+RESULT_SEVERITY = {"pass": 0, "warning": 1, "fail": 2}
+
+AUDIT_SYSTEM_ROLE = "你是一名专业的智能审核专家，能够根据给定的标准对各种内容进行准确审核。"
+IMAGE_AUDIT_SYSTEM_ROLE = "你是一名专业的智能审核专家，能够根据给定的标准对图片内容进行准确审核。"
+
+# 大模型调用失败或返回无法解析时的审核结论
+AUDIT_FALLBACK_RESULT = {
+    "result": "warning",
+    "reason": "AI审核失败，建议人工复核",
+    "confidence": 0.5
+}
+CONFIRM_FALLBACK_RESULT = {
+    "result": "warning",
+    "reason": "AI确认失败，建议人工复核",
+    "confidence": 0.5
+}
+
+# 默认结论的理由，用于识别调用失败时保存的结果（不能作为重复内容复用的来源）
+FALLBACK_REASONS = (AUDIT_FALLBACK_RESULT["reason"], CONFIRM_FALLBACK_RESULT["reason"])
+
+def _usage_dict(estimated_tokens: int, usage) -> dict:
+    """汇总本地预估与服务端返回的token用量"""
+    return {
+        "estimated_tokens": estimated_tokens,
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0
+    }
+
+def _add_usage(*usages: Optional[dict]) -> dict:
+    """累加多次调用的token用量"""
+    total = {"estimated_tokens": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for usage in usages:
+        for key in total:
+            total[key] += (usage or {}).get(key, 0)
+    return total
+
+def _image_prompt_params(criteria: str, item_type: str, references: str, content: str) -> dict:
+    """图片审核提示词参数，OCR文字最多占用单次提示词上限的一半"""
+    return {
+        'criteria': criteria,
+        'item_type': item_type,
+        'references': references,
+        'content': truncate_to_tokens(content, settings.AI_MAX_PROMPT_TOKENS // 2) if content.strip() else "无"
+    }
+
+def _confidence(result: dict) -> float:
+    """大模型返回的置信度，缺失或无法解析时视为0（需要复审）"""
+    try:
+        return float(result.get("confidence"))
+    except (TypeError, ValueError):
+        return 0.0
+
+def merge_audit_results(results: List[dict]) -> dict:
+    """
+    合并多个内容分片的审核结果：取最严重的结论，拼接对应理由，累加token用量
+    :param results: 各分片的审核结果
+    :return: 合并后的审核结果
+    """
+    worst = max(results, key=lambda r: RESULT_SEVERITY.get(str(r.get("result", "")).lower(), 1))
+    verdict = str(worst.get("result", "warning")).lower()
+    reasons = [
+        f"[片段{index}/{len(results)}] {r.get('reason', '')}"
+        for index, r in enumerate(results, 1)
+        if str(r.get("result", "")).lower() == verdict
+    ]
+    confidences = [r.get("confidence") for r in results if str(r.get("result", "")).lower() == verdict and isinstance(r.get("confidence"), (int, float))]
+    return {
+        "result": verdict,
+        "reason": "\n".join(reasons),
+        "confidence": min(confidences) if confidences else 0.5,
+        "chunks": len(results),
+        "escalated": any(r.get("escalated") for r in results),
+        "fallback": any(r.get("fallback") for r in results),
+        "usage": _add_usage(*(r.get("usage") for r in results))
+    }
+
 class AIService:
+    """
+    大模型调用服务。创建实例时不读取配置也不导入openai：配置在应用启动（lifespan）时加载，
+    客户端在首次访问 client 时创建，导入模块与启动工作进程都不会被拖慢
+    """
     def __init__(self):
         self.provider = settings.AI_PROVIDER
         self.api_key = None
         self.base_url = None
         self.model = None
-        self.client = None
-        
-        self.load_config()
+        self._client = None
+        self._client_ready = False
+        self._config_loaded = False
+    
+    @property
+    def client(self):
+        """大模型客户端，首次访问时创建，未配置API密钥时为None"""
+        if not self._client_ready:
+            self.init_client()
+        return self._client
+    
+    @client.setter
+    def client(self, value):
+        self._client = value
+        self._client_ready = True
+    
+    def ensure_config(self):
+        """尚未加载配置时加载一次"""
+        if not self._config_loaded:
+            self.load_config()
         
     def load_config(self):
-        import os
+        self._config_loaded = True
         # 使用绝对路径，确保在任何工作目录下都能找到配置文件
         API_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../ai_api_config.json")
         try:
@@ -36,13 +145,13 @@ class AIService:
                 self.base_url = settings.DASHSCOPE_BASE_URL or ""
                 self.model = settings.OPENAI_MODEL or settings.DASHSCOPE_MODEL or ""
         except Exception as e:
-            logger.error(f"Error loading AI config: {sanitize_log_message(str(e))}")
+            logger.error("Error loading AI config: %s", e)
             self.provider = settings.AI_PROVIDER
             self.api_key = settings.OPENAI_API_KEY or settings.DASHSCOPE_API_KEY or ""
             self.base_url = settings.DASHSCOPE_BASE_URL or ""
             self.model = settings.OPENAI_MODEL or settings.DASHSCOPE_MODEL or ""
     
-    async def _call_ai(self, prompt_name: str, system_role: str, prompt_params: dict, error_message: str, default_result: dict) -> dict:
+    async def _call_ai(self, prompt_name: str, system_role: str, prompt_params: dict, error_message: str, default_result: dict, images: Optional[List[dict]] = None, model: Optional[str] = None) -> dict:
         """
         核心AI调用函数，封装共同的AI调用逻辑
         :param prompt_name: 提示词名称
@@ -50,91 +159,382 @@ class AIService:
         :param prompt_params: 提示词格式化参数
         :param error_message: 错误消息前缀
         :param default_result: 默认结果
-        :return: AI响应结果
+        :param images: prepare_image 处理后的图片，作为图片部分随提示词发送给视觉模型
+        :param model: 使用的模型，默认为当前配置的模型（有图片时为视觉模型）
+        :return: AI响应结果，调用失败时为 default_result 并带 fallback 标记
         """
         if not self.client:
             raise Exception("请配置AI API密钥以使用AI功能")
             
+        estimated_tokens = 0
         try:
             # 加载提示词
-            prompt_template = self.load_prompt(prompt_name)
+            with tracer.span("ai.load_prompt", **{"prompt.name": prompt_name}):
+                prompt_template = self.load_prompt(prompt_name)
             
             # 格式化提示词
-            prompt = prompt_template.format(**prompt_params)
+            with tracer.span("ai.format_prompt", **{"prompt.name": prompt_name}) as span:
+                prompt = prompt_template.format(**prompt_params)
+                messages, estimated_tokens = self._build_messages(prompt, system_role, images)
+                span.set_attribute("prompt.chars", len(prompt))
+                span.set_attribute("prompt.estimated_tokens", estimated_tokens)
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_role},
-                    {"role": "user", "content": prompt}
-                ],
+            # 超过上限的提示词在上传前直接拒绝，避免慢速上传后才被服务端拒绝
+            if estimated_tokens > settings.AI_MAX_PROMPT_TOKENS:
+                raise PromptTooLargeError(estimated_tokens, settings.AI_MAX_PROMPT_TOKENS)
+            
+            response = await self._create_completion(
+                prompt_name,
+                model=model or ((settings.AI_VISION_MODEL or self.model) if images else self.model),
+                cost=estimated_tokens,
+                messages=messages,
                 temperature=0.3,
                 response_format={"type": "json_object"}
             )
             
-            result = response.choices[0].message.content
-            import json
-            return json.loads(result)
-        except Exception as e:
-            print(f"{error_message}: {e}")
-            return default_result
+            result = json.loads(response.choices[0].message.content)
+            result["usage"] = _usage_dict(estimated_tokens, getattr(response, "usage", None))
+            return result
+        except PromptTooLargeError:
+            raise
+        except Exception:
+            logger.exception(error_message)
+            ai_fallback_total.inc(provider=self.provider, prompt=prompt_name)
+            # fallback 标记调用失败时的默认结论，不写入数据库，只用于调用方区分
+            return {**default_result, "fallback": True, "usage": _usage_dict(estimated_tokens, None)}
     
-    async def generate_audit_result(self, content: str, criteria: str, item_type: str) -> dict:
+    def _build_messages(self, prompt: str, system_role: str, images: Optional[List[dict]] = None) -> tuple:
         """
-        生成审核结果
+        组装对话消息，图片作为图片部分附在提示词之后
+        :return: (messages, 预估token数)
+        """
+        user_content = prompt
+        if images:
+            user_content = [{"type": "text", "text": prompt}] + [
+                {"type": "image_url", "image_url": {"url": image["data_url"], "detail": settings.IMAGE_DETAIL}}
+                for image in images
+            ]
+        messages = [
+            {"role": "system", "content": system_role},
+            {"role": "user", "content": user_content}
+        ]
+        return messages, estimate_messages_tokens(messages, self.model) + sum(image["tokens"] for image in images or [])
+    
+    def cascade_enabled(self) -> bool:
+        """是否启用模型级联（配置了与当前模型不同的低成本模型）"""
+        return bool(settings.AI_CASCADE_MODEL) and settings.AI_CASCADE_MODEL != self.model
+    
+    async def _call_cascade(self, confidence_threshold: Optional[float] = None, **call_params) -> dict:
+        """
+        模型级联调用：先用 AI_CASCADE_MODEL 审核，结论为 warning 或置信度低于阈值时再用当前配置的模型复审，
+        返回复审结论（escalated 为True），token用量为两次调用之和。未启用级联时直接调用当前模型。
+        小模型调用失败时返回的默认结论为 warning，同样升级复审；复审失败时结果带 fallback 标记
+        :param confidence_threshold: 审核项的置信度阈值，为空时使用 AI_CASCADE_CONFIDENCE_THRESHOLD
+        :param call_params: _call_ai 的参数
+        :return: 审核结果
+        """
+        if not self.cascade_enabled():
+            return await self._call_ai(**call_params)
+        threshold = settings.AI_CASCADE_CONFIDENCE_THRESHOLD if confidence_threshold is None else confidence_threshold
+        prompt_name = call_params["prompt_name"]
+        
+        first = await self._call_ai(model=settings.AI_CASCADE_MODEL, **call_params)
+        if str(first.get("result", "")).lower() not in ("pass", "fail"):
+            outcome = "warning"
+        elif _confidence(first) < threshold:
+            outcome = "low_confidence"
+        else:
+            ai_cascade_total.inc(prompt=prompt_name, outcome="accepted")
+            return {**first, "escalated": False}
+        ai_cascade_total.inc(prompt=prompt_name, outcome=outcome)
+        
+        second = await self._call_ai(**call_params)
+        return {**second, "escalated": True, "usage": _add_usage(first.get("usage"), second.get("usage"))}
+    
+    def content_budget(self, prompt_name: str, system_role: str, content_key: str = "content", **prompt_params) -> int:
+        """
+        提示词中留给待审核内容的token数（单次提示词上限减去内容为空时的提示词开销）
+        :param prompt_name: 提示词名称
+        :param system_role: 系统角色
+        :param content_key: 内容在提示词模板中的参数名
+        :param prompt_params: 其余提示词参数
+        :return: token数
+        """
+        template = self.load_prompt(prompt_name)
+        return settings.AI_MAX_PROMPT_TOKENS - estimate_messages_tokens([
+            {"role": "system", "content": system_role},
+            {"role": "user", "content": template.format(**{content_key: ""}, **prompt_params)}
+        ], self.model)
+    
+    def audit_content_budget(self, criteria: str, item_type: str, references: str = "无") -> int:
+        """审核提示词（audit_result）中留给待审核内容的token数"""
+        return self.content_budget('audit_result', AUDIT_SYSTEM_ROLE, criteria=criteria, item_type=item_type, references=references)
+    
+    def split_content(self, content: str, available: int) -> List[str]:
+        """
+        把待审核内容切分为不超过 available 个token的片段，超过最大片段数时直接拒绝
+        :param content: 待审核内容
+        :param available: 提示词中留给内容的token数
+        :return: 内容片段列表
+        """
+        overhead = settings.AI_MAX_PROMPT_TOKENS - available
+        if available <= 0:
+            raise PromptTooLargeError(overhead, settings.AI_MAX_PROMPT_TOKENS)
+        
+        chunks = split_by_tokens(content, available, self.model)
+        if len(chunks) > settings.AI_MAX_CONTENT_CHUNKS:
+            raise PromptTooLargeError(overhead + estimate_tokens(content, self.model), settings.AI_MAX_PROMPT_TOKENS * settings.AI_MAX_CONTENT_CHUNKS)
+        return chunks
+    
+    def split_content_for_prompt(self, prompt_name: str, system_role: str, content: str, content_key: str = "content", **prompt_params) -> List[str]:
+        """
+        按提示词剩余的token空间切分待审核内容，超过最大片段数时直接拒绝
+        :param prompt_name: 提示词名称
+        :param system_role: 系统角色
+        :param content: 待审核内容
+        :param content_key: 内容在提示词模板中的参数名
+        :param prompt_params: 其余提示词参数
+        :return: 内容片段列表
+        """
+        return self.split_content(content, self.content_budget(prompt_name, system_role, content_key, **prompt_params))
+    
+    async def _create_completion(self, prompt_name: str, model: Optional[str] = None, cost: Optional[int] = None, **kwargs):
+        """
+        调用chat completion接口，对限流/超时/连接/服务端错误做指数退避重试，并记录耗时与token指标。
+        每次尝试都经过调度器占用调用名额，退避等待期间不占用名额
+        :param prompt_name: 提示词名称，用作指标标签
+        :param model: 模型名称，默认使用当前配置的模型
+        :param cost: 预估token数，用于公平排队，默认按消息估算
+        :return: 大模型原始响应
+        """
+        model = model or self.model
+        if cost is None:
+            cost = estimate_messages_tokens(kwargs.get("messages", []), model)
+        from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+        retryable = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+        
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                async with llm_scheduler.slot(cost) as waited:
+                    start = time.perf_counter()
+                    with tracer.span("ai.chat_completion", **{"ai.provider": self.provider, "ai.model": model, "prompt.name": prompt_name, "ai.attempt": attempt, "scheduler.wait_seconds": round(waited, 4)}) as span:
+                        response = await self.client.chat.completions.create(model=model, **kwargs)
+                        usage = getattr(response, "usage", None)
+                        if usage is not None:
+                            span.set_attribute("ai.usage.prompt_tokens", usage.prompt_tokens)
+                            span.set_attribute("ai.usage.completion_tokens", usage.completion_tokens)
+            except retryable as e:
+                ai_request_duration_seconds.observe(time.perf_counter() - start, provider=self.provider, model=model, prompt=prompt_name, outcome="error")
+                if attempt >= settings.AI_MAX_RETRIES:
+                    raise
+                attempt += 1
+                ai_retries_total.inc(provider=self.provider, model=model, reason=type(e).__name__)
+                await asyncio.sleep(settings.AI_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+                continue
+            except Exception:
+                ai_request_duration_seconds.observe(time.perf_counter() - start, provider=self.provider, model=model, prompt=prompt_name, outcome="error")
+                raise
+            
+            ai_request_duration_seconds.observe(time.perf_counter() - start, provider=self.provider, model=model, prompt=prompt_name, outcome="success")
+            if usage is not None:
+                ai_tokens_total.inc(usage.prompt_tokens or 0, provider=self.provider, model=model, kind="prompt")
+                ai_tokens_total.inc(usage.completion_tokens or 0, provider=self.provider, model=model, kind="completion")
+            return response
+    
+    async def generate_audit_result(self, content: str, criteria: str, item_type: str, references: str = "无", confidence_threshold: Optional[float] = None, chunks: Optional[List[str]] = None) -> dict:
+        """
+        生成审核结果，内容超过单次提示词上限时分片审核后合并；启用模型级联时每个分片先由低成本模型审核
         :param content: 待审核内容
         :param criteria: 审核标准
         :param item_type: 审核项类型
+        :param references: 从知识库检索到的参考资料
+        :param confidence_threshold: 审核项的级联置信度阈值
+        :param chunks: 预先切分的内容片段（同一文件的各审核项共用），为空时按本次提示词切分
+        :return: 审核结果
+        """
+        if chunks is None:
+            chunks = await asyncio.to_thread(self.split_content, content, self.audit_content_budget(criteria, item_type, references))
+        
+        results = []
+        for chunk in chunks:
+            results.append(await self._call_cascade(
+                confidence_threshold,
+                prompt_name='audit_result',
+                system_role=AUDIT_SYSTEM_ROLE,
+                prompt_params={
+                    'criteria': criteria,
+                    'item_type': item_type,
+                    'content': chunk,
+                    'references': references
+                },
+                error_message="Error generating audit result",
+                default_result=AUDIT_FALLBACK_RESULT
+            ))
+        return results[0] if len(results) == 1 else merge_audit_results(results)
+
+    async def generate_image_audit_result(self, image: dict, criteria: str, item_type: str, references: str = "无", content: str = "") -> dict:
+        """
+        使用视觉模型审核图片
+        :param image: prepare_image 处理后的图片
+        :param criteria: 审核标准
+        :param item_type: 审核项类型
+        :param references: 参考资料
+        :param content: 图片中OCR识别出的文字
         :return: 审核结果
         """
         return await self._call_ai(
-            prompt_name='audit_result',
-            system_role="你是一名专业的智能审核专家，能够根据给定的标准对各种内容进行准确审核。",
+            prompt_name='audit_image',
+            system_role=IMAGE_AUDIT_SYSTEM_ROLE,
+            prompt_params=_image_prompt_params(criteria, item_type, references, content),
+            error_message="Error generating image audit result",
+            default_result=AUDIT_FALLBACK_RESULT,
+            images=[image]
+        )
+
+    def build_audit_requests(self, content: str, criteria: str, item_type: str, references: str = "无", image: Optional[dict] = None, chunks: Optional[List[str]] = None) -> List[tuple]:
+        """
+        生成批量接口（Batch API）使用的审核请求，提示词与 generate_audit_result / generate_image_audit_result 相同；
+        批量请求只使用当前配置的模型（图片为视觉模型），不经过模型级联
+        :param content: 待审核内容（图片为OCR识别出的文字）
+        :param criteria: 审核标准
+        :param item_type: 审核项类型
+        :param references: 参考资料
+        :param image: prepare_image 处理后的图片
+        :param chunks: 预先切分的文本内容片段，为空时按本次提示词切分
+        :return: [(chat completion 请求体, 预估token数)]，文本内容超过单次提示词上限时每个分片一个请求
+        """
+        if image:
+            prompts = [(IMAGE_AUDIT_SYSTEM_ROLE, self.load_prompt('audit_image').format(**_image_prompt_params(criteria, item_type, references, content)))]
+            model = settings.AI_VISION_MODEL or self.model
+        else:
+            template = self.load_prompt('audit_result')
+            prompts = [
+                (AUDIT_SYSTEM_ROLE, template.format(criteria=criteria, item_type=item_type, content=chunk, references=references))
+                for chunk in (chunks if chunks is not None else self.split_content(content, self.audit_content_budget(criteria, item_type, references)))
+            ]
+            model = self.model
+        requests = []
+        for system_role, prompt in prompts:
+            messages, estimated_tokens = self._build_messages(prompt, system_role, [image] if image else None)
+            if estimated_tokens > settings.AI_MAX_PROMPT_TOKENS:
+                raise PromptTooLargeError(estimated_tokens, settings.AI_MAX_PROMPT_TOKENS)
+            requests.append(({
+                "model": model,
+                "messages": messages,
+                "temperature": 0.3,
+                "response_format": {"type": "json_object"}
+            }, estimated_tokens))
+        return requests
+
+    async def confirm_audit_result(self, criteria: str, item_type: str, previous: dict, changes: str, confidence_threshold: Optional[float] = None) -> dict:
+        """
+        确认近似内容的已有审核结论是否仍然适用，提示词中只包含两份内容的差异
+        :param criteria: 审核标准
+        :param item_type: 审核项类型
+        :param previous: 已有审核结果（result、reason）
+        :param changes: 内容差异
+        :param confidence_threshold: 审核项的级联置信度阈值
+        :return: 审核结果
+        """
+        return await self._call_cascade(
+            confidence_threshold,
+            prompt_name='audit_confirm',
+            system_role="你是一名专业的智能审核专家，能够根据内容的变化判断已有审核结论是否仍然成立。",
             prompt_params={
                 'criteria': criteria,
                 'item_type': item_type,
-                'content': content
+                'previous_result': previous.get('result', ''),
+                'previous_reason': previous.get('reason') or '无',
+                'changes': changes
             },
-            error_message="Error generating audit result",
-            default_result={
-                "result": "warning",
-                "reason": "AI审核失败，建议人工复核",
-                "confidence": 0.5
-            }
+            error_message="Error confirming audit result",
+            default_result=CONFIRM_FALLBACK_RESULT
         )
-    
-    async def validate_rule(self, rule: dict, example_content: dict, audit_items: list) -> dict:
+
+    async def validate_rule(self, rule: dict, example_content, audit_items: list, reference_summary: str = "无") -> dict:
         """
-        规则校验
+        规则校验，文本内容超过单次提示词上限时分片校验后按审核项合并
         :param rule: 规则信息
-        :param example_content: 示例内容
+        :param example_content: 示例内容（文本或结构化内容）
         :param audit_items: 审核项列表
+        :param reference_summary: 参考资料要点
         :return: 校验结果
         """
         # 构建审核项描述
         items_desc = "\n".join([f"- {item['name']}（类型：{item['type']}）：{item['criteria']}" for item in audit_items])
+        system_role = "你是一名专业的智能审核规则校验专家，能够根据给定的规则和审核项，对示例内容进行准确校验。"
+        prompt_params = {
+            'rule_name': rule['name'],
+            'rule_description': rule.get('description') or '无',
+            'audit_items': items_desc,
+            'reference_summary': reference_summary or '无'
+        }
         
-        return await self._call_ai(
-            prompt_name='rule_validation',
-            system_role="你是一名专业的智能审核规则校验专家，能够根据给定的规则和审核项，对示例内容进行准确校验。",
-            prompt_params={
-                'rule_name': rule['name'],
-                'rule_description': rule.get('description', '无'),
-                'audit_items': items_desc,
-                'example_content': example_content
-            },
-            error_message="Error validating rule",
-            default_result={
-                "validation_results": [
-                    {
-                        "audit_item_name": item['name'],
-                        "result": "warning",
-                        "reason": "AI校验失败，建议人工复核",
-                        "suggestion": ""}
-                    for item in audit_items
-                ]
-            }
-        )
+        if isinstance(example_content, str):
+            chunks = self.split_content_for_prompt('rule_validation', system_role, example_content, content_key='example_content', **prompt_params)
+        else:
+            chunks = [example_content]
+        
+        results = []
+        for chunk in chunks:
+            results.append(await self._call_ai(
+                prompt_name='rule_validation',
+                system_role=system_role,
+                prompt_params={**prompt_params, 'example_content': chunk},
+                error_message="Error validating rule",
+                default_result={
+                    "validation_results": [
+                        {
+                            "audit_item_name": item['name'],
+                            "result": "warning",
+                            "reason": "AI校验失败，建议人工复核",
+                            "suggestion": ""}
+                        for item in audit_items
+                    ]
+                }
+            ))
+        if len(results) == 1:
+            return results[0]
+        
+        # 按审核项合并各分片的校验结论
+        by_item = {}
+        for result in results:
+            for item_result in result.get("validation_results", []):
+                by_item.setdefault(item_result.get("audit_item_name"), []).append(item_result)
+        merged = []
+        for name, item_results in by_item.items():
+            combined = merge_audit_results(item_results)
+            suggestions = [r.get("suggestion") for r in item_results if r.get("suggestion")]
+            merged.append({"audit_item_name": name, "result": combined["result"], "reason": combined["reason"], "suggestion": "\n".join(suggestions)})
+        usage = merge_audit_results(results)["usage"]
+        return {"validation_results": merged, "usage": usage}
+    
+    async def summarize_references(self, content: str) -> str:
+        """
+        提炼参考资料要点，供多个文件的校验共用；资料过长时分片并发提炼后拼接
+        :param content: 参考资料全文
+        :return: 要点文本
+        """
+        if not content.strip():
+            return "无"
+        system_role = "你是一名专业的智能审核专家，擅长从参考资料中提炼与审核相关的要点。"
+        chunks = self.split_content_for_prompt('reference_summary', system_role, content)
+        results = await asyncio.gather(*[
+            self._call_ai(
+                prompt_name='reference_summary',
+                system_role=system_role,
+                prompt_params={'content': chunk},
+                error_message="Error summarizing reference materials",
+                # 提炼失败时退回使用原文片段
+                default_result={"summary": chunk}
+            )
+            for chunk in chunks
+        ])
+        summary = "\n".join(str(result.get("summary", "")) for result in results)
+        # 要点会拼入每个文件的校验提示词，最多占用单次提示词上限的三分之一
+        return truncate_to_tokens(summary, settings.AI_MAX_PROMPT_TOKENS // 3, self.model)
     
     def load_prompt(self, prompt_name: str) -> str:
         """
@@ -147,7 +547,7 @@ class AIService:
             with open(prompt_path, 'r', encoding='utf-8') as f:
                 return f.read().strip()
         except Exception as e:
-            logger.error(f"Error loading prompt {prompt_name}: {sanitize_log_message(str(e))}")
+            logger.error("Error loading prompt %s: %s", prompt_name, e)
             # 返回默认提示词
             return "请根据要求优化执行逻辑。"
     
@@ -170,8 +570,8 @@ class AIService:
             原始执行逻辑：{original_prompt}
             """
             
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = await self._create_completion(
+                'execution_optimization',
                 messages=[
                     {"role": "system", "content": "你是一名专业的逻辑优化助手，擅长将模糊的执行目标转化为清晰、可操作、可分步骤执行的优化逻辑。"},
                     {"role": "user", "content": prompt}
@@ -181,26 +581,30 @@ class AIService:
             
             result = response.choices[0].message.content
             return result
-        except Exception as e:
-            print(f"Error in optimize_prompt: {e}")
+        except Exception:
+            logger.exception("Error in optimize_prompt")
+            ai_fallback_total.inc(provider=self.provider, prompt='execution_optimization')
             # 返回原始提示词作为降级方案
             return original_prompt
     
     def init_client(self):
         """初始化大模型客户端"""
+        self.ensure_config()
         try:
+            # 使用异步客户端，等待大模型响应时不阻塞事件循环，多个调用可以并发
             if self.provider == "openai" and self.api_key:
-                from openai import OpenAI
-                self.client = OpenAI(api_key=self.api_key, base_url=self.base_url if self.base_url else None)
+                from openai import AsyncOpenAI
+                self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url if self.base_url else None, max_retries=0)
             elif self.provider == "dashscope" and self.api_key:
-                from openai import OpenAI
-                self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+                from openai import AsyncOpenAI
+                self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
             else:
-                print(f"AI client not initialized. Provider: {self.provider}, API Key: {'Set' if self.api_key else 'Not Set'}")
-        except Exception as e:
-            print(f"Error initializing AI client: {e}")
-            self.client = None
+                self._client = None
+                logger.warning("AI client not initialized. Provider: %s, API Key: %s", self.provider, "Set" if self.api_key else "Not Set")
+        except Exception:
+            logger.exception("Error initializing AI client")
+            self._client = None
+        self._client_ready = True
 
-# 创建AI服务实例
-ai_service = AIService()
-ai_service.init_client()
\ No newline at end of file
+# 创建AI服务实例（配置与客户端延迟加载）
+ai_service = AIService()
\ No newline at end of file
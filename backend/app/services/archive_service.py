@@ -0,0 +1,269 @@
+import os
+import gzip
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+from app.core.config import settings
+from app.core.metrics import audit_archive_tasks_total
+from app.db.repository import WriteOp, get_repository
+from app.services.content_service import content_document, load_contents
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = ".jsonl.gz"
+
+# 写入归档文件时每批的行数
+WRITE_BATCH = 1000
+
+_scheduler: Optional[asyncio.Task] = None
+
+def archive_path(task: dict) -> str:
+    """任务的归档文件路径：按任务创建月份分目录，ARCHIVE_DIR/YYYY-MM/<task_id>.jsonl.gz"""
+    return os.path.join(settings.ARCHIVE_DIR, str(task["created_at"])[:7], f"{task['_id']}{ARCHIVE_SUFFIX}")
+
+def read_archive(path: str) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    读取归档文件
+    :param path: 归档文件路径
+    :return: (审核结果文档列表, 内容哈希 -> 审核内容)
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"归档文件不存在: {path}")
+    results, contents = [], {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            kind = record.pop("type")
+            if kind == "result":
+                results.append(record)
+            elif kind == "content":
+                contents[record["_id"]] = record["content"]
+    results.sort(key=lambda result: (result["created_at"], result["_id"]))
+    return results, contents
+
+async def load_archived_results(task: dict, include_content: bool = False) -> List[dict]:
+    """
+    从归档文件读取任务的审核结果（已归档任务的透明读取）
+    :param task: 任务字典
+    :param include_content: 是否填充审核内容原文
+    :return: 审核结果文档列表
+    """
+    results, contents = await asyncio.to_thread(read_archive, archive_path(task))
+    for result in results:
+        if include_content and result.get("content_hash") in contents:
+            result["content"] = contents[result["content_hash"]]
+        elif not include_content:
+            result.pop("content", None)
+    return results
+
+class ArchiveConflictError(Exception):
+    """任务正在被其他请求或节点归档、恢复"""
+
+async def _claim(task_id: str, filters: dict) -> Optional[str]:
+    """
+    归档或恢复前占用任务（archive_claim），同一任务的归档与恢复不会交错执行；
+    超过 ARCHIVE_CLAIM_TIMEOUT_SECONDS 的占用视为进程已退出，可以接管
+    :param task_id: 任务ID
+    :param filters: 占用时任务还需满足的条件
+    :return: 占用值，任务不满足条件或正被占用时返回None
+    """
+    repository = get_repository()
+    current = await repository.find_one("audit_tasks", {"_id": task_id, **filters}, ("archive_claim",))
+    if current is None:
+        return None
+    previous = current.get("archive_claim")
+    cutoff = (datetime.utcnow() - timedelta(seconds=settings.ARCHIVE_CLAIM_TIMEOUT_SECONDS)).isoformat()
+    if previous and json.loads(previous)["claimed_at"] > cutoff:
+        return None
+    value = json.dumps({"owner": uuid4().hex, "claimed_at": datetime.utcnow().isoformat()})
+    if await repository.update_one("audit_tasks", {"_id": task_id, **filters, "archive_claim": previous}, {"archive_claim": value}) is None:
+        return None
+    return value
+
+async def _release(task_id: str, claim: str):
+    await get_repository().update_many("audit_tasks", {"_id": task_id, "archive_claim": claim}, {"archive_claim": None})
+
+async def _write_archive(task: dict) -> List[tuple]:
+    """
+    把任务的审核结果与其引用的内容写入归档文件（先写临时文件再重命名）
+    :return: 写入的结果版本 (_id, updated_at)
+    """
+    path = archive_path(task)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid4().hex}.tmp"
+    f = await asyncio.to_thread(gzip.open, temp_path, "wt", encoding="utf-8")
+    try:
+        header = {key: task.get(key) for key in ("_id", "name", "scene_id", "created_at", "completed_at")}
+        lines = [json.dumps({"type": "task", **header}, ensure_ascii=False)]
+        versions, keys = [], set()
+        async for result in get_repository().stream("audit_results", {"task_id": task["_id"]}, sort=[("created_at", 1)]):
+            lines.append(json.dumps({"type": "result", **result}, ensure_ascii=False, default=str))
+            if result.get("content_hash"):
+                keys.add(result["content_hash"])
+            versions.append((result["_id"], result.get("updated_at")))
+            if len(lines) >= WRITE_BATCH:
+                await asyncio.to_thread(f.write, "\n".join(lines) + "\n")
+                lines = []
+        for key, content in (await load_contents(keys)).items():
+            lines.append(json.dumps({"type": "content", "_id": key, "content": content}, ensure_ascii=False))
+        await asyncio.to_thread(f.write, "\n".join(lines) + "\n")
+    except BaseException:
+        f.close()
+        os.remove(temp_path)
+        raise
+    await asyncio.to_thread(f.close)
+    os.replace(temp_path, path)
+    return versions
+
+async def archive_task(task: dict) -> Optional[int]:
+    """
+    归档已完成任务：先占用任务，再把结果写入归档文件，标记任务 archived_at 后只删除已写入归档的结果版本
+    （统计计数器不变；不再被引用的内容随之删除）。归档期间有结果被修改时补回已删除的结果并撤销归档
+    :param task: 任务字典
+    :return: 归档的结果数，任务状态已变化、正被占用或已被其他节点归档时返回None
+    """
+    repository = get_repository()
+    claim = await _claim(task["_id"], {"status": "completed", "archived_at": None})
+    if claim is None:
+        return None
+    path = archive_path(task)
+    try:
+        versions = await _write_archive(task)
+        archived = await repository.update_one(
+            "audit_tasks", {"_id": task["_id"], "status": "completed", "archive_claim": claim},
+            {"archived_at": datetime.utcnow().isoformat()}
+        )
+        if archived is None:
+            # 写归档期间任务被重新运行、删除或占用已过期；已被其他节点归档时文件是同一个，保留
+            current = await repository.find_one("audit_tasks", {"_id": task["_id"]}, ("archived_at",))
+            if not current or not current.get("archived_at"):
+                os.remove(path)
+            return None
+        for start in range(0, len(versions), WRITE_BATCH):
+            await repository.bulk_write([
+                WriteOp.delete("audit_results", {"_id": result_id, "task_id": task["_id"], "updated_at": updated_at})
+                for result_id, updated_at in versions[start:start + WRITE_BATCH]
+            ])
+        if await repository.count("audit_results", {"task_id": task["_id"]}):
+            # 仍为归档状态时补回（内容可能已随结果删除），计数器不变；修改后的结果保留
+            results, contents = await asyncio.to_thread(read_archive, path)
+            await repository.insert_missing("contents", [content_document(content) for content in contents.values()])
+            await repository.insert_missing("audit_results", results)
+            await repository.update_many("audit_tasks", {"_id": task["_id"]}, {"archived_at": None})
+            os.remove(path)
+            logger.warning("Results of task %s changed while archiving, archive discarded", task["_id"])
+            return None
+    finally:
+        await _release(task["_id"], claim)
+    audit_archive_tasks_total.inc(outcome="archived")
+    logger.info("Archived task %s: %d results -> %s", task["_id"], len(versions), path)
+    return len(versions)
+
+async def restore_task(task: dict) -> int:
+    """
+    把已归档任务的结果恢复到数据库并删除归档文件。恢复过程中任务仍为归档状态，统计计数器不变；
+    所属规则或审核项已被删除的结果不再恢复
+    :param task: 任务字典
+    :return: 恢复的结果数，已被其他请求恢复时返回0
+    """
+    repository = get_repository()
+    claim = await _claim(task["_id"], {})
+    if claim is None:
+        raise ArchiveConflictError("Audit task is being archived or restored")
+    try:
+        current = await repository.find_one("audit_tasks", {"_id": task["_id"]}, ("archived_at",))
+        if not current or not current.get("archived_at"):
+            return 0
+        count = await _restore_results(task)
+    finally:
+        await _release(task["_id"], claim)
+    return count
+
+async def _restore_results(task: dict) -> int:
+    repository = get_repository()
+    path = archive_path(task)
+    results, contents = await asyncio.to_thread(read_archive, path)
+    rule_ids = {
+        rule["_id"] for rule in await repository.find("rules", {"_id": list({result["rule_id"] for result in results})}, ("_id",))
+    }
+    item_ids = {
+        item["_id"] for item in await repository.find("audit_items", {"_id": list({result["audit_item_id"] for result in results})}, ("_id",))
+    }
+    results = [result for result in results if result["rule_id"] in rule_ids and result["audit_item_id"] in item_ids]
+
+    keys = {result.get("content_hash") for result in results}
+    await repository.insert_missing("contents", [
+        content_document(content) for key, content in contents.items() if key in keys
+    ])
+    # 上次恢复中断时可能已插入部分结果
+    await repository.delete_many("audit_results", {"task_id": task["_id"]})
+    for start in range(0, len(results), WRITE_BATCH):
+        await repository.insert_many("audit_results", results[start:start + WRITE_BATCH])
+    await repository.update_many("audit_tasks", {"_id": task["_id"]}, {"archived_at": None})
+    os.remove(path)
+    audit_archive_tasks_total.inc(outcome="restored")
+    logger.info("Restored task %s: %d results from %s", task["_id"], len(results), path)
+    return len(results)
+
+async def archive_old_tasks(older_than_days: Optional[int] = None, limit: Optional[int] = None) -> dict:
+    """
+    归档完成时间早于 older_than_days 天前的任务
+    :param older_than_days: 默认 ARCHIVE_AFTER_DAYS
+    :param limit: 本次最多归档的任务数，默认 ARCHIVE_BATCH_TASKS
+    :return: 归档摘要
+    """
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    limit = settings.ARCHIVE_BATCH_TASKS if limit is None else limit
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    repository = get_repository()
+    candidates = [
+        task async for task in repository.stream("audit_tasks", {"status": "completed", "archived_at": None})
+        if task.get("completed_at") and str(task["completed_at"]) <= cutoff
+    ]
+    candidates.sort(key=lambda task: str(task["completed_at"]))
+
+    summary = {"cutoff": cutoff, "tasks": 0, "results": 0, "failed": 0}
+    for task in candidates[:limit]:
+        try:
+            count = await archive_task(task)
+        except Exception:
+            logger.exception("Failed to archive task %s", task["_id"])
+            audit_archive_tasks_total.inc(outcome="failed")
+            summary["failed"] += 1
+            continue
+        if count is not None:
+            summary["tasks"] += 1
+            summary["results"] += count
+    return summary
+
+async def _archive_loop():
+    while True:
+        try:
+            summary = await archive_old_tasks()
+            if summary["tasks"] or summary["failed"]:
+                logger.info("Archive job finished: %s", summary)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Archive job failed")
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
+
+def start_archive_scheduler():
+    """ARCHIVE_ENABLED 时启动后台定时归档"""
+    global _scheduler
+    if settings.ARCHIVE_ENABLED and _scheduler is None:
+        _scheduler = asyncio.create_task(_archive_loop())
+
+async def stop_archive_scheduler():
+    """停止后台定时归档"""
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.cancel()
+        try:
+            await _scheduler
+        except asyncio.CancelledError:
+            pass
+        _scheduler = None
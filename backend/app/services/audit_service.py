@@ -0,0 +1,328 @@
+import json
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+from uuid import uuid4
+from app.db.repository import get_repository, using_sqlite
+from app.core.config import settings
+from app.core.metrics import audit_dedup_total
+from app.core.tracing import tracer
+from app.services.ai_service import ai_service
+from app.services.content_service import store_content
+from app.services.dedup_service import audit_key, describe_changes, find_duplicate, fingerprint_content, record_fingerprint
+from app.services.document_service import iter_documents
+from app.services.image_service import prepare_image
+from app.services.knowledge_service import format_passages, knowledge_base, retrieve_passages
+from app.services.reference_service import load_reference_rows, load_reference_texts
+from app.services.scheduler_service import llm_priority
+from app.services.token_service import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+TASK_COLUMNS = (
+    "_id", "name", "scene_id", "use_knowledge_base", "status", "created_at", "updated_at", "completed_at",
+    "files", "token_budget", "budget_action", "tokens_used", "archived_at", "batch_status", "batch"
+)
+# 审核内容按 content_hash 保存在 contents 中，不随结果列表读取（旧数据的 content 列仅在需要内容时读取）
+RESULT_COLUMNS = (
+    "_id", "task_id", "rule_id", "audit_item_id", "result", "reason", "ai_generated", "edited_by",
+    "created_at", "updated_at", "file_name", "estimated_tokens", "prompt_tokens", "completion_tokens", "reused_from",
+    "content_hash"
+)
+
+VALID_RESULTS = {"pass", "fail", "warning"}
+BUDGET_ACTIONS = {"pause", "truncate"}
+
+# 再次运行时从断点继续的任务状态
+RESUMABLE_STATUSES = {"paused", "failed"}
+
+# 知识库检索时查询中包含的待审核内容长度
+KB_QUERY_CONTENT_TOKENS = 200
+
+class _BudgetExceeded(Exception):
+    """任务token预算耗尽，终止剩余工作"""
+
+def task_from_document(document: dict) -> dict:
+    """将audit_tasks中的文档转换为任务字典（files、batch以JSON文本保存）"""
+    task = {column: document.get(column) for column in TASK_COLUMNS}
+    task["use_knowledge_base"] = bool(task["use_knowledge_base"])
+    task["files"] = json.loads(task["files"]) if task["files"] else []
+    task["batch"] = json.loads(task["batch"]) if task["batch"] else None
+    task["tokens_used"] = task["tokens_used"] or 0
+    return task
+
+def result_from_document(document: dict) -> dict:
+    """将audit_results中的文档转换为结果字典"""
+    result = {column: document.get(column) for column in RESULT_COLUMNS}
+    result["content"] = document.get("content") or None
+    result["ai_generated"] = bool(result["ai_generated"])
+    for column in ("estimated_tokens", "prompt_tokens", "completion_tokens"):
+        result[column] = result[column] or 0
+    return result
+
+async def get_task(task_id: str) -> Optional[dict]:
+    """
+    获取审核任务
+    :param task_id: 任务ID
+    :return: 任务字典，不存在时返回None
+    """
+    document = await get_repository().find_one("audit_tasks", {"_id": task_id}, TASK_COLUMNS)
+    return task_from_document(document) if document else None
+
+async def set_task_status(task_id: str, status: str):
+    """
+    更新任务状态
+    :param task_id: 任务ID
+    :param status: 新状态
+    """
+    now = datetime.utcnow().isoformat()
+    data = {"status": status, "updated_at": now}
+    if status == "completed":
+        data["completed_at"] = now
+    await get_repository().update_many("audit_tasks", {"_id": task_id}, data)
+
+async def load_scene_bundle(scene_id: str, preload_references: bool = False) -> List[dict]:
+    """
+    加载业务场景下的全部规则，用一次批量查询加载其审核项，再批量加载各规则的参考材料
+    :param scene_id: 业务场景ID
+    :param preload_references: 是否预先读取参考材料文本（reference_text），审核时不再逐次读取文件
+    :return: 规则列表，每个规则带 audit_items 与 reference_file_keys
+    """
+    repository = get_repository()
+    scene_rules = await repository.find("rules", {"scene_id": scene_id}, ("_id", "name", "description"), sort=[("created_at", 1)])
+    items = await repository.find(
+        "audit_items", {"rule_id": [rule["_id"] for rule in scene_rules]},
+        ("_id", "rule_id", "name", "type", "criteria", "confidence_threshold"), sort=[("created_at", 1)]
+    )
+    items_by_rule = {}
+    for item in items:
+        items_by_rule.setdefault(item.pop("rule_id"), []).append(item)
+    # 没有审核项的规则不参与审核
+    rules = {
+        rule["_id"]: {**rule, "audit_items": items_by_rule[rule["_id"]]}
+        for rule in scene_rules if rule["_id"] in items_by_rule
+    }
+
+    references = await load_reference_rows(rules)
+    texts = await load_reference_texts({rule_id: references.get(rule_id, []) for rule_id in rules}) if preload_references else {}
+    for rule_id, rule in rules.items():
+        rule["reference_file_keys"] = [file_key for _, file_key in references.get(rule_id, [])]
+        if preload_references:
+            rule["reference_text"] = texts[rule_id]
+    return list(rules.values())
+
+def normalize_result(value) -> str:
+    """大模型返回的审核结论，不在 pass / fail / warning 之内的按 warning 处理"""
+    value = str(value or "").strip().lower()
+    return value if value in VALID_RESULTS else "warning"
+
+def task_budget(task: dict) -> tuple:
+    """任务的token预算与超限处理方式，未设置时使用全局配置"""
+    budget = task.get("token_budget")
+    if budget is None:
+        budget = settings.TASK_TOKEN_BUDGET
+    action = task.get("budget_action") or settings.TASK_BUDGET_ACTION
+    return budget or 0, action if action in BUDGET_ACTIONS else "pause"
+
+async def item_references(task: dict, rule: dict, item: dict, query_content: str) -> str:
+    """
+    审核项的参考资料：使用知识库时按审核标准和内容开头检索相关片段（规则配置了参考材料时只在这些文件中检索），
+    否则使用预先读取的规则参考材料
+    :param query_content: 检索时附带的内容开头，每个文件截取一次
+    """
+    if task["use_knowledge_base"]:
+        passages = await retrieve_passages(
+            f"{item['name']} {item['criteria']}\n{query_content}",
+            file_keys=rule["reference_file_keys"] or None
+        )
+        return format_passages(passages)
+    return rule["reference_text"]
+
+async def completed_audits(task_id: str) -> Counter:
+    """
+    任务已保存的审核结果数，按 (文件名, 内容哈希, 审核项ID) 计数。
+    文件名相同但内容不同的文件分开计数；名称与内容都相同的文件按出现顺序逐个抵扣
+    :param task_id: 任务ID
+    :return: 计数
+    """
+    done = Counter()
+    async for row in get_repository().stream("audit_results", {"task_id": task_id}, ("file_name", "content_hash", "audit_item_id")):
+        done[(row["file_name"], row.get("content_hash"), row["audit_item_id"])] += 1
+    return done
+
+async def document_audit_items(task: dict, bundle: List[dict], document: dict, content_key: str, done: Counter) -> tuple:
+    """
+    文件尚未完成的 (规则, 审核项, 参考资料)，以及其中最小的内容token空间：
+    文本内容按该空间只切分一次，供该文件的各审核项共用
+    :param task: 任务字典
+    :param bundle: load_scene_bundle 加载的规则
+    :param document: iter_documents 解析出的文件
+    :param content_key: 文件内容的哈希
+    :param done: completed_audits 的计数，已完成的审核项从中抵扣
+    :return: (待审核列表, 内容token空间)
+    """
+    query_content = truncate_to_tokens(document["content"], KB_QUERY_CONTENT_TOKENS) if task["use_knowledge_base"] else ""
+    pending = []
+    for rule in bundle:
+        for item in rule["audit_items"]:
+            key = (document["name"], content_key, item["_id"])
+            if done[key] > 0:
+                done[key] -= 1
+                continue
+            pending.append((rule, item, await item_references(task, rule, item, query_content)))
+    available = min((ai_service.audit_content_budget(item["criteria"], item["type"], references) for _, item, references in pending), default=0)
+    return pending, available
+
+async def _find_reusable(document: dict, fingerprint: Optional[dict], item: dict, references: str) -> tuple:
+    """
+    查找可复用结论的已有审核结果
+    :return: (审核键, 已有结果, 内容差异)：已有结果为None时需要完整审核，差异为None时直接复用结论，否则用差异确认
+    """
+    if fingerprint is None:
+        return None, None, None
+    key = audit_key(item["_id"], item["criteria"], item["type"], references)
+    match = await find_duplicate(key, fingerprint)
+    # 图片按文件哈希指纹，只有完全相同的图片才复用
+    if match is not None and document["kind"] == "image" and match["similarity"] < 1.0:
+        match = None
+    if match is None:
+        audit_dedup_total.inc(outcome="miss")
+        return key, None, None
+    if match["similarity"] >= 1.0 or settings.AUDIT_DEDUP_MODE == "reuse":
+        audit_dedup_total.inc(outcome="exact" if match["similarity"] >= 1.0 else "reused")
+        return key, match, None
+    changes = describe_changes(match["content"], document["content"])
+    if changes is None:
+        audit_dedup_total.inc(outcome="too_different")
+        return key, None, None
+    return key, match, changes
+
+async def run_task(task: dict) -> dict:
+    """
+    执行审核任务：解析任务文件，逐个审核项调用大模型并保存结果。
+    暂停或失败的任务再次运行时跳过已完成的 (文件, 审核项)，文件按名称与内容哈希识别，其余情况重新审核。
+    任务内的大模型调用按批量优先级调度，与其他场景、任务公平分享调用名额。
+    :param task: 任务字典
+    :return: 执行摘要
+    """
+    task_id = task["_id"]
+    repository = get_repository()
+    budget, budget_action = task_budget(task)
+    with llm_priority("bulk", scene_id=task["scene_id"], task_id=task_id), \
+            tracer.span("audit_task.run", **{"task.id": task_id, "scene.id": task["scene_id"], "task.token_budget": budget}) as span:
+        resume = task["status"] in RESUMABLE_STATUSES
+        tokens_used = task.get("tokens_used", 0) if resume else 0
+        done = await completed_audits(task_id) if resume else Counter()
+        if not resume:
+            await repository.delete_many("audit_results", {"task_id": task_id})
+            await repository.update_many("audit_tasks", {"_id": task_id}, {"tokens_used": 0})
+        await set_task_status(task_id, "running")
+
+        final_status = "completed"
+        total = 0
+        try:
+            with tracer.span("audit_task.load_rules"):
+                bundle = await load_scene_bundle(task["scene_id"], preload_references=not task["use_knowledge_base"])
+            if task["use_knowledge_base"]:
+                # 规则的参考材料尚未加入知识库时先建立索引
+                await asyncio.to_thread(knowledge_base.ensure_indexed, {key for rule in bundle for key in rule["reference_file_keys"]})
+
+            span.set_attribute("task.documents", len(task["files"]))
+            # 重复内容索引保存在本地SQLite中，业务数据使用其他存储后端时不复用结论
+            dedup = settings.AUDIT_DEDUP_MODE in ("reuse", "confirm") and using_sqlite()
+
+            # 逐个文件审核，后续文件（含扫描件OCR）在审核当前文件期间提前解析
+            async for document in iter_documents(task["files"]):
+                # 图片缩放编码一次，供该图片的所有审核项共用
+                image = await prepare_image(document["path"]) if document["kind"] == "image" else None
+                # 文件内容只保存一份，该文件的各条审核结果按哈希引用
+                content_key = await store_content(document["content"])
+                # 内容指纹与审核项无关，每个文件只计算一次
+                fingerprint = None
+                if dedup:
+                    fingerprint = await asyncio.to_thread(fingerprint_content, f"image:{image['file_hash']}" if image else document["content"])
+                # 先检索各审核项的参考资料；文本内容在第一次需要完整审核时按最小的内容空间切分一次，token数也只估算一次
+                pending, available = await document_audit_items(task, bundle, document, content_key, done)
+                chunks = None
+                content_tokens = await asyncio.to_thread(estimate_tokens, document["content"]) if budget and pending else 0
+                for rule, item, references in pending:
+                    # 相同或近似内容在同一审核项下已有结论时复用或只确认差异
+                    key, match, changes = await _find_reusable(document, fingerprint, item, references)
+
+                    # 调用前按本地预估检查预算，超出时暂停或截断剩余工作
+                    if budget:
+                        if match is None:
+                            expected = content_tokens + estimate_tokens(item["criteria"]) + estimate_tokens(references) + (image["tokens"] if image else 0)
+                        elif changes is None:
+                            expected = 0
+                        else:
+                            expected = estimate_tokens(changes) + estimate_tokens(item["criteria"]) + estimate_tokens(match["reason"] or "")
+                        if tokens_used + expected > budget:
+                            final_status = "paused" if budget_action == "pause" else "completed"
+                            logger.warning("Task token budget exceeded (%d + %d > %d), action: %s", tokens_used, expected, budget, budget_action)
+                            span.add_event("budget_exceeded", tokens_used=tokens_used, expected=expected, budget=budget)
+                            raise _BudgetExceeded()
+
+                    with tracer.span("audit_task.audit_item", **{"rule.id": rule["_id"], "audit_item.id": item["_id"], "document.name": document["name"]}) as item_span:
+                        if match is None and image:
+                            ai_result = await ai_service.generate_image_audit_result(image, item["criteria"], item["type"], references, document["content"])
+                        elif match is None:
+                            if chunks is None:
+                                chunks = await asyncio.to_thread(ai_service.split_content, document["content"], available)
+                            ai_result = await ai_service.generate_audit_result(
+                                document["content"], item["criteria"], item["type"], references, item.get("confidence_threshold"), chunks
+                            )
+                        elif changes is None:
+                            ai_result = {"result": match["result"], "reason": match["reason"]}
+                        else:
+                            ai_result = await ai_service.confirm_audit_result(item["criteria"], item["type"], match, changes, item.get("confidence_threshold"))
+                            audit_dedup_total.inc(outcome="confirmed" if normalize_result(ai_result.get("result")) == match["result"] else "revised")
+                        item_span.set_attribute("audit.escalated", bool(ai_result.get("escalated")))
+                        if match is not None:
+                            item_span.set_attribute("audit.reused_from", match["result_id"])
+                            item_span.set_attribute("audit.similarity", match["similarity"])
+
+                    usage = ai_result.get("usage") or {}
+                    spent = (usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)) or usage.get("estimated_tokens", 0)
+                    tokens_used += spent
+
+                    with tracer.span("audit_task.persist_result"):
+                        now = datetime.utcnow().isoformat()
+                        result_id = str(uuid4())
+                        await repository.insert_one("audit_results", {
+                            "_id": result_id,
+                            "task_id": task_id,
+                            "rule_id": rule["_id"],
+                            "audit_item_id": item["_id"],
+                            "content": "",
+                            "content_hash": content_key,
+                            "result": normalize_result(ai_result.get("result")),
+                            "reason": ai_result.get("reason", ""),
+                            "ai_generated": True,
+                            "created_at": now,
+                            "updated_at": now,
+                            "file_name": document["name"],
+                            "estimated_tokens": usage.get("estimated_tokens", 0),
+                            "prompt_tokens": usage.get("prompt_tokens", 0),
+                            "completion_tokens": usage.get("completion_tokens", 0),
+                            "reused_from": match["result_id"] if match else None
+                        })
+                        await repository.increment("audit_tasks", {"_id": task_id}, "tokens_used", spent)
+                        # 复用的结果同样记录指纹，原始结果被删除后仍可匹配；调用失败时的默认结论不记录，避免被后续审核复用
+                        if key is not None and not ai_result.get("fallback"):
+                            await record_fingerprint(result_id, key, fingerprint)
+                    total += 1
+        except _BudgetExceeded:
+            pass
+        except Exception:
+            await set_task_status(task_id, "failed")
+            raise
+        finally:
+            span.set_attribute("task.results", total)
+            span.set_attribute("task.tokens_used", tokens_used)
+
+        await set_task_status(task_id, final_status)
+        logger.info("Audit task %s with %d results, %d tokens used", final_status, total, tokens_used)
+        return {"task_id": task_id, "status": final_status, "total_results": total, "tokens_used": tokens_used, "token_budget": budget}
@@ -0,0 +1,546 @@
+import os
+import json
+import asyncio
+import logging
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+import httpx
+from app.core.config import settings
+from app.core.metrics import ai_batch_requests_total, ai_fallback_total, ai_tokens_total
+from app.db.repository import get_repository
+from app.services.ai_service import AUDIT_FALLBACK_RESULT, ai_service, merge_audit_results
+from app.services.audit_service import (
+    RESUMABLE_STATUSES,
+    TASK_COLUMNS,
+    completed_audits,
+    document_audit_items,
+    load_scene_bundle,
+    normalize_result,
+    task_budget,
+    task_from_document
+)
+from app.services.content_service import store_content
+from app.services.document_service import iter_documents
+from app.services.image_service import prepare_image
+from app.services.knowledge_service import knowledge_base
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# 服务端批次的结束状态
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# 任务的批量审核状态：preparing 生成并提交请求 / submitted 等待服务端完成 / ingesting 导入结果 /
+# completed 全部完成 / incomplete 部分请求过期或被取消（任务暂停，可再次运行继续） / failed 批次全部失败
+ACTIVE_BATCH_STATUSES = {"preparing", "submitted", "ingesting"}
+
+# 由某个进程占用任务处理中的状态，进程退出后由 recover_stale_batches 恢复
+CLAIMED_BATCH_STATUSES = ("preparing", "ingesting")
+
+# 批次过期或被取消时未执行的请求，不写入结果，再次运行任务时重新审核
+UNFINISHED_ERROR_CODES = {"batch_expired", "batch_cancelled"}
+
+# 写入请求文件、导入结果时每批的行数
+WRITE_BATCH = 1000
+
+_poller: Optional[asyncio.Task] = None
+
+class BatchConflictError(Exception):
+    """任务正在运行或已有进行中的批次"""
+
+class _BatchClaim:
+    """
+    提交或导入批次时对任务的占用，保存在 batch_claim 中：占用者、占用时间及提交前的任务状态。
+    处理过程中定期续期，超过 AI_BATCH_CLAIM_TIMEOUT_SECONDS 未续期的占用视为进程已退出
+    """
+    def __init__(self, task_id: str, phase: str, previous: Optional[dict] = None):
+        self.task_id = task_id
+        self._data = {"phase": phase, "owner": uuid4().hex, **(previous or {})}
+        self.value = self._dump()
+        self._renewed_at = time.monotonic()
+
+    def _dump(self) -> str:
+        self._data["claimed_at"] = datetime.utcnow().isoformat()
+        return json.dumps(self._data, ensure_ascii=False)
+
+    async def renew(self):
+        """距上次续期超过超时时间的四分之一时续期；占用已被恢复时抛出 BatchConflictError"""
+        if time.monotonic() - self._renewed_at < settings.AI_BATCH_CLAIM_TIMEOUT_SECONDS / 4:
+            return
+        value = self._dump()
+        if await get_repository().update_one("audit_tasks", {"_id": self.task_id, "batch_claim": self.value}, {"batch_claim": value}) is None:
+            raise BatchConflictError("Audit task batch claim expired")
+        self.value = value
+        self._renewed_at = time.monotonic()
+
+def _api_client() -> httpx.AsyncClient:
+    """访问当前配置的大模型服务 Files / Batches 接口的HTTP客户端"""
+    ai_service.ensure_config()
+    if not ai_service.api_key:
+        raise RuntimeError("请配置AI API密钥以使用批量审核")
+    return httpx.AsyncClient(
+        base_url=(ai_service.base_url or "https://api.openai.com/v1").rstrip("/"),
+        headers={"Authorization": f"Bearer {ai_service.api_key}"},
+        timeout=httpx.Timeout(60.0, read=600.0)
+    )
+
+async def _request(client: httpx.AsyncClient, method: str, path: str, **kwargs) -> dict:
+    response = await client.request(method, path, **kwargs)
+    if response.status_code >= 400:
+        raise RuntimeError(f"批量接口 {method} {path} 返回 {response.status_code}: {response.text[:500]}")
+    return response.json()
+
+def _custom_id(document_index: int, item_id: str, chunk: int, chunks: int, estimated_tokens: int) -> str:
+    """请求标识：文件序号、审核项、分片序号/分片数与本地预估token数，导入时据此还原审核结果"""
+    return f"{document_index}:{item_id}:{chunk}:{chunks}:{estimated_tokens}"
+
+def _parse_custom_id(custom_id: str) -> tuple:
+    document_index, item_id, chunk, chunks, estimated_tokens = custom_id.split(":")
+    return int(document_index), item_id, int(chunk), int(chunks), int(estimated_tokens)
+
+class _RequestWriter:
+    """把批量请求逐行写入JSONL临时文件，达到单批次的请求数或文件大小上限时换一个文件"""
+    def __init__(self):
+        self.files: List[list] = []
+        self._lines: List[bytes] = []
+        self._f = None
+        self._max_bytes = settings.AI_BATCH_MAX_FILE_MB * 1024 * 1024
+
+    async def write(self, custom_id: str, body: dict):
+        line = (json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}, ensure_ascii=False) + "\n").encode("utf-8")
+        if self._f is None or self.files[-1][1] >= settings.AI_BATCH_MAX_REQUESTS or self.files[-1][2] + len(line) > self._max_bytes:
+            await self._open()
+        self._lines.append(line)
+        self.files[-1][1] += 1
+        self.files[-1][2] += len(line)
+        if len(self._lines) >= WRITE_BATCH:
+            await self._flush()
+
+    async def _flush(self):
+        if self._lines:
+            await asyncio.to_thread(self._f.write, b"".join(self._lines))
+            self._lines = []
+
+    async def _open(self):
+        await self.close()
+        fd, path = tempfile.mkstemp(prefix="audit-batch-", suffix=".jsonl")
+        self._f = os.fdopen(fd, "wb")
+        self.files.append([path, 0, 0])
+
+    async def close(self):
+        if self._f is not None:
+            await self._flush()
+            self._f.close()
+            self._f = None
+
+    def remove(self):
+        for path, _, _ in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+
+async def _cancel_batches(client: httpx.AsyncClient, batches: List[dict]):
+    """取消已创建的批次，避免产生无人导入的结果"""
+    for batch in batches:
+        try:
+            await _request(client, "POST", f"/batches/{batch['id']}/cancel")
+        except Exception:
+            logger.exception("Failed to cancel batch %s", batch["id"])
+
+async def _write_requests(task: dict, writer: _RequestWriter, budget: int, done: Counter, claim: _BatchClaim) -> tuple:
+    """
+    解析任务文件并为每个 (文件, 审核项) 生成审核请求
+    :return: (文件列表 [{name, content_hash}], 请求数, 预估token数)
+    """
+    bundle = await load_scene_bundle(task["scene_id"], preload_references=not task["use_knowledge_base"])
+    if task["use_knowledge_base"]:
+        await asyncio.to_thread(knowledge_base.ensure_indexed, {key for rule in bundle for key in rule["reference_file_keys"]})
+
+    documents, count, expected = [], 0, task.get("tokens_used", 0)
+    async for document in iter_documents(task["files"]):
+        await claim.renew()
+        image = await prepare_image(document["path"]) if document["kind"] == "image" else None
+        content_key = await store_content(document["content"])
+        documents.append({"name": document["name"], "content_hash": content_key})
+        # 文本内容只切分一次，供该文件的各审核项共用
+        pending, available = await document_audit_items(task, bundle, document, content_key, done)
+        chunks = await asyncio.to_thread(ai_service.split_content, document["content"], available) if pending and not image else None
+        for _, item, references in pending:
+            requests = await asyncio.to_thread(ai_service.build_audit_requests, document["content"], item["criteria"], item["type"], references, image, chunks)
+            for chunk, (body, estimated_tokens) in enumerate(requests):
+                await writer.write(_custom_id(len(documents) - 1, item["_id"], chunk, len(requests), estimated_tokens), body)
+                expected += estimated_tokens
+                count += 1
+        if budget and expected > budget:
+            raise ValueError(f"批量审核预估需要的token超过任务预算（{expected} > {budget}）")
+    return documents, count, expected
+
+async def submit_batch(task: dict) -> dict:
+    """
+    以离线批量方式运行审核任务：把全部 (文件, 审核项) 的审核请求写成JSONL，上传并创建 Batch API 批次
+    （请求数或文件大小超过单批次上限时拆成多个批次），结果在批次完成后由 refresh_batch 导入。
+    暂停或失败的任务只提交尚未完成的审核项，其余情况重新审核。批量审核不经过模型级联，也不复用重复内容的结论
+    :param task: 任务字典
+    :return: 提交摘要
+    """
+    task_id = task["_id"]
+    repository = get_repository()
+    if task["status"] == "running" or task.get("batch_status") in ACTIVE_BATCH_STATUSES:
+        raise BatchConflictError("Audit task is already running")
+    claim = _BatchClaim(task_id, "preparing", {"status": task["status"], "batch_status": task.get("batch_status")})
+    claimed = await repository.update_one(
+        "audit_tasks", {"_id": task_id, "status": task["status"]},
+        {"status": "running", "batch_status": "preparing", "batch_claim": claim.value, "updated_at": datetime.utcnow().isoformat()}
+    )
+    if claimed is None:
+        raise BatchConflictError("Audit task changed while submitting")
+
+    resume = task["status"] in RESUMABLE_STATUSES
+    writer = _RequestWriter()
+    batches = []
+    try:
+        done = await completed_audits(task_id) if resume else Counter()
+        budget, _ = task_budget(task)
+        documents, count, expected = await _write_requests({**task, "tokens_used": task.get("tokens_used", 0) if resume else 0}, writer, budget, done, claim)
+        await writer.close()
+        if not count:
+            raise ValueError("任务没有需要审核的内容")
+
+        async with _api_client() as client:
+            try:
+                for path, requests, _ in writer.files:
+                    await claim.renew()
+                    with open(path, "rb") as f:
+                        input_file = await _request(client, "POST", "/files", data={"purpose": "batch"}, files={"file": (os.path.basename(path), f, "application/jsonl")})
+                    batch = await _request(client, "POST", "/batches", json={
+                        "input_file_id": input_file["id"],
+                        "endpoint": BATCH_ENDPOINT,
+                        "completion_window": settings.AI_BATCH_COMPLETION_WINDOW,
+                        "metadata": {"task_id": task_id}
+                    })
+                    batches.append({
+                        "id": batch["id"], "status": batch.get("status", "validating"), "input_file_id": input_file["id"],
+                        "output_file_id": None, "error_file_id": None, "requests": requests
+                    })
+            except Exception:
+                # 部分批次已创建时取消
+                await _cancel_batches(client, batches)
+                raise
+    except BaseException:
+        await repository.update_many("audit_tasks", {"_id": task_id, "batch_claim": claim.value}, {
+            "status": task["status"], "batch_status": task.get("batch_status"), "batch_claim": None,
+            "updated_at": datetime.utcnow().isoformat()
+        })
+        raise
+    finally:
+        await writer.close()
+        writer.remove()
+
+    # 重新审核时任务原有的结果与token用量在导入结果时清除，提交中断时任务可以原样恢复
+    info = {
+        "batches": batches,
+        "documents": documents,
+        "requests": count,
+        "estimated_tokens": expected,
+        "resume": resume,
+        "submitted_at": datetime.utcnow().isoformat()
+    }
+    submitted = await repository.update_one(
+        "audit_tasks", {"_id": task_id, "batch_claim": claim.value},
+        {"batch_status": "submitted", "batch": json.dumps(info, ensure_ascii=False), "batch_claim": None}
+    )
+    if submitted is None:
+        async with _api_client() as client:
+            await _cancel_batches(client, batches)
+        raise BatchConflictError("Audit task batch claim expired")
+    ai_batch_requests_total.inc(count, outcome="submitted")
+    logger.info("Submitted audit task %s as %d batches with %d requests", task_id, len(batches), count)
+    return {"task_id": task_id, "status": "running", "batch_status": "submitted", "batches": [batch["id"] for batch in batches], "requests": count}
+
+async def _iter_output(client: httpx.AsyncClient, file_id: Optional[str]) -> AsyncIterator[dict]:
+    """逐行读取批次的输出/错误文件"""
+    if not file_id:
+        return
+    async with client.stream("GET", f"/files/{file_id}/content") as response:
+        if response.status_code >= 400:
+            raise RuntimeError(f"读取批次结果文件 {file_id} 失败: {response.status_code}")
+        async for line in response.aiter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+def _parse_record(record: dict, estimated_tokens: int) -> Optional[dict]:
+    """
+    解析一行批次结果
+    :return: 审核结果；请求因批次过期或取消未执行时返回None
+    """
+    error = record.get("error") or {}
+    if error.get("code") in UNFINISHED_ERROR_CODES:
+        ai_batch_requests_total.inc(outcome="unfinished")
+        return None
+    response = record.get("response") or {}
+    body = response.get("body") if response.get("status_code") == 200 else None
+    usage = (body or {}).get("usage") or {}
+    usage = {
+        "estimated_tokens": estimated_tokens,
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0
+    }
+    try:
+        result = json.loads(body["choices"][0]["message"]["content"])
+        if not isinstance(result, dict):
+            raise ValueError("审核结果不是JSON对象")
+    except Exception:
+        logger.warning("Batch request %s failed: %s", record.get("custom_id"), error or response.get("body"))
+        ai_batch_requests_total.inc(outcome="failed")
+        ai_fallback_total.inc(provider=ai_service.provider, prompt="audit_batch")
+        return {**AUDIT_FALLBACK_RESULT, "fallback": True, "usage": usage}
+    ai_batch_requests_total.inc(outcome="succeeded")
+    model = body.get("model") or ai_service.model
+    ai_tokens_total.inc(usage["prompt_tokens"], provider=ai_service.provider, model=model, kind="prompt")
+    ai_tokens_total.inc(usage["completion_tokens"], provider=ai_service.provider, model=model, kind="completion")
+    result["usage"] = usage
+    return result
+
+async def _ingest(client: httpx.AsyncClient, task: dict, info: dict, claim: _BatchClaim) -> tuple:
+    """
+    读取各批次的输出与错误文件并批量写入审核结果；同一审核项的多个内容分片全部返回后合并为一条结果，
+    所属规则或审核项已被删除的结果不再写入。写入前先清除任务原有的结果（重新审核时）
+    或上次中断的导入已写入的结果（继续审核时）
+    :return: (导入摘要, 写入的结果ID列表)
+    """
+    task_id = task["_id"]
+    repository = get_repository()
+    if info.get("resume", True):
+        stale = [
+            row["_id"] async for row in repository.stream("audit_results", {"task_id": task_id}, ("_id", "created_at"))
+            if row["created_at"] >= info["submitted_at"]
+        ]
+        for start in range(0, len(stale), WRITE_BATCH):
+            await repository.delete_many("audit_results", {"_id": stale[start:start + WRITE_BATCH]})
+    else:
+        await repository.delete_many("audit_results", {"task_id": task_id})
+    rule_ids = [rule["_id"] for rule in await repository.find("rules", {"scene_id": task["scene_id"]}, ("_id",))]
+    item_rules = {item["_id"]: item["rule_id"] for item in await repository.find("audit_items", {"rule_id": rule_ids}, ("_id", "rule_id"))}
+
+    pending: Dict[tuple, dict] = {}
+    rows, inserted = [], []
+    summary = {"results": 0, "unfinished": 0, "skipped": 0, "tokens_used": 0}
+
+    async def flush():
+        await claim.renew()
+        if rows:
+            await repository.insert_many("audit_results", rows)
+            inserted.extend(row["_id"] for row in rows)
+            rows.clear()
+
+    try:
+        for batch in info["batches"]:
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                async for record in _iter_output(client, file_id):
+                    document_index, item_id, chunk, chunks, estimated_tokens = _parse_custom_id(record["custom_id"])
+                    parts = pending.setdefault((document_index, item_id), {})
+                    parts[chunk] = _parse_record(record, estimated_tokens)
+                    if len(parts) < chunks:
+                        continue
+                    del pending[(document_index, item_id)]
+                    results = [parts[index] for index in range(chunks)]
+                    if any(result is None for result in results):
+                        summary["unfinished"] += 1
+                        continue
+                    if item_id not in item_rules:
+                        summary["skipped"] += 1
+                        continue
+                    ai_result = results[0] if chunks == 1 else merge_audit_results(results)
+                    usage = ai_result.get("usage") or {}
+                    summary["tokens_used"] += (usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)) or usage.get("estimated_tokens", 0)
+                    now = datetime.utcnow().isoformat()
+                    document = info["documents"][document_index]
+                    rows.append({
+                        "_id": str(uuid4()),
+                        "task_id": task_id,
+                        "rule_id": item_rules[item_id],
+                        "audit_item_id": item_id,
+                        "content": "",
+                        "content_hash": document["content_hash"],
+                        "result": normalize_result(ai_result.get("result")),
+                        "reason": ai_result.get("reason", ""),
+                        "ai_generated": True,
+                        "created_at": now,
+                        "updated_at": now,
+                        "file_name": document["name"],
+                        "estimated_tokens": usage.get("estimated_tokens", 0),
+                        "prompt_tokens": usage.get("prompt_tokens", 0),
+                        "completion_tokens": usage.get("completion_tokens", 0),
+                        "reused_from": None
+                    })
+                    summary["results"] += 1
+                    if len(rows) >= WRITE_BATCH:
+                        await flush()
+        await flush()
+    except BaseException:
+        # 导入失败时删除本次已写入的结果，下次轮询重新导入
+        for start in range(0, len(inserted), WRITE_BATCH):
+            await repository.delete_many("audit_results", {"_id": inserted[start:start + WRITE_BATCH]})
+        raise
+    # 分片没有全部返回的审核项按未完成处理
+    summary["unfinished"] += len(pending)
+    return summary, inserted
+
+async def refresh_batch(task: dict) -> dict:
+    """
+    查询任务各批次在服务端的状态，全部结束后导入结果并结束任务：全部完成时任务为 completed，
+    有请求过期或被取消时任务暂停（再次运行时只审核未完成的部分），批次全部失败时任务失败
+    :param task: 任务字典
+    :return: 任务最新的批量审核状态
+    """
+    task_id = task["_id"]
+    repository = get_repository()
+    info = task.get("batch")
+    if task.get("batch_status") != "submitted" or not info:
+        return {"task_id": task_id, "status": task["status"], "batch_status": task.get("batch_status"), "batch": info}
+
+    async with _api_client() as client:
+        for batch in info["batches"]:
+            if batch["status"] in TERMINAL_STATUSES:
+                continue
+            remote = await _request(client, "GET", f"/batches/{batch['id']}")
+            batch.update(
+                status=remote.get("status", batch["status"]),
+                output_file_id=remote.get("output_file_id"),
+                error_file_id=remote.get("error_file_id"),
+                request_counts=remote.get("request_counts")
+            )
+        data = {"batch": json.dumps(info, ensure_ascii=False)}
+        if not all(batch["status"] in TERMINAL_STATUSES for batch in info["batches"]):
+            await repository.update_many("audit_tasks", {"_id": task_id, "batch_status": "submitted"}, data)
+            return {"task_id": task_id, "status": task["status"], "batch_status": "submitted", "batch": info}
+
+        # 多个节点同时轮询时只由一个节点导入
+        claim = _BatchClaim(task_id, "ingesting")
+        if await repository.update_one(
+            "audit_tasks", {"_id": task_id, "batch_status": "submitted"}, {**data, "batch_status": "ingesting", "batch_claim": claim.value}
+        ) is None:
+            current = task_from_document(await repository.find_one("audit_tasks", {"_id": task_id}, TASK_COLUMNS) or {**task, "batch": None})
+            return {"task_id": task_id, "status": current["status"], "batch_status": current.get("batch_status"), "batch": current.get("batch") or info}
+        try:
+            summary, inserted = await _ingest(client, task, info, claim)
+        except BaseException:
+            await repository.update_many("audit_tasks", {"_id": task_id, "batch_claim": claim.value}, {"batch_status": "submitted", "batch_claim": None})
+            raise
+
+    if all(batch["status"] == "completed" for batch in info["batches"]) and not summary["unfinished"]:
+        status, batch_status = "completed", "completed"
+    elif all(batch["status"] == "failed" for batch in info["batches"]):
+        status, batch_status = "failed", "failed"
+    else:
+        status, batch_status = "paused", "incomplete"
+    info["summary"] = summary
+    now = datetime.utcnow().isoformat()
+    values = {
+        "status": status, "updated_at": now, "batch_status": batch_status, "batch": json.dumps(info, ensure_ascii=False), "batch_claim": None,
+        "tokens_used": (task["tokens_used"] if info.get("resume", True) else 0) + summary["tokens_used"]
+    }
+    if status == "completed":
+        values["completed_at"] = now
+    # 状态、token用量与批次信息一次写入，导入中断后重新导入不会重复计数
+    if await repository.update_one("audit_tasks", {"_id": task_id, "batch_claim": claim.value}, values) is None:
+        for start in range(0, len(inserted), WRITE_BATCH):
+            await repository.delete_many("audit_results", {"_id": inserted[start:start + WRITE_BATCH]})
+        raise BatchConflictError("Audit task batch claim expired")
+    logger.info("Ingested batch results of task %s: %s, status %s", task_id, summary, status)
+    return {"task_id": task_id, "status": status, "batch_status": batch_status, "batch": info}
+
+async def cancel_batch(task: dict) -> dict:
+    """
+    取消任务进行中的批次。服务端取消完成后，已执行的请求仍由 refresh_batch 导入，任务暂停
+    :param task: 任务字典
+    :return: 任务最新的批量审核状态
+    """
+    info = task.get("batch")
+    if task.get("batch_status") != "submitted" or not info:
+        raise ValueError("Audit task has no batch in progress")
+    async with _api_client() as client:
+        for batch in info["batches"]:
+            if batch["status"] not in TERMINAL_STATUSES:
+                remote = await _request(client, "POST", f"/batches/{batch['id']}/cancel")
+                batch["status"] = remote.get("status", "cancelling")
+    await get_repository().update_many("audit_tasks", {"_id": task["_id"], "batch_status": "submitted"}, {"batch": json.dumps(info, ensure_ascii=False)})
+    return {"task_id": task["_id"], "status": task["status"], "batch_status": "submitted", "batch": info}
+
+async def recover_stale_batches(task_id: Optional[str] = None) -> int:
+    """
+    恢复提交或导入过程中进程退出而遗留的任务：占用超过 AI_BATCH_CLAIM_TIMEOUT_SECONDS 未续期时，
+    preparing 的任务恢复为提交前的状态，ingesting 的任务恢复为 submitted，由下次查询或轮询重新导入
+    :param task_id: 只检查指定任务，为空时检查全部任务
+    :return: 恢复的任务数
+    """
+    repository = get_repository()
+    filters = {"batch_status": list(CLAIMED_BATCH_STATUSES)}
+    if task_id is not None:
+        filters["_id"] = task_id
+    cutoff = (datetime.utcnow() - timedelta(seconds=settings.AI_BATCH_CLAIM_TIMEOUT_SECONDS)).isoformat()
+    recovered = 0
+    for document in await repository.find("audit_tasks", filters, ("_id", "batch_status", "batch_claim")):
+        claim = json.loads(document["batch_claim"]) if document.get("batch_claim") else {}
+        if claim.get("claimed_at", "") > cutoff:
+            continue
+        if document["batch_status"] == "preparing":
+            values = {"status": claim.get("status") or "pending", "batch_status": claim.get("batch_status")}
+        else:
+            values = {"batch_status": "submitted"}
+        values.update(batch_claim=None, updated_at=datetime.utcnow().isoformat())
+        # 恢复前占用未被续期或释放时才写入
+        current = {"_id": document["_id"], "batch_status": document["batch_status"], "batch_claim": document.get("batch_claim")}
+        if await repository.update_one("audit_tasks", current, values) is not None:
+            logger.warning("Recovered audit task %s stuck in batch status %s", document["_id"], document["batch_status"])
+            recovered += 1
+    return recovered
+
+async def poll_batches() -> int:
+    """刷新所有等待服务端完成的批量审核任务，返回本次结束的任务数"""
+    finished = 0
+    for document in await get_repository().find("audit_tasks", {"batch_status": "submitted"}, TASK_COLUMNS):
+        task = task_from_document(document)
+        try:
+            state = await refresh_batch(task)
+        except Exception:
+            logger.exception("Failed to refresh batch of task %s", task["_id"])
+            continue
+        if state["batch_status"] not in ACTIVE_BATCH_STATUSES:
+            finished += 1
+    return finished
+
+async def _poll_loop():
+    while True:
+        try:
+            await recover_stale_batches()
+            if settings.AI_BATCH_POLL_INTERVAL_SECONDS > 0:
+                await poll_batches()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Batch polling failed")
+        if settings.AI_BATCH_POLL_INTERVAL_SECONDS <= 0:
+            return
+        await asyncio.sleep(settings.AI_BATCH_POLL_INTERVAL_SECONDS)
+
+def start_batch_poller():
+    """启动时恢复中断的批量审核任务；AI_BATCH_POLL_INTERVAL_SECONDS 大于0时在后台定时恢复并轮询"""
+    global _poller
+    if _poller is None:
+        _poller = asyncio.create_task(_poll_loop())
+
+async def stop_batch_poller():
+    """停止后台轮询"""
+    global _poller
+    if _poller is not None:
+        _poller.cancel()
+        try:
+            await _poller
+        except asyncio.CancelledError:
+            pass
+        _poller = None
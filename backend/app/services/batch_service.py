@@ -0,0 +1,204 @@
+import sqlite3
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple, Type
+from uuid import uuid4
+from pydantic import BaseModel, ValidationError
+from app.db.repository import WriteOp, get_repository, using_sqlite
+from app.db.sqlite import async_transaction
+
+logger = logging.getLogger(__name__)
+
+BATCH_OPERATIONS = {"create", "update", "delete"}
+MAX_BATCH_OPERATIONS = 500
+
+class BatchResource:
+    """描述可批量操作的表：字段、创建/更新模型以及删除时需级联删除的子表"""
+    def __init__(
+        self,
+        table: str,
+        columns: Tuple[str, ...],
+        create_model: Type[BaseModel],
+        update_model: Type[BaseModel],
+        cascade: Tuple[Tuple[str, str], ...] = ()
+    ):
+        self.table = table
+        self.columns = columns
+        self.create_model = create_model
+        self.update_model = update_model
+        self.cascade = cascade
+
+    def to_dict(self, row) -> dict:
+        return dict(zip(self.columns, row))
+
+class _BatchFailed(Exception):
+    """原子模式下有操作失败，回滚整个批次"""
+
+class _NotFound(Exception):
+    pass
+
+def _validated(model: Type[BaseModel], data: Optional[dict], exclude_unset: bool) -> dict:
+    try:
+        return model(**(data or {})).model_dump(exclude_unset=exclude_unset)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+
+def _create(cursor, resource: BatchResource, operation) -> dict:
+    data = _validated(resource.create_model, operation.data, exclude_unset=False)
+    now = datetime.utcnow().isoformat()
+    row = {column: data.get(column) for column in resource.columns}
+    row.update({"_id": operation.id or str(uuid4()), "created_at": now, "updated_at": now})
+    columns = ", ".join(row)
+    cursor.execute(
+        f"INSERT INTO {resource.table} ({columns}) VALUES ({', '.join('?' for _ in row)}) RETURNING {', '.join(resource.columns)}",
+        tuple(row.values())
+    )
+    return resource.to_dict(cursor.fetchone())
+
+def _update(cursor, resource: BatchResource, operation) -> dict:
+    if not operation.id:
+        raise ValueError("update 操作缺少 id")
+    data = _validated(resource.update_model, operation.data, exclude_unset=True)
+    data = {column: value for column, value in data.items() if column in resource.columns}
+    data["updated_at"] = datetime.utcnow().isoformat()
+    cursor.execute(
+        f"UPDATE {resource.table} SET {', '.join(f'{column} = ?' for column in data)} WHERE _id = ? RETURNING {', '.join(resource.columns)}",
+        tuple(data.values()) + (operation.id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise _NotFound(f"{operation.id} 不存在")
+    return resource.to_dict(row)
+
+def _delete(cursor, resource: BatchResource, operation) -> dict:
+    if not operation.id:
+        raise ValueError("delete 操作缺少 id")
+    for child_table, foreign_key in resource.cascade:
+        cursor.execute(f"DELETE FROM {child_table} WHERE {foreign_key} = ?", (operation.id,))
+    cursor.execute(f"DELETE FROM {resource.table} WHERE _id = ? RETURNING _id", (operation.id,))
+    if cursor.fetchone() is None:
+        raise _NotFound(f"{operation.id} 不存在")
+    return {"_id": operation.id}
+
+_HANDLERS = {"create": _create, "update": _update, "delete": _delete}
+
+async def _create_document(resource: BatchResource, operation) -> Tuple[dict, List[WriteOp]]:
+    data = _validated(resource.create_model, operation.data, exclude_unset=False)
+    now = datetime.utcnow().isoformat()
+    document = {column: data.get(column) for column in resource.columns}
+    document.update({"_id": operation.id or str(uuid4()), "created_at": now, "updated_at": now})
+    repository = get_repository()
+    if await repository.find_one(resource.table, {"_id": document["_id"]}, ("_id",)):
+        raise ValueError(f"{document['_id']} 已存在")
+    await repository.insert_one(resource.table, document)
+    return document, [WriteOp.delete(resource.table, {"_id": document["_id"]})]
+
+async def _update_document(resource: BatchResource, operation) -> Tuple[dict, List[WriteOp]]:
+    if not operation.id:
+        raise ValueError("update 操作缺少 id")
+    data = _validated(resource.update_model, operation.data, exclude_unset=True)
+    data = {column: value for column, value in data.items() if column in resource.columns}
+    data["updated_at"] = datetime.utcnow().isoformat()
+    repository = get_repository()
+    before = await repository.find_one(resource.table, {"_id": operation.id}, resource.columns)
+    if before is None or await repository.update_one(resource.table, {"_id": operation.id}, data) is None:
+        raise _NotFound(f"{operation.id} 不存在")
+    document = {**before, **data}
+    return document, [WriteOp.update(resource.table, {"_id": operation.id}, {column: before.get(column) for column in data})]
+
+async def _delete_document(resource: BatchResource, operation) -> Tuple[dict, List[WriteOp]]:
+    if not operation.id:
+        raise ValueError("delete 操作缺少 id")
+    repository = get_repository()
+    before = await repository.find_one(resource.table, {"_id": operation.id})
+    if before is None:
+        raise _NotFound(f"{operation.id} 不存在")
+    undo = [WriteOp.insert(resource.table, before)]
+    writes = []
+    for child_table, foreign_key in resource.cascade:
+        undo += [WriteOp.insert(child_table, child) for child in await repository.find(child_table, {foreign_key: operation.id})]
+        writes.append(WriteOp.delete(child_table, {foreign_key: operation.id}))
+    writes.append(WriteOp.delete(resource.table, {"_id": operation.id}))
+    await repository.bulk_write(writes)
+    return {"_id": operation.id}, undo
+
+_DOCUMENT_HANDLERS = {"create": _create_document, "update": _update_document, "delete": _delete_document}
+
+async def _run_repository_batch(resource: BatchResource, operations: list, atomic: bool) -> Tuple[List[dict], int, bool]:
+    """
+    其他存储后端（MongoDB）没有跨集合事务：逐个执行操作并记录撤销操作，
+    原子模式下有操作失败时按相反顺序执行撤销，撤销完成前其他请求可能读到部分结果
+    """
+    results: List[dict] = []
+    undo: List[List[WriteOp]] = []
+    failed = 0
+    for index, operation in enumerate(operations):
+        result = {"index": index, "op": operation.op, "id": operation.id}
+        try:
+            if operation.op not in BATCH_OPERATIONS:
+                raise ValueError(f"op 必须是: {', '.join(sorted(BATCH_OPERATIONS))}")
+            item, reverse = await _DOCUMENT_HANDLERS[operation.op](resource, operation)
+            undo.append(reverse)
+            result.update({"id": item["_id"], "status": "ok", "item": item if operation.op != "delete" else None})
+        except (ValueError, _NotFound) as e:
+            failed += 1
+            result.update({"status": "not_found" if isinstance(e, _NotFound) else "error", "error": str(e)})
+        results.append(result)
+    if atomic and failed:
+        for reverse in reversed(undo):
+            await get_repository().bulk_write(reverse)
+        return results, failed, False
+    return results, failed, True
+
+async def _run_sqlite_batch(resource: BatchResource, operations: list, atomic: bool) -> Tuple[List[dict], int, bool]:
+    """在一个事务中执行，每个操作使用独立的保存点"""
+    results: List[dict] = []
+    failed = 0
+    try:
+        async with async_transaction("batch") as cursor:
+            for index, operation in enumerate(operations):
+                result = {"index": index, "op": operation.op, "id": operation.id}
+                cursor.execute("SAVEPOINT batch_op")
+                try:
+                    if operation.op not in BATCH_OPERATIONS:
+                        raise ValueError(f"op 必须是: {', '.join(sorted(BATCH_OPERATIONS))}")
+                    item = _HANDLERS[operation.op](cursor, resource, operation)
+                    cursor.execute("RELEASE batch_op")
+                    result.update({"id": item["_id"], "status": "ok", "item": item if operation.op != "delete" else None})
+                except (ValueError, _NotFound, sqlite3.IntegrityError) as e:
+                    cursor.execute("ROLLBACK TO batch_op")
+                    cursor.execute("RELEASE batch_op")
+                    failed += 1
+                    result.update({"status": "not_found" if isinstance(e, _NotFound) else "error", "error": str(e)})
+                results.append(result)
+            if atomic and failed:
+                raise _BatchFailed()
+        committed = True
+    except _BatchFailed:
+        committed = False
+    return results, failed, committed
+
+async def run_batch(resource: BatchResource, operations: list, atomic: bool = True) -> dict:
+    """
+    在一个事务中按顺序执行批量的增删改操作，每个操作使用独立的保存点，
+    非原子模式下失败的操作只回滚自身；其他存储后端以撤销操作代替事务回滚
+    :param resource: 目标表描述
+    :param operations: BatchOperation 列表
+    :param atomic: 任一操作失败时是否回滚全部操作
+    :return: 逐个操作的结果与汇总
+    """
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f"单次批量操作不能超过 {MAX_BATCH_OPERATIONS} 个")
+
+    if using_sqlite():
+        results, failed, committed = await _run_sqlite_batch(resource, operations, atomic)
+    else:
+        results, failed, committed = await _run_repository_batch(resource, operations, atomic)
+
+    logger.info("Batch on %s: %d operations, %d failed, committed=%s", resource.table, len(operations), failed, committed)
+    return {
+        "committed": committed,
+        "succeeded": len(operations) - failed,
+        "failed": failed,
+        "results": results
+    }
@@ -0,0 +1,143 @@
+import zlib
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+from app.core.config import settings
+from app.db.repository import get_repository
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_COMPRESSIONS = ("zstd", "zlib", "none")
+
+# 单次按哈希批量读取的最大数量
+LOAD_BATCH = 500
+
+# 压缩后没有变小的内容（通常很短）原样保存
+_RAW = "raw"
+
+def content_hash(text: str) -> str:
+    """审核内容的哈希，作为 contents 中的 _id"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _compression() -> str:
+    compression = settings.CONTENT_COMPRESSION.lower()
+    if compression not in CONTENT_COMPRESSIONS:
+        raise ValueError(f"未知的内容压缩算法: {settings.CONTENT_COMPRESSION}，可选值: {', '.join(CONTENT_COMPRESSIONS)}")
+    if compression == "zstd" and zstandard is None:
+        return "zlib"
+    return compression
+
+def encode_content(text: str) -> tuple:
+    """
+    按 CONTENT_COMPRESSION 压缩审核内容
+    :param text: 审核内容
+    :return: (encoding, body)，encoding 为 zstd / zlib / raw
+    """
+    data = text.encode("utf-8")
+    compression = _compression()
+    level = settings.CONTENT_COMPRESSION_LEVEL
+    if compression == "zstd":
+        body = zstandard.ZstdCompressor(level=level).compress(data)
+    elif compression == "zlib":
+        body = zlib.compress(data, max(1, min(level, 9)))
+    else:
+        return _RAW, data
+    return (compression, body) if len(body) < len(data) else (_RAW, data)
+
+def decode_content(encoding: str, body: bytes) -> str:
+    """解压 encode_content 的结果"""
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("该内容使用zstd压缩，读取需要安装zstandard")
+        data = zstandard.ZstdDecompressor().decompress(body)
+    elif encoding == "zlib":
+        data = zlib.decompress(body)
+    else:
+        data = body
+    return bytes(data).decode("utf-8")
+
+async def store_content(text: str) -> str:
+    """
+    保存审核内容，相同内容只保存一份
+    :param text: 审核内容
+    :return: 内容哈希，审核结果的 content_hash
+    """
+    document = content_document(text)
+    await get_repository().insert_missing("contents", [document])
+    return document["_id"]
+
+def content_document(text: str) -> dict:
+    """生成 contents 中的文档（哈希、压缩后的内容）"""
+    encoding, body = encode_content(text)
+    return {
+        "_id": content_hash(text),
+        "encoding": encoding,
+        "body": body,
+        "size": len(text),
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+async def load_contents(keys: Iterable[str]) -> Dict[str, str]:
+    """
+    按哈希批量读取并解压审核内容
+    :param keys: 内容哈希
+    :return: 哈希 -> 内容，不存在的哈希不包含在结果中
+    """
+    keys = sorted({key for key in keys if key})
+    contents = {}
+    for start in range(0, len(keys), LOAD_BATCH):
+        documents = await get_repository().find("contents", {"_id": keys[start:start + LOAD_BATCH]}, ("_id", "encoding", "body"))
+        for document in documents:
+            contents[document["_id"]] = decode_content(document["encoding"], document["body"])
+    return contents
+
+async def attach_contents(results: List[dict]) -> List[dict]:
+    """
+    为审核结果填充 content：引用 contents 的结果按 content_hash 读取，旧数据保留结果中原有的内容
+    :param results: 审核结果字典
+    :return: 传入的结果列表
+    """
+    contents = await load_contents(result.get("content_hash") for result in results)
+    for result in results:
+        if result.get("content_hash") in contents:
+            result["content"] = contents[result["content_hash"]]
+    return results
+
+class ContentDecoder:
+    """
+    同步逐行读取（如导出）时按哈希读取并解压内容。同一文件的各审核项结果相邻且共用同一内容，
+    只缓存最近用到的几份，不会为每一行重复读取和解压
+    """
+    def __init__(self, fetch: Callable[[str], Optional[tuple]], capacity: int = 8):
+        """
+        :param fetch: 按哈希返回 (encoding, body) 的函数，不存在时返回None
+        :param capacity: 缓存的内容份数
+        """
+        self._fetch = fetch
+        self.capacity = capacity
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+
+    def get(self, key: Optional[str], fallback: Optional[str] = None) -> Optional[str]:
+        """
+        :param key: 内容哈希，旧数据为空
+        :param fallback: 旧数据保存在结果行中的内容
+        :return: 审核内容
+        """
+        if not key:
+            return fallback
+        if key in self._cache:
+            self._cache.move_to_end(key)
+        else:
+            row = self._fetch(key)
+            self._cache[key] = decode_content(*row) if row else None
+            if len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+        text = self._cache[key]
+        return fallback if text is None else text
@@ -0,0 +1,173 @@
+import re
+import difflib
+import hashlib
+import logging
+from datetime import datetime
+from typing import List, Optional
+from app.core.config import settings
+from app.db.sqlite import async_transaction, executemany, query
+from app.services.ai_service import FALLBACK_REASONS
+from app.services.content_service import load_contents
+from app.services.token_service import estimate_tokens
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = {"off", "reuse", "confirm"}
+
+# MinHash签名长度与LSH分段：16段×8行，估计相似度约0.7以上的内容才会成为候选
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5
+
+_SHINGLE_BASE = np.uint64(1000003) if np is not None else None
+_PERM_A = _PERM_B = None
+if np is not None:
+    _rng = np.random.default_rng(20240601)
+    # multiply-shift哈希族：奇数乘数，取高32位
+    _PERM_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    _PERM_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+
+# 每次参与计算的shingle数量，控制长文档的内存占用
+_SHINGLE_BLOCK = 8192
+_WHITESPACE = re.compile(r"\s+")
+_SEGMENT_SPLIT = re.compile(r"(?<=[\n。！？；!?;])")
+
+def audit_key(audit_item_id: str, criteria: str, item_type: str, references: str) -> str:
+    """审核项、审核标准与参考资料都相同的审核才可以复用结论"""
+    return hashlib.sha256("\x1f".join((audit_item_id, criteria or "", item_type or "", references or "")).encode("utf-8")).hexdigest()
+
+def minhash_signature(text: str):
+    """
+    计算文本的MinHash签名：空白归一后按字符 SHINGLE_SIZE-gram 切分
+    :param text: 文本
+    :return: NUM_PERM 个 uint32 组成的签名
+    """
+    normalized = _WHITESPACE.sub(" ", text.strip().lower())
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    width = min(SHINGLE_SIZE, len(codes))
+    count = len(codes) - width + 1
+    shingles = np.zeros(max(count, 1), dtype=np.uint64)
+    for offset in range(width):
+        shingles = shingles * _SHINGLE_BASE + codes[offset:offset + count]
+    shingles = np.unique(shingles)
+
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(shingles), _SHINGLE_BLOCK):
+        block = shingles[start:start + _SHINGLE_BLOCK]
+        hashed = (_PERM_A[:, None] * block[None, :] + _PERM_B[:, None]) >> np.uint64(32)
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+def fingerprint_content(content: str) -> Optional[dict]:
+    """
+    计算内容指纹（精确哈希与MinHash签名），同一文件的多个审核项共用
+    :param content: 待审核内容
+    :return: 指纹，未安装numpy时返回None
+    """
+    if np is None:
+        return None
+    return {
+        "content_hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+        "signature": minhash_signature(content)
+    }
+
+def _band_keys(key: str, signature) -> List[str]:
+    return [
+        f"{key[:32]}:{band}:{hashlib.blake2b(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+async def find_duplicate(key: str, fingerprint: dict, threshold: Optional[float] = None) -> Optional[dict]:
+    """
+    查找同一审核键下内容相同或近似的已有审核结果：先按精确哈希查找，再按LSH分段取候选并比较签名
+    :param key: audit_key 的返回值
+    :param fingerprint: fingerprint_content 的返回值
+    :param threshold: 估计相似度阈值，默认使用 AUDIT_DEDUP_THRESHOLD
+    :return: 相似度最高的已有结果（result_id、result、reason、content、similarity），没有时返回None
+    """
+    threshold = settings.AUDIT_DEDUP_THRESHOLD if threshold is None else threshold
+    # 大模型调用失败时保存的默认结论不作为复用来源（早期版本可能为其记录了指纹）
+    not_fallback = f"r.reason NOT IN ({', '.join('?' for _ in FALLBACK_REASONS)})"
+    rows = await query(
+        f"""
+        SELECT f.result_id
+        FROM audit_fingerprints f
+        JOIN audit_results r ON r._id = f.result_id
+        WHERE f.audit_key = ? AND f.content_hash = ? AND {not_fallback}
+        LIMIT 1
+        """,
+        (key, fingerprint["content_hash"], *FALLBACK_REASONS)
+    )
+    if rows:
+        best_id, best_similarity = rows[0][0], 1.0
+    else:
+        band_keys = _band_keys(key, fingerprint["signature"])
+        candidates = await query(
+            f"""
+            SELECT DISTINCT f.result_id, f.signature
+            FROM audit_fingerprint_bands b
+            JOIN audit_fingerprints f ON f.result_id = b.result_id
+            JOIN audit_results r ON r._id = f.result_id
+            WHERE b.band_key IN ({', '.join('?' for _ in band_keys)}) AND f.audit_key = ? AND {not_fallback}
+            """,
+            (*band_keys, key, *FALLBACK_REASONS)
+        )
+        best_id, best_similarity = None, 0.0
+        for result_id, signature in candidates:
+            similarity = float(np.mean(np.frombuffer(signature, dtype=np.uint32) == fingerprint["signature"]))
+            if similarity > best_similarity:
+                best_id, best_similarity = result_id, similarity
+        if best_id is None or best_similarity < threshold:
+            return None
+
+    results = await query("SELECT result, reason, content, content_hash FROM audit_results WHERE _id = ?", (best_id,))
+    if not results:
+        return None
+    result, reason, content, content_key = results[0]
+    if content_key:
+        content = (await load_contents([content_key])).get(content_key, content)
+    return {"result_id": best_id, "result": result, "reason": reason, "content": content, "similarity": round(best_similarity, 4)}
+
+async def record_fingerprint(result_id: str, key: str, fingerprint: dict):
+    """
+    保存审核结果的内容指纹及LSH分段，结果删除时由触发器一并删除
+    :param result_id: 审核结果ID
+    :param key: audit_key 的返回值
+    :param fingerprint: fingerprint_content 的返回值
+    """
+    async with async_transaction("audit_fingerprints") as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO audit_fingerprints (result_id, audit_key, content_hash, signature, created_at) VALUES (?, ?, ?, ?, ?)",
+            (result_id, key, fingerprint["content_hash"], fingerprint["signature"].tobytes(), datetime.utcnow().isoformat())
+        )
+        executemany(
+            cursor,
+            "INSERT OR IGNORE INTO audit_fingerprint_bands (band_key, result_id) VALUES (?, ?)",
+            [(band_key, result_id) for band_key in _band_keys(key, fingerprint["signature"])]
+        )
+
+def describe_changes(previous: str, current: str, max_tokens: Optional[int] = None) -> Optional[str]:
+    """
+    按句子比较两段内容，列出删除（-）与新增（+）的句子，供确认提示词使用
+    :param previous: 之前审核的内容
+    :param current: 本次内容
+    :param max_tokens: 差异文本的token上限，默认使用 AUDIT_DEDUP_CONFIRM_MAX_TOKENS
+    :return: 差异文本，差异过大时返回None（应完整审核）
+    """
+    max_tokens = max_tokens or settings.AUDIT_DEDUP_CONFIRM_MAX_TOKENS
+    before = [segment for segment in _SEGMENT_SPLIT.split(previous) if segment.strip()]
+    after = [segment for segment in _SEGMENT_SPLIT.split(current) if segment.strip()]
+    lines = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, before, after, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        lines.extend(f"- {segment.strip()}" for segment in before[i1:i2])
+        lines.extend(f"+ {segment.strip()}" for segment in after[j1:j2])
+    changes = "\n".join(lines) or "（内容空白字符以外无差异）"
+    return changes if estimate_tokens(changes) <= max_tokens else None
@@ -0,0 +1,311 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+import zipfile
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from xml.etree import ElementTree
+from app.core.config import settings
+from app.core.metrics import ocr_pages_total
+from app.core.tracing import tracer
+from app.services import ocr_service
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.json', '.jsonl'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif'}
+
+# 审核任务在审核当前文件时提前解析（含OCR）的后续文件数
+DOCUMENT_PREFETCH = 2
+
+# (路径, 修改时间, 大小) -> 文件内容哈希，避免每次都重新读取大文件计算哈希
+_file_hashes: Dict[Tuple[str, float, int], str] = {}
+_FILE_HASH_CACHE_SIZE = 4096
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+def resolve_upload_path(file_ref: Union[str, dict]) -> str:
+    """
+    将前端传入的文件引用解析为上传目录中的实际路径，禁止越出上传目录
+    :param file_ref: 文件路径字符串，或包含 file_path/url/unique_filename 的字典
+    :return: 文件绝对路径
+    """
+    if isinstance(file_ref, dict):
+        path = file_ref.get("file_path") or file_ref.get("url") or file_ref.get("unique_filename") or ""
+    else:
+        path = file_ref or ""
+    if not path:
+        raise ValueError("文件路径不能为空")
+
+    # 上传文件统一平铺在上传目录下，只取文件名部分，杜绝路径穿越
+    upload_root = os.path.realpath(settings.UPLOAD_DIR)
+    candidate = os.path.join(upload_root, os.path.basename(path.replace("\\", "/")))
+    if not os.path.isfile(candidate):
+        raise FileNotFoundError(f"文件不存在: {path}")
+    return candidate
+
+def file_sha256(path: str) -> str:
+    """
+    计算文件内容的SHA-256，按 (路径, 修改时间, 大小) 缓存
+    :param path: 文件路径
+    :return: 十六进制哈希
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    digest = _file_hashes.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        if len(_file_hashes) >= _FILE_HASH_CACHE_SIZE:
+            _file_hashes.clear()
+        _file_hashes[key] = digest
+    return digest
+
+def _read_text_file(path: str) -> str:
+    for encoding in ("utf-8", "gb18030"):
+        try:
+            with open(path, "r", encoding=encoding) as f:
+                return f.read()
+        except UnicodeDecodeError:
+            continue
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+def _read_docx(path: str) -> str:
+    paragraphs = []
+    with zipfile.ZipFile(path) as archive:
+        with archive.open("word/document.xml") as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag == f"{_WORD_NS}p":
+                    text = "".join(node.text or "" for node in element.iter(f"{_WORD_NS}t"))
+                    if text:
+                        paragraphs.append(text)
+                    element.clear()
+    return "\n".join(paragraphs)
+
+def _column_index(cell_ref: str) -> int:
+    letters = re.match(r"[A-Z]+", cell_ref or "")
+    index = 0
+    for char in letters.group(0) if letters else "":
+        index = index * 26 + (ord(char) - 64)
+    return index - 1
+
+def iter_xlsx_rows(source, sheet: Optional[str] = None) -> Iterator[tuple]:
+    """
+    流式读取xlsx工作表的行，不加载整个工作簿
+    :param source: 文件路径或二进制文件对象
+    :param sheet: 工作表名称，为空时依次读取所有工作表
+    :return: (工作表名称, 单元格值列表) 迭代器
+    """
+    with zipfile.ZipFile(source) as archive:
+        shared_strings: List[str] = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            with archive.open("xl/sharedStrings.xml") as f:
+                for _, element in ElementTree.iterparse(f):
+                    if element.tag == f"{_SHEET_NS}si":
+                        shared_strings.append("".join(node.text or "" for node in element.iter(f"{_SHEET_NS}t")))
+                        element.clear()
+
+        # 工作表名称 -> 文件路径
+        with archive.open("xl/workbook.xml") as f:
+            workbook = ElementTree.parse(f).getroot()
+        rels = {}
+        with archive.open("xl/_rels/workbook.xml.rels") as f:
+            for rel in ElementTree.parse(f).getroot():
+                rels[rel.get("Id")] = rel.get("Target")
+        rel_attr = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+        sheets = []
+        for element in workbook.iter(f"{_SHEET_NS}sheet"):
+            target = rels.get(element.get(rel_attr), "")
+            target = target.lstrip("/")
+            sheets.append((element.get("name"), target if target.startswith("xl/") else f"xl/{target}"))
+
+        for sheet_name, sheet_path in sheets:
+            if sheet is not None and sheet_name != sheet:
+                continue
+            with archive.open(sheet_path) as f:
+                for _, element in ElementTree.iterparse(f):
+                    if element.tag != f"{_SHEET_NS}row":
+                        continue
+                    values: List[str] = []
+                    for cell in element.iter(f"{_SHEET_NS}c"):
+                        column = _column_index(cell.get("r"))
+                        while column > len(values):
+                            values.append("")
+                        cell_type = cell.get("t")
+                        if cell_type == "inlineStr":
+                            value = "".join(node.text or "" for node in cell.iter(f"{_SHEET_NS}t"))
+                        else:
+                            node = cell.find(f"{_SHEET_NS}v")
+                            value = node.text if node is not None and node.text is not None else ""
+                            if cell_type == "s" and value:
+                                value = shared_strings[int(value)]
+                        values.append(value)
+                    element.clear()
+                    yield sheet_name, values
+
+def _read_xlsx(path: str) -> str:
+    lines = []
+    current_sheet = None
+    for sheet_name, values in iter_xlsx_rows(path):
+        if sheet_name != current_sheet:
+            current_sheet = sheet_name
+            lines.append(f"[{sheet_name}]")
+        if any(values):
+            lines.append("\t".join(values))
+    return "\n".join(lines)
+
+def _pdf_text_layer(path: str) -> Optional[List[str]]:
+    """逐页提取PDF自带的文字层，未安装pypdf时使用pypdfium2，都未安装时返回None"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        PdfReader = None
+    if PdfReader is not None:
+        return [page.extract_text() or "" for page in PdfReader(path).pages]
+    try:
+        import pypdfium2
+    except ImportError:
+        pypdfium2 = None
+    if pypdfium2 is not None:
+        document = pypdfium2.PdfDocument(path)
+        try:
+            return [document[index].get_textpage().get_text_range() for index in range(len(document))]
+        finally:
+            document.close()
+    logger.warning("pypdf未安装，无法提取PDF文本: %s", path)
+    return None
+
+def _ocr_pages(path: str, pages: List[str], is_pdf: bool) -> Iterator[str]:
+    """
+    文字层不足 OCR_MIN_TEXT_CHARS 个字符的页面视为扫描页：先查缓存，未命中的页面一次性提交到OCR进程池，
+    并行识别，按页序逐页返回，每页完成即写入缓存
+    :param path: 文件路径
+    :param pages: 各页的文字层文本（图片为空字符串）
+    :param is_pdf: 是否为PDF
+    :return: 各页文本迭代器
+    """
+    scanned = [index for index, text in enumerate(pages) if len(text.strip()) < settings.OCR_MIN_TEXT_CHARS]
+    ocr_pages_total.inc(len(pages) - len(scanned), source="text_layer")
+    if not scanned or not ocr_service.ocr_available() or (is_pdf and not ocr_service.pdf_rendering_available()):
+        if scanned and is_pdf and ocr_service.ocr_available():
+            logger.warning("pypdfium2未安装，无法OCR扫描页: %s", path)
+        yield from pages
+        return
+
+    file_hash = file_sha256(path)
+    cached = ocr_service.load_cached_pages(file_hash)
+    futures = {index: ocr_service.submit_page(path, index, is_pdf) for index in scanned if index not in cached}
+    try:
+        for index, text in enumerate(pages):
+            if index in cached:
+                text = cached[index]
+            elif index in futures:
+                try:
+                    text = futures[index].result()
+                except Exception as e:
+                    logger.warning("OCR failed for page %d of %s: %s", index + 1, path, e)
+                    ocr_pages_total.inc(source="failed")
+                else:
+                    ocr_pages_total.inc(source="ocr")
+                    ocr_service.save_cached_page(file_hash, index, text)
+            yield text
+    finally:
+        # 调用方提前停止时取消尚未开始的页面
+        for future in futures.values():
+            future.cancel()
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """
+    按页返回PDF文本，有文字层的页面直接使用，扫描页经OCR识别
+    :param path: 文件路径
+    :return: 各页文本迭代器
+    """
+    pages = _pdf_text_layer(path)
+    if pages is not None:
+        yield from _ocr_pages(path, pages, True)
+
+def _read_pdf(path: str) -> str:
+    with tracer.span("document.pdf_pages") as span:
+        pages = list(iter_pdf_pages(path))
+        span.set_attribute("document.pages", len(pages))
+    return "\n".join(pages)
+
+def ocr_image(path: str) -> str:
+    """
+    识别图片中的文字，OCR不可用时返回空字符串
+    :param path: 图片路径
+    :return: 识别出的文本
+    """
+    if not ocr_service.ocr_available():
+        return ""
+    return next(_ocr_pages(path, [""], False)).strip()
+
+def extract_text(path: str) -> str:
+    """
+    按文件类型提取文本内容
+    :param path: 文件路径
+    :return: 文本内容，不支持的类型返回空字符串
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TEXT_EXTENSIONS:
+        return _read_text_file(path)
+    if ext == ".docx":
+        return _read_docx(path)
+    if ext == ".xlsx":
+        return _read_xlsx(path)
+    if ext == ".pdf":
+        return _read_pdf(path)
+    logger.warning("暂不支持提取该类型文件的文本: %s", ext)
+    return ""
+
+async def load_document(file_ref: Union[str, dict]) -> dict:
+    """
+    解析上传的文件，在线程池中提取文本以免阻塞事件循环
+    :param file_ref: 文件引用
+    :return: 包含 name、path、kind、content 的字典，图片的 kind 为 image、content 为OCR识别出的文字
+    """
+    name = file_ref.get("name") or file_ref.get("filename") if isinstance(file_ref, dict) else None
+    with tracer.span("document.parse") as span:
+        path = resolve_upload_path(file_ref)
+        name = name or os.path.basename(path)
+        span.set_attribute("document.name", name)
+        span.set_attribute("document.size", os.path.getsize(path))
+        kind = "image" if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS else "text"
+        content = await asyncio.to_thread(ocr_image if kind == "image" else extract_text, path)
+        span.set_attribute("document.chars", len(content))
+    return {"name": name, "path": path, "kind": kind, "content": content}
+
+async def iter_documents(file_refs: Iterable[Union[str, dict]], prefetch: int = DOCUMENT_PREFETCH) -> AsyncIterator[dict]:
+    """
+    按顺序逐个返回解析后的文件，当前文件交给下游处理时后续 prefetch 个文件已在后台解析，
+    扫描件的OCR与前面文件的审核重叠进行
+    :param file_refs: 文件引用
+    :param prefetch: 提前解析的文件数
+    :return: load_document 结果的异步迭代器
+    """
+    refs = iter(file_refs)
+    pending = deque()
+
+    def schedule():
+        while len(pending) <= prefetch:
+            ref = next(refs, None)
+            if ref is None:
+                return
+            pending.append(asyncio.create_task(load_document(ref)))
+
+    schedule()
+    try:
+        while pending:
+            document = await pending.popleft()
+            schedule()
+            yield document
+    finally:
+        for future in pending:
+            future.cancel()
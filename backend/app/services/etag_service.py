@@ -0,0 +1,44 @@
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, Iterable
+from fastapi import Request, Response
+from app.core.responses import ORJSONResponse
+from app.db.repository import get_repository
+
+logger = logging.getLogger(__name__)
+
+async def table_versions(tables: Iterable[str]) -> Dict[str, int]:
+    """
+    读取各表的变更计数器（SQLite由触发器、MongoDB由每次写入递增），包含数据库实例标识，数据库重建后ETag不会与旧库重复
+    :param tables: 表名
+    :return: 表名 -> 版本号，从未变更过的表为0
+    """
+    return await get_repository().table_versions(tables)
+
+def make_etag(scope: str, versions: Dict[str, int], params: str = "") -> str:
+    """由接口标识、请求参数与所依赖表的版本号生成强ETag"""
+    key = "\x1f".join([scope, params] + [f"{name}={version}" for name, version in sorted(versions.items())])
+    return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """请求头 If-None-Match 中是否包含当前ETag（按弱比较，忽略 W/ 前缀）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+async def etag_response(request: Request, tables: Iterable[str], build: Callable[[], Awaitable]) -> Response:
+    """
+    带ETag的列表响应：所依赖的表都没有变更且客户端持有相同ETag时返回304，不再查询和序列化数据
+    :param request: 当前请求，ETag包含其路径与查询参数
+    :param tables: 响应数据依赖的表
+    :param build: 生成响应数据的协程函数
+    :return: 304 或带ETag的JSON响应
+    """
+    # 先读版本再读数据：两者之间发生写入时ETag偏旧，客户端下次只会多取一次，不会拿到过期数据
+    etag = make_etag(request.url.path, await table_versions(tables), str(request.query_params))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(await build(), headers=headers)
@@ -0,0 +1,327 @@
+import io
+import re
+import csv
+import json
+import asyncio
+import logging
+import zipfile
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from xml.sax.saxutils import escape
+from app.db.repository import get_repository, using_sqlite
+from app.db.sqlite import connect_readonly
+from app.services.archive_service import archive_path, read_archive
+from app.services.content_service import ContentDecoder, load_contents
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+EXPORT_COLUMNS = [
+    ("_id", "结果ID"),
+    ("file_name", "文件名"),
+    ("rule_id", "规则ID"),
+    ("rule_name", "规则"),
+    ("audit_item_id", "审核项ID"),
+    ("audit_item_name", "审核项"),
+    ("result", "审核结论"),
+    ("reason", "审核理由"),
+    ("ai_generated", "AI生成"),
+    ("edited_by", "修改人"),
+    ("prompt_tokens", "提示词tokens"),
+    ("completion_tokens", "生成tokens"),
+    ("reused_from", "复用结论来源"),
+    ("created_at", "创建时间"),
+    ("updated_at", "更新时间"),
+]
+CONTENT_COLUMN = ("content", "审核内容")
+
+# 每读取多少行向客户端输出一次
+FLUSH_ROWS = 500
+
+# Excel单元格最大字符数
+_XLSX_CELL_LIMIT = 32767
+_XML_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+# 以这些字符开头的文本会被表格软件当作公式执行
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def export_columns(include_content: bool = False) -> List[tuple]:
+    return EXPORT_COLUMNS + [CONTENT_COLUMN] if include_content else list(EXPORT_COLUMNS)
+
+def iter_task_results(task_id: str, include_content: bool = False, batch_size: int = 1000) -> Iterator[dict]:
+    """
+    使用独立的只读连接逐批读取任务的审核结果，内存占用与结果数量无关
+    :param task_id: 任务ID
+    :param include_content: 是否包含审核内容原文
+    :param batch_size: 每批读取的行数
+    :return: 结果字典迭代器
+    """
+    columns = [name for name, _ in export_columns(include_content)]
+    select = ", ".join(
+        "r.name" if name == "rule_name" else "i.name" if name == "audit_item_name" else f"a.{name}"
+        for name in columns
+    )
+    if include_content:
+        select += ", a.content_hash"
+    conn = connect_readonly()
+    contents = ContentDecoder(lambda key: conn.execute("SELECT encoding, body FROM contents WHERE _id = ?", (key,)).fetchone())
+    try:
+        task = conn.execute("SELECT _id, created_at, archived_at FROM audit_tasks WHERE _id = ?", (task_id,)).fetchone()
+        if task and task[2]:
+            yield from _iter_archived_results(conn, {"_id": task[0], "created_at": task[1]}, columns)
+            return
+        cursor = conn.execute(
+            f"""
+            SELECT {select}
+            FROM audit_results a
+            LEFT JOIN rules r ON r._id = a.rule_id
+            LEFT JOIN audit_items i ON i._id = a.audit_item_id
+            WHERE a.task_id = ?
+            ORDER BY a.created_at, a._id
+            """,
+            (task_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                result = dict(zip(columns, row))
+                if include_content:
+                    result["content"] = contents.get(row[-1], result["content"])
+                yield result
+    finally:
+        conn.close()
+
+def _iter_archived_results(conn, task: dict, columns: List[str]) -> Iterator[dict]:
+    """已归档任务从归档文件读取结果，规则与审核项名称从数据库补充"""
+    results, contents = read_archive(archive_path(task))
+    names = {"rule_name": ("rules", "rule_id", {}), "audit_item_name": ("audit_items", "audit_item_id", {})}
+    for result in results:
+        row = {}
+        for name in columns:
+            if name in names:
+                table, key_column, cache = names[name]
+                key = result.get(key_column)
+                if key not in cache:
+                    found = conn.execute(f"SELECT name FROM {table} WHERE _id = ?", (key,)).fetchone()
+                    cache[key] = found[0] if found else None
+                row[name] = cache[key]
+            elif name == "content":
+                row[name] = contents.get(result.get("content_hash"), result.get("content"))
+            else:
+                row[name] = result.get(name)
+        yield row
+
+# 导出列中需从其他集合补充的名称：列名 -> (集合, 结果中的关联字段)
+_NAME_COLUMNS = {"rule_name": ("rules", "rule_id"), "audit_item_name": ("audit_items", "audit_item_id")}
+
+async def _take(documents: AsyncIterator[dict], size: int) -> List[dict]:
+    """从异步迭代器中读取至多 size 个文档，迭代器不关闭，下次继续读取"""
+    batch = []
+    async for document in documents:
+        batch.append(document)
+        if len(batch) >= size:
+            break
+    return batch
+
+async def _complete_rows(batch: List[dict], columns: List[str], names: Dict[str, dict],
+                         contents: Optional[Dict[str, str]] = None) -> List[dict]:
+    """为一批结果补充规则、审核项名称与审核内容（未传入 contents 时从存储读取），名称按ID缓存"""
+    repository = get_repository()
+    for column, (collection, key_column) in _NAME_COLUMNS.items():
+        cache = names.setdefault(column, {})
+        missing = list({result.get(key_column) for result in batch} - set(cache))
+        if missing:
+            cache.update(dict.fromkeys(missing))
+            for document in await repository.find(collection, {"_id": missing}, ("_id", "name")):
+                cache[document["_id"]] = document["name"]
+    if contents is None and "content" in columns:
+        contents = await load_contents(result.get("content_hash") for result in batch)
+    rows = []
+    for result in batch:
+        row = {}
+        for name in columns:
+            if name in _NAME_COLUMNS:
+                row[name] = names[name][result.get(_NAME_COLUMNS[name][1])]
+            elif name == "content":
+                row[name] = contents.get(result.get("content_hash"), result.get("content"))
+            else:
+                row[name] = result.get(name)
+        rows.append(row)
+    return rows
+
+def iter_repository_results(task_id: str, include_content: bool, loop: asyncio.AbstractEventLoop,
+                            batch_size: int = 1000) -> Iterator[dict]:
+    """
+    非SQLite存储后端的结果迭代器：分批在事件循环中读取，在调用线程中逐行返回；
+    只能在事件循环以外的线程中迭代（StreamingResponse在线程池中迭代同步迭代器）
+    :param task_id: 任务ID
+    :param include_content: 是否包含审核内容原文
+    :param loop: 存储客户端所在的事件循环
+    :param batch_size: 每批读取的文档数
+    :return: 结果字典迭代器
+    """
+    def call(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    repository = get_repository()
+    columns = [name for name, _ in export_columns(include_content)]
+    names: Dict[str, dict] = {}
+    task = call(repository.find_one("audit_tasks", {"_id": task_id}, ("_id", "created_at", "archived_at")))
+    if task and task.get("archived_at"):
+        results, contents = read_archive(archive_path(task))
+        for start in range(0, len(results), batch_size):
+            yield from call(_complete_rows(results[start:start + batch_size], columns, names, contents))
+        return
+
+    fields = [name for name in columns if name not in _NAME_COLUMNS]
+    if include_content:
+        fields.append("content_hash")
+    documents = repository.stream("audit_results", {"task_id": task_id}, fields, [("created_at", 1), ("_id", 1)], batch_size)
+    try:
+        while True:
+            batch = call(_take(documents, batch_size))
+            if not batch:
+                break
+            yield from call(_complete_rows(batch, columns, names))
+    finally:
+        call(documents.aclose())
+
+def _csv_safe(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def stream_csv(rows: Iterator[dict], columns: List[tuple]) -> Iterator[bytes]:
+    """带BOM的UTF-8 CSV，Excel可直接打开中文内容"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow([title for _, title in columns])
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_csv_safe(row[name]) if row[name] is not None else "" for name, _ in columns])
+        if count % FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def stream_jsonl(rows: Iterator[dict], columns: List[tuple]) -> Iterator[bytes]:
+    """每行一个JSON对象"""
+    lines = []
+    for count, row in enumerate(rows, 1):
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if count % FLUSH_ROWS == 0:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+class _ChunkSink:
+    """只支持追加写入的输出缓冲，zipfile据此以流式（数据描述符）模式写入"""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+_XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="审核结果" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+def _xlsx_cell(value) -> str:
+    if value is None or value == "":
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = _XML_ILLEGAL.sub("", str(value))[:_XLSX_CELL_LIMIT]
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+def _xlsx_row(values) -> str:
+    return "<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>"
+
+def stream_xlsx(rows: Iterator[dict], columns: List[tuple]) -> Iterator[bytes]:
+    """
+    边读取边压缩输出xlsx：工作表使用内联字符串，无需共享字符串表，
+    zip以数据描述符模式写入，不需要回写文件头，因此无需缓存整个文件
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        yield sink.drain()
+
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(title for _, title in columns)
+            ).encode("utf-8"))
+            for count, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row[name] for name, _ in columns).encode("utf-8"))
+                if count % FLUSH_ROWS == 0:
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+_WRITERS = {"csv": stream_csv, "jsonl": stream_jsonl, "xlsx": stream_xlsx}
+
+def export_task_results(task_id: str, export_format: str, include_content: bool = False,
+                        loop: Optional[asyncio.AbstractEventLoop] = None) -> Iterator[bytes]:
+    """
+    按指定格式流式导出任务的审核结果
+    :param task_id: 任务ID
+    :param export_format: csv、jsonl 或 xlsx
+    :param include_content: 是否包含审核内容原文
+    :param loop: 非SQLite存储后端需传入事件循环，见 iter_repository_results
+    :return: 字节块迭代器
+    """
+    columns = export_columns(include_content)
+    if using_sqlite():
+        rows = iter_task_results(task_id, include_content)
+    else:
+        rows = iter_repository_results(task_id, include_content, loop)
+    yield from _WRITERS[export_format](rows, columns)
+    logger.info("Exported results of task %s as %s", task_id, export_format)
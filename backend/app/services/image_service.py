@@ -0,0 +1,134 @@
+import io
+import os
+import math
+import base64
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.tracing import tracer
+from app.services.document_service import file_sha256
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MEDIA_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+# 同一图片变体的并发请求共用一次处理
+_inflight: Dict[str, asyncio.Future] = {}
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS or os.cpu_count() or 1)
+    return _pool
+
+def shutdown_image_pool():
+    """关闭图片处理进程池"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _render_variant(path: str, max_side: int, image_format: str, quality: int) -> Tuple[bytes, int, int]:
+    """
+    在子进程中执行：按EXIF方向摆正，缩放到最长边不超过 max_side 后重新编码
+    :return: (编码后的字节, 宽, 高)
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+            # JPEG不支持透明通道，合成到白色背景上
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.split()[-1])
+        elif image.mode == "P":
+            image = image.convert("RGBA")
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format.upper(), quality=quality, optimize=True)
+        return buffer.getvalue(), image.width, image.height
+
+def _variant_path(file_hash: str, max_side: int, image_format: str, quality: int) -> str:
+    return os.path.join(settings.IMAGE_CACHE_DIR, file_hash[:2], f"{file_hash}_{max_side}_{quality}.{image_format}")
+
+def _read_cached(path: str) -> Optional[Tuple[bytes, int, int]]:
+    """缓存文件名之外的尺寸信息记录在同名 .size 文件中"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path + ".size", "r") as f:
+            width, height = (int(value) for value in f.read().split("x"))
+        return data, width, height
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_cached(path: str, data: bytes, width: int, height: int):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    with open(path + ".size", "w") as f:
+        f.write(f"{width}x{height}")
+    os.replace(tmp_path, path)
+
+async def get_image_variant(path: str, max_side: int, image_format: Optional[str] = None, quality: Optional[int] = None) -> dict:
+    """
+    获取图片缩放后的变体：按 (文件内容哈希, 尺寸, 格式, 质量) 缓存在磁盘上，未命中时在进程池中处理
+    :param path: 图片路径（已通过 resolve_upload_path 校验）
+    :param max_side: 最长边像素
+    :param image_format: jpeg/png/webp，默认使用 IMAGE_FORMAT
+    :param quality: 编码质量，默认使用 IMAGE_QUALITY
+    :return: 包含 data、media_type、width、height 的字典
+    """
+    image_format = (image_format or settings.IMAGE_FORMAT).lower()
+    if image_format not in IMAGE_MEDIA_TYPES:
+        raise ValueError(f"不支持的图片格式: {image_format}")
+    quality = quality or settings.IMAGE_QUALITY
+
+    file_hash = await asyncio.to_thread(file_sha256, path)
+    cache_path = _variant_path(file_hash, max_side, image_format, quality)
+    with tracer.span("image.variant", **{"image.max_side": max_side, "image.format": image_format}) as span:
+        cached = await asyncio.to_thread(_read_cached, cache_path)
+        span.set_attribute("image.cache_hit", cached is not None)
+        if cached is None:
+            future = _inflight.get(cache_path)
+            if future is None:
+                future = asyncio.get_running_loop().run_in_executor(_get_pool(), _render_variant, path, max_side, image_format, quality)
+                _inflight[cache_path] = future
+                try:
+                    cached = await asyncio.shield(future)
+                    await asyncio.to_thread(_write_cached, cache_path, *cached)
+                finally:
+                    _inflight.pop(cache_path, None)
+            else:
+                cached = await asyncio.shield(future)
+        data, width, height = cached
+        span.set_attribute("image.bytes", len(data))
+    return {"data": data, "media_type": IMAGE_MEDIA_TYPES[image_format], "width": width, "height": height, "file_hash": file_hash}
+
+def estimate_image_tokens(width: int, height: int, detail: Optional[str] = None) -> int:
+    """按512像素分块估算图片占用的token数（与常见视觉模型的计费方式一致）"""
+    if (detail or settings.IMAGE_DETAIL) == "low":
+        return 85
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+async def prepare_image(path: str) -> dict:
+    """
+    将上传的图片处理为发送给视觉模型的 data URL
+    :param path: 图片路径
+    :return: 包含 data_url、width、height、tokens、file_hash 的字典
+    """
+    variant = await get_image_variant(path, settings.IMAGE_MAX_SIDE)
+    encoded = base64.b64encode(variant["data"]).decode("ascii")
+    return {
+        "data_url": f"data:{variant['media_type']};base64,{encoded}",
+        "width": variant["width"],
+        "height": variant["height"],
+        "tokens": estimate_image_tokens(variant["width"], variant["height"]),
+        "file_hash": variant["file_hash"]
+    }
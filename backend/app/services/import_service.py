@@ -0,0 +1,348 @@
+import io
+import os
+import csv
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+from app.core.security import input_validator
+from app.db.repository import get_repository, using_sqlite
+from app.db.sqlite import dedicated_transaction, executemany
+from app.services.document_service import iter_xlsx_rows
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = {".csv", ".jsonl", ".xlsx"}
+RECORD_TYPES = ("scene", "rule", "audit_item")
+
+# 未提供 record_type 列时按工作表名称识别记录类型
+SHEET_RECORD_TYPES = {
+    "scene": "scene", "scenes": "scene", "业务场景": "scene",
+    "rule": "rule", "rules": "rule", "规则": "rule",
+    "audit_item": "audit_item", "audit_items": "audit_item", "审核项": "audit_item",
+}
+
+# 每累计多少条有效记录写入一次
+BATCH_SIZE = 1000
+# 错误报告中最多返回的行数
+MAX_REPORTED_ERRORS = 1000
+
+# 各记录类型写入的集合与字段（行中值的顺序）
+UPSERT_COLUMNS = {
+    "scene": ("business_scenes", ("_id", "name", "description", "created_at", "updated_at")),
+    "rule": ("rules", ("_id", "name", "scene_id", "description", "created_at", "updated_at")),
+    "audit_item": ("audit_items", ("_id", "name", "rule_id", "type", "criteria", "created_at", "updated_at")),
+}
+
+# 已存在的记录（相同 _id）只更新业务字段，保留 created_at
+UPSERT_SQL = {
+    record_type: (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        "ON CONFLICT(_id) DO UPDATE SET "
+        + ", ".join(f"{column} = excluded.{column}" for column in columns if column not in ("_id", "created_at"))
+    )
+    for record_type, (table, columns) in UPSERT_COLUMNS.items()
+}
+
+class _DryRun(Exception):
+    """试运行结束，回滚事务"""
+
+class _ParentNotFound(Exception):
+    """引用的上级记录尚未出现，稍后重试"""
+
+def _clean(record: dict) -> dict:
+    cleaned = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        key = str(key).strip().lower()
+        if isinstance(value, str):
+            value = value.strip()
+        cleaned[key] = value if value not in ("", None) else None
+    return cleaned
+
+def iter_import_records(source: BinaryIO, ext: str) -> Iterator[Tuple[int, Optional[str], dict]]:
+    """
+    流式解析导入文件
+    :param source: 二进制文件对象
+    :param ext: 文件扩展名
+    :return: (行号, 工作表名称, 记录) 迭代器；无法解析的行记录中带 __error__
+    """
+    if ext == ".csv":
+        reader = csv.DictReader(io.TextIOWrapper(source, encoding="utf-8-sig", newline=""))
+        for row_number, row in enumerate(reader, 2):
+            yield row_number, None, _clean(row)
+    elif ext == ".jsonl":
+        for row_number, line in enumerate(io.TextIOWrapper(source, encoding="utf-8-sig"), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row_number, None, {"__error__": f"JSON格式错误: {e.msg}"}
+                continue
+            if not isinstance(record, dict):
+                yield row_number, None, {"__error__": "每行必须是一个JSON对象"}
+                continue
+            yield row_number, None, _clean(record)
+    elif ext == ".xlsx":
+        header: List[str] = []
+        current_sheet = None
+        row_number = 0
+        for sheet_name, values in iter_xlsx_rows(source):
+            if sheet_name != current_sheet:
+                current_sheet, header, row_number = sheet_name, [], 0
+            row_number += 1
+            if not header:
+                header = [value.strip().lower() for value in values]
+                continue
+            if not any(values):
+                continue
+            record = _clean(dict(zip(header, values)))
+            if not record.get("record_type") and sheet_name.strip().lower() in SHEET_RECORD_TYPES:
+                record["record_type"] = SHEET_RECORD_TYPES[sheet_name.strip().lower()]
+            yield row_number, sheet_name, record
+    else:
+        raise ValueError(f"不支持的导入文件类型: {ext}")
+
+class CatalogImporter:
+    """校验、解析引用并按批交给 write 写入业务场景、规则与审核项"""
+
+    def __init__(self, scenes: Iterable[tuple], rules: Iterable[tuple], items: Iterable[tuple],
+                 write: Callable[[str, List[tuple]], None]):
+        """
+        :param scenes: 已有业务场景的 (_id, name)
+        :param rules: 已有规则的 (_id, name, scene_id)
+        :param items: 已有审核项的 (_id, name, rule_id)
+        :param write: 写入一批记录，参数为记录类型与按 UPSERT_COLUMNS 排列的行
+        """
+        self.write = write
+        self.now = datetime.utcnow().isoformat()
+        self.pending: Dict[str, list] = {record_type: [] for record_type in RECORD_TYPES}
+        self.created = {record_type: 0 for record_type in RECORD_TYPES}
+        self.updated = {record_type: 0 for record_type in RECORD_TYPES}
+        self.errors: List[dict] = []
+        self.failed = 0
+        self.deferred: List[tuple] = []
+
+        # 预加载已有数据的名称索引，按名称引用时无需逐行查询
+        self.scene_ids = set()
+        self.scenes_by_name: Dict[str, str] = {}
+        for _id, name in scenes:
+            self.scene_ids.add(_id)
+            self.scenes_by_name.setdefault(name, _id)
+        self.rule_ids = set()
+        self.rules_by_key: Dict[tuple, str] = {}
+        self.rules_by_name: Dict[str, set] = {}
+        for _id, name, scene_id in rules:
+            self._register_rule(_id, name, scene_id)
+        self.item_ids = set()
+        self.items_by_key: Dict[tuple, str] = {}
+        for _id, name, rule_id in items:
+            self.item_ids.add(_id)
+            self.items_by_key[(rule_id, name)] = _id
+
+    def _register_rule(self, rule_id: str, name: str, scene_id: str):
+        self.rule_ids.add(rule_id)
+        self.rules_by_key[(scene_id, name)] = rule_id
+        self.rules_by_name.setdefault(name, set()).add(rule_id)
+
+    def _resolve_scene(self, record: dict) -> str:
+        scene_id = record.get("scene_id")
+        if scene_id:
+            if scene_id not in self.scene_ids:
+                raise _ParentNotFound(f"业务场景不存在: {scene_id}")
+            return scene_id
+        scene_name = record.get("scene_name")
+        if not scene_name:
+            raise ValueError("缺少 scene_id 或 scene_name")
+        name = input_validator.sanitize_string(scene_name, 100)
+        if name not in self.scenes_by_name:
+            raise _ParentNotFound(f"业务场景不存在: {scene_name}")
+        return self.scenes_by_name[name]
+
+    def _resolve_rule(self, record: dict) -> str:
+        rule_id = record.get("rule_id")
+        if rule_id:
+            if rule_id not in self.rule_ids:
+                raise _ParentNotFound(f"规则不存在: {rule_id}")
+            return rule_id
+        rule_name = record.get("rule_name")
+        if not rule_name:
+            raise ValueError("缺少 rule_id 或 rule_name")
+        if record.get("scene_id") or record.get("scene_name"):
+            key = (self._resolve_scene(record), rule_name)
+            if key not in self.rules_by_key:
+                raise _ParentNotFound(f"规则不存在: {rule_name}")
+            return self.rules_by_key[key]
+        candidates = self.rules_by_name.get(rule_name, set())
+        if len(candidates) > 1:
+            raise ValueError(f"规则名称不唯一，请同时提供 scene_name 或 rule_id: {rule_name}")
+        if not candidates:
+            raise _ParentNotFound(f"规则不存在: {rule_name}")
+        return next(iter(candidates))
+
+    def _prepare_scene(self, record: dict) -> tuple:
+        name = input_validator.validate_name(record.get("name") or "", "name")
+        description = input_validator.validate_description(record.get("description"))
+        scene_id = record.get("_id") or self.scenes_by_name.get(name) or str(uuid4())
+        is_new = scene_id not in self.scene_ids
+        self.scene_ids.add(scene_id)
+        self.scenes_by_name[name] = scene_id
+        return is_new, (scene_id, name, description, self.now, self.now)
+
+    def _prepare_rule(self, record: dict) -> tuple:
+        name = record.get("name")
+        if not name:
+            raise ValueError("name不能为空")
+        scene_id = self._resolve_scene(record)
+        rule_id = record.get("_id") or self.rules_by_key.get((scene_id, name)) or str(uuid4())
+        is_new = rule_id not in self.rule_ids
+        self._register_rule(rule_id, name, scene_id)
+        return is_new, (rule_id, name, scene_id, record.get("description"), self.now, self.now)
+
+    def _prepare_audit_item(self, record: dict) -> tuple:
+        missing = [field for field in ("name", "type", "criteria") if not record.get(field)]
+        if missing:
+            raise ValueError(f"缺少必填字段: {', '.join(missing)}")
+        rule_id = self._resolve_rule(record)
+        name = record["name"]
+        item_id = record.get("_id") or self.items_by_key.get((rule_id, name)) or str(uuid4())
+        is_new = item_id not in self.item_ids
+        self.item_ids.add(item_id)
+        self.items_by_key[(rule_id, name)] = item_id
+        return is_new, (item_id, name, rule_id, record["type"], record["criteria"], self.now, self.now)
+
+    def _error(self, row_number: int, sheet: Optional[str], record_type: Optional[str], message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "sheet": sheet, "record_type": record_type, "error": message})
+
+    def add(self, row_number: int, sheet: Optional[str], record: dict, defer: bool = True):
+        """校验并暂存一条记录，上级记录尚未出现时延后处理"""
+        if "__error__" in record:
+            self._error(row_number, sheet, None, record["__error__"])
+            return
+        record_type = (record.get("record_type") or "").lower()
+        if record_type not in RECORD_TYPES:
+            self._error(row_number, sheet, record_type or None, f"record_type 必须是: {', '.join(RECORD_TYPES)}")
+            return
+        try:
+            is_new, row = getattr(self, f"_prepare_{record_type}")(record)
+        except _ParentNotFound as e:
+            if defer:
+                self.deferred.append((row_number, sheet, record))
+            else:
+                self._error(row_number, sheet, record_type, str(e))
+            return
+        except ValueError as e:
+            self._error(row_number, sheet, record_type, str(e))
+            return
+
+        (self.created if is_new else self.updated)[record_type] += 1
+        self.pending[record_type].append(row)
+        if sum(len(rows) for rows in self.pending.values()) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """按 场景 -> 规则 -> 审核项 的顺序批量写入，保证外键引用已存在"""
+        for record_type in RECORD_TYPES:
+            rows = self.pending[record_type]
+            if rows:
+                self.write(record_type, rows)
+                self.pending[record_type] = []
+
+    def finish(self):
+        """重试引用了文件中靠后记录的行，直到不再有进展"""
+        while self.deferred:
+            deferred, self.deferred = self.deferred, []
+            for row_number, sheet, record in deferred:
+                self.add(row_number, sheet, record)
+            if len(self.deferred) == len(deferred):
+                break
+        for row_number, sheet, record in self.deferred:
+            self.add(row_number, sheet, record, defer=False)
+        self.deferred = []
+        self.flush()
+
+    def report(self) -> dict:
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: (error["sheet"] or "", error["row"])),
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+def _run_import(importer: CatalogImporter, records: List[tuple]) -> dict:
+    for row_number, sheet, record in records:
+        importer.add(row_number, sheet, record)
+    importer.finish()
+    return importer.report()
+
+def _import_sqlite(records: List[tuple], dry_run: bool) -> dict:
+    """在独立连接上以一个事务写入，写入期间其他请求读不到未提交（或 dry_run 回滚）的数据"""
+    report = None
+    try:
+        with dedicated_transaction("import") as cursor:
+            importer = CatalogImporter(
+                cursor.execute("SELECT _id, name FROM business_scenes").fetchall(),
+                cursor.execute("SELECT _id, name, scene_id FROM rules").fetchall(),
+                cursor.execute("SELECT _id, name, rule_id FROM audit_items").fetchall(),
+                lambda record_type, rows: executemany(cursor, UPSERT_SQL[record_type], rows)
+            )
+            report = _run_import(importer, records)
+            if dry_run:
+                raise _DryRun()
+    except _DryRun:
+        pass
+    return report
+
+async def _import_repository(records: List[tuple], dry_run: bool) -> dict:
+    """
+    其他存储后端没有跨集合事务：全部记录校验完成后才按批 upsert（场景 -> 规则 -> 审核项），
+    有校验错误的行不写入，写入过程中失败时已写入的批次不会回滚
+    """
+    repository = get_repository()
+    batches: List[tuple] = []
+    importer = CatalogImporter(
+        [(d["_id"], d["name"]) for d in await repository.find("business_scenes", fields=("_id", "name"))],
+        [(d["_id"], d["name"], d["scene_id"]) for d in await repository.find("rules", fields=("_id", "name", "scene_id"))],
+        [(d["_id"], d["name"], d["rule_id"]) for d in await repository.find("audit_items", fields=("_id", "name", "rule_id"))],
+        lambda record_type, rows: batches.append((record_type, rows))
+    )
+    report = _run_import(importer, records)
+    if not dry_run:
+        for record_type, rows in batches:
+            collection, columns = UPSERT_COLUMNS[record_type]
+            await repository.upsert_many(collection, [dict(zip(columns, row)) for row in rows])
+    return report
+
+async def import_catalog(source: BinaryIO, filename: str, dry_run: bool = False) -> dict:
+    """
+    导入业务场景、规则与审核项：先在线程中把文件解析到内存，再按存储后端写入
+    （SQLite在独立连接上以一个事务写入）
+    :param source: 二进制文件对象
+    :param filename: 原始文件名，用于判断格式
+    :param dry_run: 只校验不写入
+    :return: 导入报告
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in IMPORT_FORMATS:
+        raise ValueError(f"不支持的导入文件类型，允许的类型: {', '.join(sorted(IMPORT_FORMATS))}")
+
+    # 解析不占用写锁，写锁只在写入阶段持有
+    records = await asyncio.to_thread(lambda: list(iter_import_records(source, ext)))
+    if using_sqlite():
+        report = await asyncio.to_thread(_import_sqlite, records, dry_run)
+    else:
+        report = await _import_repository(records, dry_run)
+
+    report["dry_run"] = dry_run
+    logger.info(
+        "Catalog import finished: created=%s updated=%s failed=%d dry_run=%s",
+        report["created"], report["updated"], report["failed"], dry_run
+    )
+    return report
@@ -0,0 +1,508 @@
+import os
+import re
+import json
+import math
+import zlib
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Union
+from app.core.config import settings
+from app.core.tracing import tracer
+from app.db.sqlite import connect_readonly, dedicated_transaction, executemany
+from app.services.document_service import extract_text, resolve_upload_path
+from app.services.token_service import estimate_tokens, split_by_tokens, truncate_to_tokens
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 英文、数字按单词切分，中文按单字切分（再补充相邻二元组）
+_TERM_PATTERN = re.compile(r"[a-z0-9]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+# 暴力检索时每次参与计算的向量行数，避免一次性把整个内存映射矩阵读入内存
+_SCAN_BLOCK_ROWS = 65536
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class HashingEmbedder:
+    """哈希TF-IDF向量：词项哈希到固定维度后取对数词频，IDF在检索时作用于查询向量"""
+    uses_idf = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing-tfidf-{dim}"
+
+    @staticmethod
+    def terms(text: str) -> List[str]:
+        units = _TERM_PATTERN.findall(text.lower())
+        bigrams = [left + right for left, right in zip(units, units[1:]) if len(left) == 1 and len(right) == 1 and not left.isascii()]
+        return units + bigrams
+
+    def embed(self, texts: Sequence[str]):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [zlib.crc32(term.encode("utf-8")) % self.dim for term in self.terms(text)]
+            if buckets:
+                matrix[row] = np.bincount(buckets, minlength=self.dim)
+        np.log1p(matrix, out=matrix)
+        return _normalize(matrix)
+
+class SentenceTransformerEmbedder:
+    """本地CPU上运行的 sentence-transformers 向量模型"""
+    uses_idf = False
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"sentence-transformers-{model_name}"
+
+    def embed(self, texts: Sequence[str]):
+        vectors = self.model.encode(list(texts), batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32)
+
+def get_embedder():
+    """
+    按配置选择向量模型：配置了 KB_EMBEDDING_MODEL 且安装了 sentence-transformers 时使用本地模型，
+    否则退回哈希TF-IDF
+    :return: 向量模型
+    """
+    if settings.KB_EMBEDDING_MODEL:
+        try:
+            return SentenceTransformerEmbedder(settings.KB_EMBEDDING_MODEL)
+        except ImportError:
+            logger.warning("sentence-transformers未安装，知识库退回使用哈希TF-IDF向量")
+        except Exception as e:
+            logger.warning("加载向量模型 %s 失败，知识库退回使用哈希TF-IDF向量: %s", settings.KB_EMBEDDING_MODEL, e)
+    return HashingEmbedder(settings.KB_VECTOR_DIM)
+
+class _VectorStore:
+    """按行追加的内存映射向量矩阵，容量不足时成倍扩展文件"""
+    def __init__(self, path: str, dim: int, count: int):
+        self.path = path
+        self.dim = dim
+        self.count = count
+        self.capacity = 0
+        self.matrix = None
+        self._open(max(count, 1024))
+
+    def _open(self, capacity: int):
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        size = capacity * self.dim * 4
+        open(self.path, "ab").close()
+        if os.path.getsize(self.path) < size:
+            os.truncate(self.path, size)
+        self.capacity = os.path.getsize(self.path) // (self.dim * 4)
+        self.matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def append(self, vectors) -> int:
+        start = self.count
+        end = start + len(vectors)
+        if end > self.capacity:
+            self._open(max(end, self.capacity * 2))
+        self.matrix[start:end] = vectors
+        self.count = end
+        return start
+
+    def rows(self):
+        return self.matrix[:self.count]
+
+    def reset(self):
+        self.count = 0
+
+    def flush(self):
+        self.matrix.flush()
+
+class _IVFIndex:
+    """倒排文件近似最近邻索引：k-means聚类中心，检索时只扫描与查询最接近的若干个簇"""
+    def __init__(self):
+        self.centroids = None
+        self.assignments = None
+        self.trained_count = 0
+        self._lists = None
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors, iterations: int = 10, seed: int = 0):
+        count = len(vectors)
+        nlist = min(1024, max(16, int(math.sqrt(count))))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(count, size=min(count, max(nlist * 40, 10000)), replace=False))
+        data = np.asarray(vectors[sample])
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            present, starts = np.unique(labels[order], return_index=True)
+            # 空簇保留原中心
+            centroids[present] = _normalize(np.add.reduceat(data[order], starts, axis=0))
+        self.centroids = centroids
+        self.assignments = self.assign(vectors)
+        self.trained_count = count
+        self._lists = None
+
+    def assign(self, vectors):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + _SCAN_BLOCK_ROWS])
+            labels[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def add(self, vectors):
+        if self.trained:
+            self.assignments = np.concatenate([self.assignments, self.assign(vectors)])
+            self._lists = None
+
+    def candidates(self, query, nprobe: int):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        order, bounds = self._lists
+        nprobe = min(max(1, nprobe), len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.sort(np.concatenate([order[bounds[probe]:bounds[probe + 1]] for probe in probes]))
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments, trained_count=self.trained_count)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, count: int) -> "_IVFIndex":
+        index = cls()
+        if os.path.exists(path):
+            data = np.load(path)
+            if len(data["assignments"]) == count:
+                index.centroids = data["centroids"]
+                index.assignments = data["assignments"]
+                index.trained_count = int(data["trained_count"])
+            else:
+                logger.warning("知识库近似索引与向量数量不一致，将在下次写入时重新训练")
+        return index
+
+def _top_k(vectors, query, k: int, rows=None) -> List[tuple]:
+    """在全部向量或指定行中分块计算内积，返回得分最高的 (行号, 得分)"""
+    best_rows, best_scores = [], []
+    total = len(vectors) if rows is None else len(rows)
+    for start in range(0, total, _SCAN_BLOCK_ROWS):
+        if rows is None:
+            block_rows = np.arange(start, min(total, start + _SCAN_BLOCK_ROWS))
+            block = np.asarray(vectors[start:start + _SCAN_BLOCK_ROWS])
+        else:
+            block_rows = rows[start:start + _SCAN_BLOCK_ROWS]
+            block = vectors[block_rows]
+        scores = block @ query
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            block_rows, scores = block_rows[keep], scores[keep]
+        best_rows.append(block_rows)
+        best_scores.append(scores)
+    if not best_rows:
+        return []
+    rows_all, scores_all = np.concatenate(best_rows), np.concatenate(best_scores)
+    order = np.argsort(-scores_all, kind="stable")[:k]
+    return [(int(rows_all[i]), float(scores_all[i])) for i in order if scores_all[i] > 0]
+
+class KnowledgeBase:
+    """
+    参考资料知识库：文件切片后向量化，向量存放在内存映射矩阵中（行号即 kb_chunks._id），
+    片段文本与所属文件保存在SQLite中。删除文件只删除元数据，向量行在重建时回收。
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.KNOWLEDGE_BASE_DIR
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if np is None:
+                raise RuntimeError("知识库需要安装numpy")
+            os.makedirs(self.directory, exist_ok=True)
+            self.embedder = get_embedder()
+            meta = {}
+            if os.path.exists(self._path("meta.json")):
+                with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+
+            reembed = bool(meta) and meta.get("embedder") != self.embedder.name
+            if reembed:
+                logger.warning("知识库向量模型由 %s 变为 %s，重新向量化全部片段", meta.get("embedder"), self.embedder.name)
+                for name in ("vectors.f32", "ivf.npz", "df.npy"):
+                    if os.path.exists(self._path(name)):
+                        os.remove(self._path(name))
+                meta = {}
+
+            count = meta.get("count", 0)
+            self.store = _VectorStore(self._path("vectors.f32"), self.embedder.dim, count)
+            self.df = np.load(self._path("df.npy")) if os.path.exists(self._path("df.npy")) else np.zeros(self.embedder.dim, dtype=np.float32)
+            self.chunk_count = meta.get("chunks", 0)
+            self.ivf = _IVFIndex.load(self._path("ivf.npz"), count)
+            self._loaded = True
+
+            # 元数据写入了但向量未落盘（进程中途退出）时同样需要重建
+            conn = connect_readonly()
+            try:
+                max_id = conn.execute("SELECT MAX(_id) FROM kb_chunks").fetchone()[0]
+            finally:
+                conn.close()
+            if reembed or (max_id is not None and max_id >= count):
+                self.rebuild()
+
+    def _save_state(self, ivf_changed: bool = False):
+        self.store.flush()
+        np.save(self._path("df.tmp.npy"), self.df)
+        os.replace(self._path("df.tmp.npy"), self._path("df.npy"))
+        if ivf_changed and self.ivf.trained:
+            self.ivf.save(self._path("ivf.npz"))
+        with open(self._path("meta.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump({"embedder": self.embedder.name, "dim": self.embedder.dim, "count": self.store.count, "chunks": self.chunk_count}, f)
+        os.replace(self._path("meta.tmp.json"), self._path("meta.json"))
+
+    def _append(self, vectors):
+        self.store.append(vectors)
+        self.df += (vectors > 0).sum(axis=0)
+        self.chunk_count += len(vectors)
+        # 向量数量翻倍后重新训练聚类中心，否则只把新向量分配到已有的簇
+        retrain = self.store.count >= settings.KB_IVF_MIN_VECTORS and self.store.count >= 2 * self.ivf.trained_count
+        if retrain:
+            with tracer.span("knowledge_base.train_index", **{"kb.vectors": self.store.count}):
+                self.ivf.train(self.store.rows())
+        else:
+            self.ivf.add(vectors)
+        self._save_state(ivf_changed=self.ivf.trained)
+
+    def _remove_chunks(self, cursor, file_key: str) -> int:
+        ids = [row[0] for row in cursor.execute("SELECT _id FROM kb_chunks WHERE file_key = ?", (file_key,)).fetchall()]
+        if ids:
+            self.df -= (self.store.matrix[np.array(ids)] > 0).sum(axis=0)
+            np.maximum(self.df, 0, out=self.df)
+            self.chunk_count -= len(ids)
+            cursor.execute("DELETE FROM kb_chunks WHERE file_key = ?", (file_key,))
+        return len(ids)
+
+    def index_document(self, file_ref: Union[str, dict]) -> dict:
+        """
+        解析文件并切片、向量化后写入知识库，同一文件重复索引时替换原有片段
+        :param file_ref: 文件引用
+        :return: 文件标识、名称与片段数
+        """
+        self._load()
+        path = resolve_upload_path(file_ref)
+        file_key = os.path.basename(path)
+        name = (file_ref.get("name") or file_ref.get("filename") if isinstance(file_ref, dict) else None) or file_key
+        with tracer.span("knowledge_base.index", **{"document.name": name}) as span:
+            text = extract_text(path)
+            chunks = [chunk.strip() for chunk in split_by_tokens(text, settings.KB_CHUNK_TOKENS) if chunk.strip()] if text.strip() else []
+            if not chunks:
+                raise ValueError(f"未能从文件中提取文本: {name}")
+            vectors = self.embedder.embed(chunks)
+            span.set_attribute("kb.chunks", len(chunks))
+
+            now = datetime.utcnow().isoformat()
+            with self._lock, dedicated_transaction("knowledge_base") as cursor:
+                self._remove_chunks(cursor, file_key)
+                start = self.store.count
+                executemany(
+                    cursor,
+                    "INSERT INTO kb_chunks (_id, file_key, chunk_index, text) VALUES (?, ?, ?, ?)",
+                    [(start + index, file_key, index, chunk) for index, chunk in enumerate(chunks)]
+                )
+                cursor.execute(
+                    """
+                    INSERT INTO kb_documents (file_key, name, chunks, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(file_key) DO UPDATE SET name = excluded.name, chunks = excluded.chunks, updated_at = excluded.updated_at
+                    """,
+                    (file_key, name, len(chunks), now, now)
+                )
+                # 向量先于事务提交落盘，异常退出时只会留下无元数据的向量行
+                self._append(vectors)
+        logger.info("Indexed %s into knowledge base with %d chunks", name, len(chunks))
+        return {"file_key": file_key, "name": name, "chunks": len(chunks)}
+
+    def ensure_indexed(self, file_keys: Iterable[str]) -> int:
+        """
+        将尚未加入知识库的上传文件加入知识库，无法解析的文件只记录警告
+        :param file_keys: 文件标识（上传目录中的文件名）
+        :return: 新加入的文件数
+        """
+        file_keys = list(file_keys)
+        if not file_keys:
+            return 0
+        conn = connect_readonly()
+        try:
+            placeholders = ", ".join("?" for _ in file_keys)
+            existing = {row[0] for row in conn.execute(f"SELECT file_key FROM kb_documents WHERE file_key IN ({placeholders})", tuple(file_keys))}
+        finally:
+            conn.close()
+        indexed = 0
+        for file_key in file_keys:
+            if file_key in existing:
+                continue
+            try:
+                self.index_document(file_key)
+                indexed += 1
+            except (ValueError, FileNotFoundError) as e:
+                logger.warning("Failed to index reference material %s: %s", file_key, e)
+        return indexed
+
+    def remove_document(self, file_key: str) -> bool:
+        """
+        从知识库中删除文件
+        :param file_key: 文件标识（上传目录中的文件名）
+        :return: 文件是否存在
+        """
+        self._load()
+        with self._lock, dedicated_transaction("knowledge_base") as cursor:
+            self._remove_chunks(cursor, file_key)
+            cursor.execute("DELETE FROM kb_documents WHERE file_key = ? RETURNING file_key", (file_key,))
+            removed = cursor.fetchone() is not None
+            self._save_state()
+        return removed
+
+    def list_documents(self) -> List[dict]:
+        conn = connect_readonly()
+        try:
+            rows = conn.execute("SELECT file_key, name, chunks, created_at, updated_at FROM kb_documents ORDER BY created_at").fetchall()
+        finally:
+            conn.close()
+        return [dict(zip(("file_key", "name", "chunks", "created_at", "updated_at"), row)) for row in rows]
+
+    def rebuild(self) -> dict:
+        """
+        按片段文本重新向量化并紧凑存放（回收已删除文件的向量行），然后重新训练近似索引。
+        知识库的写入都持有 self._lock，向量化与训练期间片段不会变化，因此在事务外完成，
+        只在替换片段与向量时持有SQLite写锁
+        :return: 片段数
+        """
+        self._load()
+        with self._lock, tracer.span("knowledge_base.rebuild") as span:
+            conn = connect_readonly()
+            try:
+                rows = conn.execute("SELECT file_key, chunk_index, text FROM kb_chunks ORDER BY _id").fetchall()
+            finally:
+                conn.close()
+            vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+            if rows:
+                vectors = np.concatenate([self.embedder.embed([row[2] for row in rows[start:start + 256]]) for start in range(0, len(rows), 256)])
+            ivf = _IVFIndex()
+            if len(rows) >= settings.KB_IVF_MIN_VECTORS:
+                ivf.train(vectors)
+
+            with dedicated_transaction("knowledge_base") as cursor:
+                cursor.execute("DELETE FROM kb_chunks")
+                executemany(cursor, "INSERT INTO kb_chunks (_id, file_key, chunk_index, text) VALUES (?, ?, ?, ?)", [(index, *row) for index, row in enumerate(rows)])
+                # 与写入时相同，向量先于事务提交落盘
+                self.store.reset()
+                self.store.append(vectors)
+                self.df = (vectors > 0).sum(axis=0).astype(np.float32)
+                self.chunk_count = len(rows)
+                self.ivf = ivf
+                if not ivf.trained and os.path.exists(self._path("ivf.npz")):
+                    os.remove(self._path("ivf.npz"))
+                self._save_state(ivf_changed=True)
+            span.set_attribute("kb.chunks", len(rows))
+        logger.info("Rebuilt knowledge base with %d chunks", len(rows))
+        return {"chunks": len(rows)}
+
+    def _query_vector(self, text: str):
+        vector = self.embedder.embed([text])[0]
+        if self.embedder.uses_idf:
+            idf = np.log((1 + self.chunk_count) / (1 + self.df)) + 1
+            # 片段向量只含词频，IDF平方作用在查询上等价于两侧各乘一次IDF
+            vector = _normalize(vector * idf * idf)
+        return vector
+
+    def search(self, text: str, top_k: Optional[int] = None, file_keys: Optional[Iterable[str]] = None) -> List[dict]:
+        """
+        检索与查询最相关的片段：指定文件范围时精确计算，否则在近似索引上检索
+        :param text: 查询文本
+        :param top_k: 返回的片段数
+        :param file_keys: 只在这些文件中检索，为None时检索全部
+        :return: 片段列表（按相关度降序）
+        """
+        self._load()
+        top_k = top_k or settings.KB_TOP_K
+        query_vector = self._query_vector(text)
+        conn = connect_readonly()
+        try:
+            with self._lock:
+                if file_keys is not None:
+                    file_keys = list(file_keys)
+                    if not file_keys:
+                        return []
+                    placeholders = ", ".join("?" for _ in file_keys)
+                    rows = np.array([row[0] for row in conn.execute(f"SELECT _id FROM kb_chunks WHERE file_key IN ({placeholders})", tuple(file_keys))], dtype=np.int64)
+                    hits = _top_k(self.store.matrix, query_vector, top_k, rows) if len(rows) else []
+                else:
+                    rows = self.ivf.candidates(query_vector, settings.KB_IVF_NPROBE) if self.ivf.trained else None
+                    # 已删除文件的向量行仍在矩阵中，多取一些再按元数据过滤
+                    hits = _top_k(self.store.rows(), query_vector, top_k * 3, rows)
+            if not hits:
+                return []
+            scores = dict(hits)
+            placeholders = ", ".join("?" for _ in hits)
+            chunks = conn.execute(
+                f"""
+                SELECT c._id, c.file_key, d.name, c.chunk_index, c.text
+                FROM kb_chunks c JOIN kb_documents d ON d.file_key = c.file_key
+                WHERE c._id IN ({placeholders})
+                """,
+                tuple(scores)
+            ).fetchall()
+        finally:
+            conn.close()
+        passages = [
+            {"file_key": file_key, "name": name, "chunk_index": chunk_index, "text": chunk_text, "score": round(scores[chunk_id], 4)}
+            for chunk_id, file_key, name, chunk_index, chunk_text in chunks
+        ]
+        passages.sort(key=lambda passage: passage["score"], reverse=True)
+        return passages[:top_k]
+
+knowledge_base = KnowledgeBase()
+
+async def retrieve_passages(text: str, top_k: Optional[int] = None, file_keys: Optional[Iterable[str]] = None) -> List[dict]:
+    """在线程池中检索知识库，避免向量计算阻塞事件循环"""
+    with tracer.span("knowledge_base.search") as span:
+        passages = await asyncio.to_thread(knowledge_base.search, text, top_k, file_keys)
+        span.set_attribute("kb.passages", len(passages))
+    return passages
+
+def format_passages(passages: List[dict], max_tokens: Optional[int] = None) -> str:
+    """
+    将检索到的片段拼接为提示词中的参考资料，总长度不超过 max_tokens
+    :param passages: 片段列表
+    :param max_tokens: token上限，默认使用 KB_CONTEXT_TOKENS
+    :return: 参考资料文本，无片段时返回"无"
+    """
+    max_tokens = max_tokens or settings.KB_CONTEXT_TOKENS
+    parts, used = [], 0
+    for passage in passages:
+        part = f"【{passage['name']} 片段{passage['chunk_index'] + 1}】\n{passage['text']}"
+        tokens = estimate_tokens(part)
+        if used + tokens > max_tokens:
+            if not parts:
+                parts.append(truncate_to_tokens(part, max_tokens))
+            break
+        parts.append(part)
+        used += tokens
+    return "\n\n".join(parts) or "无"
@@ -0,0 +1,124 @@
+import os
+import shutil
+import logging
+import importlib.util
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.metrics import ocr_pages_total
+from app.db.sqlite import connect_readonly, dedicated_transaction
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_available: Optional[bool] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.OCR_WORKERS or os.cpu_count() or 1)
+    return _pool
+
+def shutdown_ocr_pool():
+    """关闭OCR进程池"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def ocr_available() -> bool:
+    """OCR已启用且安装了pytesseract与tesseract程序，首次检查不可用时记录一次警告"""
+    global _available
+    if _available is None:
+        _available = False
+        if settings.OCR_ENABLED:
+            command = settings.OCR_TESSERACT_CMD or "tesseract"
+            # pytesseract会连带导入numpy等模块，只在子进程中实际导入
+            if importlib.util.find_spec("pytesseract") is None:
+                logger.warning("pytesseract未安装，跳过OCR")
+            elif shutil.which(command) is None:
+                logger.warning("未找到tesseract程序（%s），跳过OCR", command)
+            else:
+                _available = True
+    return _available
+
+def pdf_rendering_available() -> bool:
+    """扫描件PDF的页面需要先用pypdfium2渲染为图片才能OCR"""
+    return pypdfium2 is not None
+
+def settings_key() -> str:
+    """影响识别结果的OCR参数，作为缓存键的一部分"""
+    return f"{settings.OCR_LANG}|{settings.OCR_DPI}|{settings.OCR_PSM}"
+
+def _ocr_page(path: str, page_index: int, is_pdf: bool, dpi: int, lang: str, psm: int, tesseract_cmd: str) -> str:
+    """
+    在子进程中执行：渲染PDF页面或读取图片的指定帧，转为灰度后用tesseract识别
+    :return: 识别出的文本
+    """
+    # 并行度由进程池控制，避免每个tesseract进程再开多个线程
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    import pytesseract
+    from PIL import Image, ImageOps
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    if is_pdf:
+        import pypdfium2
+        document = pypdfium2.PdfDocument(path)
+        try:
+            image = document[page_index].render(scale=dpi / 72).to_pil()
+        finally:
+            document.close()
+    else:
+        with Image.open(path) as source:
+            source.seek(page_index)
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    return pytesseract.image_to_string(image.convert("L"), lang=lang, config=f"--psm {psm}")
+
+def submit_page(path: str, page_index: int, is_pdf: bool) -> Future:
+    """
+    将一页提交到OCR进程池
+    :param path: 文件路径
+    :param page_index: PDF页码或图片帧序号（从0开始）
+    :param is_pdf: 是否为PDF
+    :return: 结果为识别文本的 Future
+    """
+    return _get_pool().submit(
+        _ocr_page, path, page_index, is_pdf,
+        settings.OCR_DPI, settings.OCR_LANG, settings.OCR_PSM, settings.OCR_TESSERACT_CMD
+    )
+
+def load_cached_pages(file_hash: str) -> Dict[int, str]:
+    """
+    读取文件在当前OCR参数下已缓存的页面文本（可在线程中调用，使用独立只读连接）
+    :param file_hash: 文件内容哈希
+    :return: 页码 -> 文本
+    """
+    conn = connect_readonly()
+    try:
+        rows = conn.execute(
+            "SELECT page, text FROM ocr_page_cache WHERE file_hash = ? AND settings_key = ?",
+            (file_hash, settings_key())
+        ).fetchall()
+    finally:
+        conn.close()
+    ocr_pages_total.inc(len(rows), source="cache")
+    return {page: text for page, text in rows}
+
+def save_cached_page(file_hash: str, page_index: int, text: str):
+    """
+    保存一页的识别结果，页面完成即写入，中途失败时已完成的页面不必重做。
+    在文档解析线程中调用，使用独立连接，不与事件循环共用全局连接的游标和事务
+    """
+    with dedicated_transaction("ocr_page_cache") as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO ocr_page_cache (file_hash, page, settings_key, text, created_at) VALUES (?, ?, ?, ?, ?)",
+            (file_hash, page_index, settings_key(), text, datetime.utcnow().isoformat())
+        )
@@ -0,0 +1,99 @@
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List
+from app.core.config import settings
+from app.core.tracing import tracer
+from app.db.repository import WriteOp, get_repository
+from app.services.document_service import load_document, resolve_upload_path
+from app.services.token_service import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# 单条 IN (...) 查询中的最大参数个数
+IN_QUERY_BATCH = 500
+
+def normalize_reference_materials(paths: Iterable[str]) -> List[tuple]:
+    """
+    校验参考材料均为已上传的文件，返回 (原始路径, 文件标识) 列表，重复的文件只保留一次
+    :param paths: 参考材料文件路径
+    :return: (file_path, file_key) 列表
+    """
+    materials, seen = [], set()
+    for path in paths or []:
+        file_key = os.path.basename(resolve_upload_path(path))
+        if file_key not in seen:
+            seen.add(file_key)
+            materials.append((path, file_key))
+    return materials
+
+def replace_rule_references(rule_id: str, materials: List[tuple]) -> List[WriteOp]:
+    """生成用新的参考材料整体替换规则原有参考材料的写操作，与规则的写入一起通过 bulk_write 执行"""
+    now = datetime.utcnow().isoformat()
+    return [WriteOp.delete("rule_reference_materials", {"rule_id": rule_id})] + [
+        WriteOp.insert("rule_reference_materials", {
+            "rule_id": rule_id, "position": position, "file_path": path, "file_key": file_key, "created_at": now
+        })
+        for position, (path, file_key) in enumerate(materials)
+    ]
+
+async def load_reference_rows(rule_ids: Iterable[str]) -> Dict[str, List[tuple]]:
+    """
+    按 IN (...) 批量加载多个规则的参考材料，避免逐个规则查询
+    :param rule_ids: 规则ID
+    :return: 规则ID -> [(file_path, file_key)]，按添加顺序排列
+    """
+    rule_ids = list(dict.fromkeys(rule_ids))
+    references: Dict[str, List[tuple]] = defaultdict(list)
+    for start in range(0, len(rule_ids), IN_QUERY_BATCH):
+        batch = rule_ids[start:start + IN_QUERY_BATCH]
+        rows = await get_repository().find(
+            "rule_reference_materials", {"rule_id": batch},
+            ("rule_id", "file_path", "file_key"), sort=[("rule_id", 1), ("position", 1)]
+        )
+        for row in rows:
+            references[row["rule_id"]].append((row["file_path"], row["file_key"]))
+    return references
+
+async def load_reference_materials(rule_ids: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    批量加载多个规则的参考材料文件路径
+    :param rule_ids: 规则ID
+    :return: 规则ID -> 文件路径列表
+    """
+    rows = await load_reference_rows(rule_ids)
+    return {rule_id: [file_path for file_path, _ in materials] for rule_id, materials in rows.items()}
+
+async def load_reference_texts(references: Dict[str, List[tuple]]) -> Dict[str, str]:
+    """
+    读取规则参考材料的文本，多个规则共用的文件只解析一次
+    :param references: load_reference_rows 的返回值
+    :return: 规则ID -> 拼接后的参考资料文本（不超过 KB_CONTEXT_TOKENS），无可用文本时为"无"
+    """
+    file_keys = list(dict.fromkeys(file_key for materials in references.values() for _, file_key in materials))
+    if not file_keys:
+        return {rule_id: "无" for rule_id in references}
+    with tracer.span("rule_references.preload", **{"reference.files": len(file_keys)}):
+        documents = await asyncio.gather(*[load_document(file_key) for file_key in file_keys], return_exceptions=True)
+    contents = {}
+    for file_key, document in zip(file_keys, documents):
+        if isinstance(document, Exception):
+            logger.warning("Failed to load reference material %s: %s", file_key, document)
+        elif document["content"].strip():
+            contents[file_key] = document["content"]
+
+    texts = {}
+    for rule_id, materials in references.items():
+        parts = [f"【{os.path.basename(file_path)}】\n{contents[file_key]}" for file_path, file_key in materials if file_key in contents]
+        texts[rule_id] = truncate_to_tokens("\n\n".join(parts), settings.KB_CONTEXT_TOKENS) if parts else "无"
+    return texts
+
+async def set_rule_references(rule_id: str, materials: List[tuple]):
+    """
+    单独替换规则的参考材料
+    :param rule_id: 规则ID
+    :param materials: normalize_reference_materials 的返回值
+    """
+    await get_repository().bulk_write(replace_rule_references(rule_id, materials))
@@ -0,0 +1,191 @@
+import time
+import asyncio
+import logging
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.metrics import ai_scheduler_wait_seconds, ai_scheduler_queue_depth, ai_scheduler_in_flight
+
+logger = logging.getLogger(__name__)
+
+# 优先级从高到低：交互式（规则校验、优化）总是先于批量审核出队
+PRIORITY_CLASSES = ("interactive", "bulk")
+
+# 当前协程发起的大模型调用所属的优先级与场景/任务，未设置时视为交互式调用
+_llm_context: ContextVar[dict] = ContextVar("llm_context", default={"priority": "interactive", "scene_id": None, "task_id": None})
+
+@contextmanager
+def llm_priority(priority: str, scene_id: Optional[str] = None, task_id: Optional[str] = None):
+    """
+    设置代码块内大模型调用的调度类别，asyncio.gather 等创建的子任务会继承该设置
+    :param priority: interactive / bulk
+    :param scene_id: 业务场景ID，用于场景间公平分配与并发上限
+    :param task_id: 审核任务ID，同一场景内按任务公平分配
+    """
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"未知的调度优先级: {priority}")
+    token = _llm_context.set({"priority": priority, "scene_id": scene_id, "task_id": task_id})
+    try:
+        yield
+    finally:
+        _llm_context.reset(token)
+
+class _Request:
+    __slots__ = ("priority", "scene_id", "flow", "cost", "future")
+
+    def __init__(self, priority: str, scene_id: Optional[str], flow: tuple, cost: int, future: asyncio.Future):
+        self.priority = priority
+        self.scene_id = scene_id
+        self.flow = flow
+        self.cost = cost
+        self.future = future
+
+class LLMScheduler:
+    """
+    大模型调用调度器：限制全局并发，交互式调用总是先于批量审核出队，并保留 interactive_reserved 个名额。
+    批量调用按两级加权公平排队：先在场景之间、再在场景内的任务之间分配，同一任务内先来先出。
+    每个场景/任务维护虚拟进度（已放行请求的预估token累计），放行时选择进度最小者；
+    重新变为活跃的场景/任务从当前虚拟时间开始计算，空闲期间不积累额度。
+    选择在放行时进行，因此一个任务一次提交大量请求也只能按份额被放行。
+    """
+    def __init__(self, capacity: Optional[int] = None, interactive_reserved: Optional[int] = None, scene_limit: Optional[int] = None):
+        self.capacity = max(1, capacity or settings.AI_MAX_CONCURRENCY)
+        reserved = settings.AI_INTERACTIVE_RESERVED if interactive_reserved is None else interactive_reserved
+        # 至少留一个名额给批量审核
+        self.interactive_reserved = min(max(0, reserved), self.capacity - 1)
+        self.scene_limit = settings.AI_SCENE_MAX_CONCURRENCY if scene_limit is None else scene_limit
+        # 优先级 -> 场景 -> 流(任务) -> 排队请求
+        self._queues: Dict[str, Dict[Optional[str], Dict[tuple, deque]]] = {priority: {} for priority in PRIORITY_CLASSES}
+        self._running: Dict[str, int] = defaultdict(int)
+        self._scene_running: Dict[Optional[str], int] = defaultdict(int)
+        # (优先级, 场景) 与流的虚拟进度，以及对应层级的虚拟时间（最近一次放行时的进度）
+        self._scene_pass: Dict[tuple, float] = {}
+        self._flow_pass: Dict[tuple, float] = {}
+        self._scene_clock: Dict[str, float] = defaultdict(float)
+        self._flow_clock: Dict[tuple, float] = defaultdict(float)
+        # 排队与进行中的请求数，降为0时清理进度
+        self._scene_active: Dict[tuple, int] = defaultdict(int)
+        self._flow_active: Dict[tuple, int] = defaultdict(int)
+
+    def _activate(self, request: _Request):
+        scene_key = (request.priority, request.scene_id)
+        if self._scene_active[scene_key] == 0:
+            self._scene_pass[scene_key] = self._scene_clock[request.priority]
+        if self._flow_active[request.flow] == 0:
+            self._flow_pass[request.flow] = self._flow_clock[scene_key]
+        self._scene_active[scene_key] += 1
+        self._flow_active[request.flow] += 1
+
+    def _deactivate(self, request: _Request):
+        scene_key = (request.priority, request.scene_id)
+        self._flow_active[request.flow] -= 1
+        if self._flow_active[request.flow] <= 0:
+            del self._flow_active[request.flow]
+            del self._flow_pass[request.flow]
+        self._scene_active[scene_key] -= 1
+        if self._scene_active[scene_key] <= 0:
+            del self._scene_active[scene_key]
+            del self._scene_pass[scene_key]
+            self._flow_clock.pop(scene_key, None)
+
+    def _can_start(self, priority: str, scene_id: Optional[str]) -> bool:
+        if sum(self._running.values()) >= self.capacity:
+            return False
+        if priority == "bulk":
+            if self._running["bulk"] >= self.capacity - self.interactive_reserved:
+                return False
+            if self.scene_limit and scene_id is not None and self._scene_running[scene_id] >= self.scene_limit:
+                return False
+        return True
+
+    def _start(self, request: _Request):
+        self._running[request.priority] += 1
+        if request.priority == "bulk" and request.scene_id is not None:
+            self._scene_running[request.scene_id] += 1
+        ai_scheduler_in_flight.inc(priority=request.priority)
+
+    def _release(self, request: _Request):
+        self._running[request.priority] -= 1
+        if request.priority == "bulk" and request.scene_id is not None:
+            self._scene_running[request.scene_id] -= 1
+            if self._scene_running[request.scene_id] <= 0:
+                del self._scene_running[request.scene_id]
+        ai_scheduler_in_flight.dec(priority=request.priority)
+        self._deactivate(request)
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级依次放行：选出虚拟进度最小且未达到并发上限的场景，再选该场景内进度最小的任务"""
+        for priority in PRIORITY_CLASSES:
+            scenes = self._queues[priority]
+            while scenes:
+                ready = [scene_id for scene_id in scenes if self._can_start(priority, scene_id)]
+                if not ready:
+                    break
+                scene_id = min(ready, key=lambda scene: self._scene_pass[(priority, scene)])
+                flows = scenes[scene_id]
+                flow = min(flows, key=lambda key: self._flow_pass[key])
+                request = flows[flow].popleft()
+                if not flows[flow]:
+                    del flows[flow]
+                if not flows:
+                    del scenes[scene_id]
+
+                scene_key = (priority, scene_id)
+                self._scene_clock[priority] = max(self._scene_clock[priority], self._scene_pass[scene_key])
+                self._flow_clock[scene_key] = max(self._flow_clock[scene_key], self._flow_pass[flow])
+                self._scene_pass[scene_key] += request.cost
+                self._flow_pass[flow] += request.cost
+                ai_scheduler_queue_depth.dec(priority=priority)
+                self._start(request)
+                request.future.set_result(None)
+
+    def _remove_waiting(self, request: _Request):
+        flows = self._queues[request.priority][request.scene_id]
+        flows[request.flow].remove(request)
+        if not flows[request.flow]:
+            del flows[request.flow]
+        if not flows:
+            del self._queues[request.priority][request.scene_id]
+        ai_scheduler_queue_depth.dec(priority=request.priority)
+        self._deactivate(request)
+
+    @asynccontextmanager
+    async def slot(self, cost: int = 1):
+        """
+        占用一个大模型调用名额，名额不足时按调度顺序排队
+        :param cost: 预估token数，公平分配时按该值计入场景与任务的进度
+        :return: 排队等待的秒数
+        """
+        context = _llm_context.get()
+        priority = context["priority"]
+        request = _Request(
+            priority, context["scene_id"], (priority, context["scene_id"], context["task_id"]),
+            max(1, cost), asyncio.get_running_loop().create_future()
+        )
+        self._activate(request)
+        enqueued = time.perf_counter()
+        self._queues[priority].setdefault(request.scene_id, {}).setdefault(request.flow, deque()).append(request)
+        ai_scheduler_queue_depth.inc(priority=priority)
+        self._dispatch()
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            if request.future.done() and not request.future.cancelled():
+                # 已被放行但调用方在恢复前被取消
+                self._release(request)
+            else:
+                self._remove_waiting(request)
+                self._dispatch()
+            raise
+        waited = time.perf_counter() - enqueued
+        ai_scheduler_wait_seconds.observe(waited, priority=priority)
+        try:
+            yield waited
+        finally:
+            self._release(request)
+
+# 全局调度器，所有大模型调用共用
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,235 @@
+import re
+import html
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.db.repository import get_repository, using_sqlite
+from app.db.sqlite import SEARCH_INDEXES, dedicated_transaction, query, rebuild_search_index
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TYPES = tuple(SEARCH_INDEXES)
+
+# trigram分词只能匹配不少于3个字符的词，更短的词（如两个汉字）退回逐行子串匹配
+MIN_MATCH_LENGTH = 3
+
+# 单次查询最多使用的词数
+MAX_TERMS = 8
+
+# 摘要中命中词两侧的标记，转义HTML后替换为 <mark>
+_MARK_START, _MARK_END = "\ue000", "\ue001"
+
+# 没有可用于全文索引的词时，摘要取命中位置前后的字符数
+_SNIPPET_CONTEXT = 24
+
+class _Source:
+    """
+    一种检索对象：全文索引所在的表、返回的字段、关联表与过滤条件对应的列；
+    parent 为非SQLite后端读取关联字段的 (上级集合, 关联字段, {上级字段: 返回字段名})，场景过滤也经由上级集合
+    """
+    def __init__(self, table: str, fields: Sequence[str], joins: str = "", scene_column: Optional[str] = None,
+                 task_column: Optional[str] = None, weights: Sequence[float] = (),
+                 parent: Optional[Tuple[str, str, Dict[str, str]]] = None):
+        self.table = table
+        self.fts = f"{table}_fts"
+        self.columns = SEARCH_INDEXES[table]
+        self.fields = fields
+        self.names = [field.rsplit(" AS ", 1)[-1].split(".")[-1] for field in fields]
+        self.joins = joins
+        self.scene_column = scene_column
+        self.task_column = task_column
+        self.weights = weights or (1.0,) * len(self.columns)
+        self.parent = parent
+
+SOURCES: Dict[str, _Source] = {
+    "rules": _Source(
+        "rules", ("t._id", "t.name", "t.scene_id", "t.created_at"),
+        scene_column="t.scene_id", weights=(2.0, 1.0)
+    ),
+    "audit_items": _Source(
+        "audit_items", ("t._id", "t.name", "t.rule_id", "r.scene_id", "t.type", "t.created_at"),
+        joins="JOIN rules r ON r._id = t.rule_id", scene_column="r.scene_id", weights=(2.0, 1.0),
+        parent=("rules", "rule_id", {"scene_id": "scene_id"})
+    ),
+    "audit_results": _Source(
+        "audit_results",
+        ("t._id", "t.task_id", "k.name AS task_name", "k.scene_id", "t.rule_id", "t.audit_item_id", "t.file_name", "t.result", "t.created_at"),
+        joins="JOIN audit_tasks k ON k._id = t.task_id", scene_column="k.scene_id", task_column="t.task_id",
+        parent=("audit_tasks", "task_id", {"name": "task_name", "scene_id": "scene_id"})
+    ),
+}
+
+def parse_terms(text: str) -> List[str]:
+    """按空白拆分查询词，去重并保持顺序"""
+    terms = []
+    for term in text.split():
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+def _match_expression(terms: Sequence[str]) -> str:
+    """FTS5查询表达式：每个词作为短语（转义双引号），各词之间为AND"""
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def _highlight(text: str) -> str:
+    """转义HTML并把命中标记替换为 <mark>"""
+    return html.escape(text).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+def _scan_snippet(text: Optional[str], terms: Sequence[str]) -> Optional[str]:
+    """在Python中生成摘要（用于只含短词的查询）：取第一个命中位置前后的文本并标记所有命中"""
+    if not text:
+        return None
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [position for position in positions if position >= 0]
+    if not positions:
+        return None
+    start = max(0, min(positions) - _SNIPPET_CONTEXT)
+    end = min(len(text), min(positions) + _SNIPPET_CONTEXT * 2)
+    pattern = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    window = re.sub(pattern, lambda m: _MARK_START + m.group(0) + _MARK_END, text[start:end], flags=re.IGNORECASE)
+    return ("…" if start else "") + _highlight(window) + ("…" if end < len(text) else "")
+
+async def _fts_available(source: _Source) -> bool:
+    return bool(await query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (source.fts,)))
+
+async def _search_source(source: _Source, terms: List[str], scene_id: Optional[str], task_id: Optional[str],
+                         limit: int, offset: int) -> dict:
+    """检索一种对象，返回一页结果及是否还有更多"""
+    match_terms = [term for term in terms if len(term) >= MIN_MATCH_LENGTH]
+    if match_terms and not await _fts_available(source):
+        match_terms = []
+    scan_terms = [term for term in terms if term not in match_terms]
+
+    select = list(source.fields)
+    where, params = [], []
+    if match_terms:
+        select += [f"snippet({source.fts}, {i}, '{_MARK_START}', '{_MARK_END}', '…', 16)" for i in range(len(source.columns))]
+        select.append(f"bm25({source.fts}, {', '.join(str(weight) for weight in source.weights)}) AS score")
+        sql_from = f"{source.fts} JOIN {source.table} t ON t.rowid = {source.fts}.rowid"
+        where.append(f"{source.fts} MATCH ?")
+        params.append(_match_expression(match_terms))
+        order = "score"
+    else:
+        select += [f"t.{column}" for column in source.columns]
+        sql_from = f"{source.table} t"
+        order = "t.created_at DESC"
+    for term in scan_terms:
+        where.append("(" + " OR ".join(f"instr(lower(t.{column}), ?) > 0" for column in source.columns) + ")")
+        params += [term.lower()] * len(source.columns)
+    if scene_id:
+        where.append(f"{source.scene_column} = ?")
+        params.append(scene_id)
+    if task_id:
+        where.append(f"{source.task_column} = ?")
+        params.append(task_id)
+
+    sql = f"SELECT {', '.join(select)} FROM {sql_from} {source.joins}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order}, t._id LIMIT ? OFFSET ?"
+    rows = await query(sql, tuple(params) + (limit + 1, offset))
+
+    names = source.names
+    items = []
+    for row in rows[:limit]:
+        item = dict(zip(names, row))
+        texts = row[len(names):len(names) + len(source.columns)]
+        if match_terms:
+            highlights = {column: _highlight(text) for column, text in zip(source.columns, texts) if text and _MARK_START in text}
+            item["score"] = round(-row[-1], 4)
+        else:
+            highlights = {column: _scan_snippet(text, scan_terms) for column, text in zip(source.columns, texts)}
+            highlights = {column: text for column, text in highlights.items() if text}
+        item["highlights"] = highlights
+        items.append(item)
+    return {"items": items, "has_more": len(rows) > limit}
+
+async def _search_documents(source: _Source, terms: List[str], scene_id: Optional[str], task_id: Optional[str],
+                            limit: int, offset: int) -> dict:
+    """非SQLite存储后端：所有词按子串匹配（见 Repository.find_matching），按创建时间倒序"""
+    repository = get_repository()
+    filters = {}
+    if task_id:
+        filters["task_id"] = task_id
+    if scene_id and source.parent:
+        collection, key, _ = source.parent
+        parent_ids = [parent["_id"] for parent in await repository.find(collection, {"scene_id": scene_id}, ("_id",))]
+        if task_id:
+            parent_ids = [task_id] if task_id in parent_ids else []
+        filters[key] = parent_ids
+    elif scene_id:
+        filters["scene_id"] = scene_id
+
+    inherited = set(source.parent[2].values()) if source.parent else set()
+    fields = [name for name in source.names if name not in inherited] + list(source.columns)
+    documents = await repository.find_matching(
+        source.table, source.columns, terms, filters, fields, [("created_at", -1), ("_id", 1)], limit + 1, offset
+    )
+
+    parents = {}
+    if source.parent and documents:
+        collection, key, mapping = source.parent
+        found = await repository.find(collection, {"_id": list({document[key] for document in documents[:limit]})}, ("_id", *mapping))
+        parents = {parent["_id"]: parent for parent in found}
+    items = []
+    for document in documents[:limit]:
+        if source.parent:
+            parent = parents.get(document[source.parent[1]], {})
+            document.update({name: parent.get(field) for field, name in source.parent[2].items()})
+        item = {name: document.get(name) for name in source.names}
+        highlights = {column: _scan_snippet(document.get(column), terms) for column in source.columns}
+        item["highlights"] = {column: text for column, text in highlights.items() if text}
+        items.append(item)
+    return {"items": items, "has_more": len(documents) > limit}
+
+async def search(text: str, types: Optional[Sequence[str]] = None, scene_id: Optional[str] = None,
+                 task_id: Optional[str] = None, limit: int = 20, offset: int = 0) -> dict:
+    """
+    全文检索规则（名称、描述）、审核项（名称、审核标准）与审核结果（原因）。
+    不少于3个字符的词使用FTS5索引并按BM25排序，更短的词退回子串扫描并按创建时间倒序；
+    其他存储后端全部按子串匹配并按创建时间倒序；已归档任务的结果不在数据库中，不会被检索到
+    :param text: 查询文本，多个词以空白分隔，需全部命中
+    :param types: 检索的对象类型，默认全部
+    :param scene_id: 按业务场景过滤
+    :param task_id: 按审核任务过滤（仅审核结果）
+    :param limit: 每种对象返回的条数
+    :param offset: 每种对象跳过的条数
+    :return: 各类型的结果（含高亮摘要）与耗时
+    """
+    start = time.perf_counter()
+    terms = parse_terms(text)
+    if not terms:
+        raise ValueError("查询内容不能为空")
+    # 只按任务过滤时默认只检索审核结果
+    types = list(types or (("audit_results",) if task_id else SEARCH_TYPES))
+    unknown = [name for name in types if name not in SOURCES]
+    if unknown:
+        raise ValueError(f"未知的检索类型: {', '.join(unknown)}，可选值: {', '.join(SEARCH_TYPES)}")
+    if task_id and any(SOURCES[name].task_column is None for name in types):
+        raise ValueError("task_id 只能用于检索审核结果（types=audit_results）")
+
+    search_source = _search_source if using_sqlite() else _search_documents
+    results = {}
+    for name in types:
+        results[name] = await search_source(SOURCES[name], terms, scene_id, task_id, limit, offset)
+    return {"query": terms, "results": results, "took_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+def _rebuild_sqlite_index() -> Dict[str, int]:
+    with dedicated_transaction("search_index") as cursor:
+        rebuild_search_index(cursor)
+        return {name: cursor.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in SEARCH_TYPES}
+
+async def rebuild_index() -> dict:
+    """
+    按原表重建全部全文索引（执行VACUUM后需要重建）；其他存储后端没有全文索引，只返回各类型的文档数
+    :return: 各类型重建后的索引行数
+    """
+    start = time.perf_counter()
+    if using_sqlite():
+        counts = await asyncio.to_thread(_rebuild_sqlite_index)
+        logger.info("全文索引重建完成: %s", counts)
+    else:
+        counts = {name: await get_repository().count(name) for name in SEARCH_TYPES}
+    return {"documents": counts, "took_ms": round((time.perf_counter() - start) * 1000, 2)}
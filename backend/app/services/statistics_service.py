@@ -0,0 +1,84 @@
+import logging
+from datetime import date, timedelta
+from typing import Optional
+from app.db.repository import get_repository, using_sqlite
+from app.db.sqlite import query
+
+logger = logging.getLogger(__name__)
+
+TASK_STATUSES = ("pending", "running", "paused", "completed", "failed")
+RESULT_VALUES = ("pass", "warning", "fail")
+
+async def _sum_counters(scope: str, scope_id: str, prefix: str, date_from: Optional[date], date_to: Optional[date]) -> dict:
+    """按主键前缀范围读取计数器并按指标汇总"""
+    sql = "SELECT metric, SUM(value) FROM audit_stat_counters WHERE scope = ? AND scope_id = ? AND metric LIKE ?"
+    params = [scope, scope_id, f"{prefix}:%"]
+    if date_from:
+        sql += " AND day >= ?"
+        params.append(date_from.isoformat())
+    if date_to:
+        sql += " AND day <= ?"
+        params.append(date_to.isoformat())
+    sql += " GROUP BY metric"
+    rows = await query(sql, tuple(params))
+    return {metric.split(":", 1)[1]: total for metric, total in rows if total}
+
+async def _count_documents(scene_id: Optional[str], rule_id: Optional[str], date_from: Optional[date],
+                           date_to: Optional[date]) -> tuple:
+    """
+    其他存储后端没有触发器维护的计数器，按明细分组聚合（created_at 有索引）；
+    已归档任务的结果已移出数据库，不计入审核结论统计
+    """
+    repository = get_repository()
+    created_from = date_from.isoformat() if date_from else None
+    created_before = (date_to + timedelta(days=1)).isoformat() if date_to else None
+    task_filters = {"scene_id": scene_id} if scene_id else None
+    if rule_id:
+        result_filters = {"rule_id": rule_id}
+    elif scene_id:
+        tasks = await repository.find("audit_tasks", task_filters, ("_id",))
+        result_filters = {"task_id": [task["_id"] for task in tasks]}
+    else:
+        result_filters = None
+    task_counts = await repository.count_by("audit_tasks", "status", task_filters, created_from, created_before)
+    result_counts = await repository.count_by("audit_results", "result", result_filters, created_from, created_before)
+    return (
+        {status: total for status, total in task_counts.items() if status is not None},
+        {value: total for value, total in result_counts.items() if value is not None}
+    )
+
+async def get_statistics(
+    scene_id: Optional[str] = None,
+    rule_id: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> dict:
+    """
+    读取审核统计：SQLite读取预聚合的计数器，耗时与明细数据量无关；其他存储后端按明细聚合
+    :param scene_id: 按业务场景过滤
+    :param rule_id: 按规则过滤（仅作用于审核结果统计）
+    :param date_from: 起始日期（含），按创建日期过滤
+    :param date_to: 结束日期（含）
+    :return: 任务状态与审核结论的计数
+    """
+    if using_sqlite():
+        task_scope = ("scene", scene_id) if scene_id else ("all", "")
+        if rule_id:
+            result_scope = ("rule", rule_id)
+        else:
+            result_scope = task_scope
+        task_counts = await _sum_counters(*task_scope, "task", date_from, date_to)
+        result_counts = await _sum_counters(*result_scope, "result", date_from, date_to)
+    else:
+        task_counts, result_counts = await _count_documents(scene_id, rule_id, date_from, date_to)
+
+    return {
+        "tasks": {status: task_counts.get(status, 0) for status in (*TASK_STATUSES, *(set(task_counts) - set(TASK_STATUSES)))},
+        "results": {value: result_counts.get(value, 0) for value in (*RESULT_VALUES, *(set(result_counts) - set(RESULT_VALUES)))},
+        "filters": {
+            "scene_id": scene_id,
+            "rule_id": rule_id,
+            "date_from": date_from.isoformat() if date_from else None,
+            "date_to": date_to.isoformat() if date_to else None
+        }
+    }
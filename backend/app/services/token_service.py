@@ -0,0 +1,168 @@
+import re
+import math
+import logging
+from functools import lru_cache
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符通常每个字符约1个token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+class PromptTooLargeError(Exception):
+    """提示词超过单次调用允许的token上限"""
+    def __init__(self, estimated_tokens: int, max_tokens: int):
+        super().__init__(f"提示词过大：预估 {estimated_tokens} tokens，超过上限 {max_tokens} tokens")
+        self.estimated_tokens = estimated_tokens
+        self.max_tokens = max_tokens
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    本地估算文本的token数：安装了tiktoken时精确计算，否则按字符启发式估算
+    :param text: 文本
+    :param model: 模型名称
+    :return: token数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def estimate_messages_tokens(messages: List[dict], model: Optional[str] = None) -> int:
+    """
+    估算chat消息列表的token数（含每条消息的固定开销）
+    :param messages: chat消息列表
+    :param model: 模型名称
+    :return: token数
+    """
+    total = 3
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += 4 + estimate_tokens(content or "", model)
+    return total
+
+def _hard_split(text: str, max_tokens: int, model: Optional[str] = None) -> List[str]:
+    """
+    按字符切分超长文本，每个片段都重新估算，保证不超过 max_tokens
+    （中英文混排时各部分每token的字符数差异很大，不能只按整体比例切分）
+    """
+    chunks: List[str] = []
+    start = 0
+    while start < len(text):
+        fit, fit_tokens = start, 0
+        while fit < len(text):
+            remaining = max_tokens - fit_tokens
+            if remaining <= 0:
+                break
+            # 按后续文本的估算比例扩展片段，超出上限时在扩展的部分内二分
+            window = text[fit:fit + remaining * 4 + 1]
+            window_tokens = estimate_tokens(window, model)
+            end = fit + (max(1, len(window) * remaining // window_tokens) if window_tokens > remaining else len(window))
+            end_tokens = estimate_tokens(text[start:end], model)
+            if end_tokens <= max_tokens:
+                fit, fit_tokens = end, end_tokens
+                continue
+            low, high = fit, end
+            while high - low > 1:
+                middle = (low + high) // 2
+                if estimate_tokens(text[start:middle], model) <= max_tokens:
+                    low = middle
+                else:
+                    high = middle
+            fit = low
+            break
+        # 单个字符就超过上限时也要前进，避免死循环
+        fit = max(fit, start + 1)
+        chunks.append(text[start:fit])
+        start = fit
+    return chunks
+
+def split_by_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> List[str]:
+    """
+    按段落将文本切分为不超过 max_tokens 的片段，超长段落再按字符硬切
+    :param text: 文本
+    :param max_tokens: 单个片段的token上限
+    :param model: 模型名称
+    :return: 片段列表
+    """
+    if max_tokens <= 0:
+        raise ValueError("max_tokens必须大于0")
+    if estimate_tokens(text, model) <= max_tokens:
+        return [text]
+
+    chunks: List[str] = []
+
+    def emit(chunk: str):
+        # 按段落累加的估算与整体估算可能略有差异，输出前重新检查
+        if estimate_tokens(chunk, model) <= max_tokens:
+            chunks.append(chunk)
+        else:
+            chunks.extend(_hard_split(chunk, max_tokens, model))
+
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in text.split("\n"):
+        tokens = estimate_tokens(paragraph, model) + 1
+        if tokens > max_tokens:
+            if current:
+                emit("\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_hard_split(paragraph, max_tokens, model))
+            continue
+        if current_tokens + tokens > max_tokens and current:
+            emit("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        emit("\n".join(current))
+    return chunks
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    截断文本使其不超过 max_tokens
+    :param text: 文本
+    :param max_tokens: token上限
+    :param model: 模型名称
+    :return: 截断后的文本
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # 启发式估算逐字符累加，只扫描需要保留的前缀
+        cjk = other = 0
+        for index, char in enumerate(text):
+            if _CJK_PATTERN.match(char):
+                cjk += 1
+            else:
+                other += 1
+            if cjk + math.ceil(other / 4) > max_tokens:
+                return text[:index]
+        return text
+    # 只编码足够长的前缀，不够 max_tokens 时再扩大，不对整篇文本编码
+    window = max_tokens * 4
+    while True:
+        tokens = encoding.encode(text[:window], disallowed_special=())
+        if len(tokens) > max_tokens:
+            # 截断处的多字节字符被切开时去掉残留的替换字符
+            return encoding.decode(tokens[:max_tokens]).rstrip("\ufffd")
+        if window >= len(text):
+            return text
+        window *= 2
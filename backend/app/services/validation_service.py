@@ -0,0 +1,123 @@
+import os
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional
+from app.core.config import settings
+from app.core.tracing import tracer
+from app.db.repository import get_repository
+from app.services.ai_service import RESULT_SEVERITY, ai_service
+from app.services.document_service import load_document
+from app.services.reference_service import load_reference_materials
+from app.services.token_service import PromptTooLargeError
+
+logger = logging.getLogger(__name__)
+
+# 校验结论在前端的展示文案
+RESULT_LABELS = {"pass": "通过", "warning": "需复核", "fail": "不通过"}
+
+class RuleNotFoundError(Exception):
+    pass
+
+async def load_rule_with_items(rule_id: str) -> Optional[dict]:
+    """
+    加载规则及其审核项
+    :param rule_id: 规则ID
+    :return: 规则字典（带 audit_items 与 reference_materials），不存在时返回None
+    """
+    repository = get_repository()
+    rule = await repository.find_one("rules", {"_id": rule_id}, ("_id", "name", "scene_id", "description"))
+    if rule is None:
+        return None
+    rule["audit_items"] = await repository.find(
+        "audit_items", {"rule_id": rule_id}, ("_id", "name", "type", "criteria"), sort=[("created_at", 1)]
+    )
+    rule["reference_materials"] = (await load_reference_materials([rule_id])).get(rule_id, [])
+    return rule
+
+async def summarize_reference_files(reference_files: List[dict]) -> str:
+    """并发解析参考文件并提炼一次要点，供所有待校验文件共用"""
+    if not reference_files:
+        return "无"
+    with tracer.span("validation.reference_summary", **{"reference.files": len(reference_files)}):
+        documents = await asyncio.gather(*[load_document(ref) for ref in reference_files], return_exceptions=True)
+        parts = []
+        for ref, document in zip(reference_files, documents):
+            if isinstance(document, Exception):
+                logger.warning("Failed to load reference file %s: %s", ref.get("name"), document)
+                continue
+            parts.append(f"【{document['name']}】\n{document['content']}")
+        return await ai_service.summarize_references("\n\n".join(parts))
+
+def _file_result(file: dict, rule: dict, reference_names: List[str], validation: Optional[dict] = None, error: Optional[str] = None) -> dict:
+    result = {
+        "uid": file.get("uid"),
+        "fileName": file.get("name"),
+        "ruleName": rule["name"],
+        "aiGenerated": True,
+        "reference_files": reference_names
+    }
+    if error is not None:
+        return {**result, "result": RESULT_LABELS["warning"], "reason": [f"文件处理失败：{error}"], "error": error, "validation_results": []}
+
+    item_results = validation.get("validation_results", [])
+    verdict = max(
+        (str(item.get("result", "warning")).lower() for item in item_results),
+        key=lambda value: RESULT_SEVERITY.get(value, 1),
+        default="warning"
+    )
+    return {
+        **result,
+        "result": RESULT_LABELS.get(verdict, RESULT_LABELS["warning"]),
+        "reason": [f"{item.get('audit_item_name', '')}：{item.get('reason', '')}" for item in item_results],
+        "validation_results": item_results,
+        "usage": validation.get("usage")
+    }
+
+async def prepare_validation(rule_id: str, reference_files: Optional[List[dict]] = None) -> dict:
+    """
+    校验前的准备：加载规则与审核项，提炼参考资料要点（只做一次）
+    :param rule_id: 规则ID
+    :param reference_files: 参考文件列表，为空时使用规则保存的参考材料
+    :return: 校验上下文
+    """
+    if not ai_service.client:
+        raise Exception("请配置AI API密钥以使用AI功能")
+    rule = await load_rule_with_items(rule_id)
+    if rule is None:
+        raise RuleNotFoundError(rule_id)
+
+    reference_files = reference_files or [{"name": os.path.basename(path), "url": path} for path in rule["reference_materials"]]
+    return {
+        "rule": rule,
+        "reference_names": [ref.get("name") for ref in reference_files],
+        "reference_summary": await summarize_reference_files(reference_files)
+    }
+
+async def validate_files(context: dict, files: List[dict]) -> AsyncIterator[dict]:
+    """
+    用规则的全部审核项并发校验多个上传文件，按完成顺序逐个产出结果
+    :param context: prepare_validation 返回的校验上下文
+    :param files: 待校验文件列表
+    :return: 单个文件校验结果的异步迭代器，结果中的 index 为文件在请求中的位置
+    """
+    rule = context["rule"]
+    semaphore = asyncio.Semaphore(max(1, settings.VALIDATION_CONCURRENCY))
+
+    async def validate_one(index: int, file: dict) -> dict:
+        async with semaphore:
+            with tracer.span("validation.file", **{"file.name": file.get("name"), "rule.id": rule["_id"]}):
+                try:
+                    document = await load_document(file)
+                    validation = await ai_service.validate_rule(rule, document["content"], rule["audit_items"], context["reference_summary"])
+                    return {"index": index, **_file_result(file, rule, context["reference_names"], validation)}
+                except (ValueError, FileNotFoundError, PromptTooLargeError) as e:
+                    return {"index": index, **_file_result(file, rule, context["reference_names"], error=str(e))}
+
+    tasks = [asyncio.create_task(validate_one(index, file)) for index, file in enumerate(files)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # 客户端中途断开时取消尚未完成的校验
+        for task in tasks:
+            task.cancel()
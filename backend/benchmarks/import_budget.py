@@ -0,0 +1,92 @@
+"""
+应用导入耗时检查
+
+用 `python -X importtime` 在全新的子进程中导入 main（与uvicorn启动、工作进程重启时相同），
+取多次运行中的最小值，输出总耗时与耗时最多的模块，并检查：
+
+- 总耗时不超过 --budget-ms
+- 延迟加载的重量级模块（openai、pytesseract、bson 等）没有在导入阶段被加载
+
+任一检查不通过时以非0状态退出，可在CI中作为启动性能的回归检查。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 1000 --top 30
+"""
+import os
+import sys
+import argparse
+import subprocess
+import tempfile
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在首次使用时才导入的模块，出现在启动阶段说明延迟加载被破坏
+DEFERRED_MODULES = ("openai", "pytesseract", "bson", "pymongo", "motor", "sentence_transformers", "pypdf", "PIL")
+
+def measure(module: str) -> Tuple[float, List[Tuple[str, float, float]]]:
+    """
+    在子进程中导入模块并解析 -X importtime 输出
+    :param module: 要导入的模块名
+    :return: (总耗时ms, [(模块名, 自身耗时ms, 累计耗时ms)])
+    """
+    env = dict(os.environ)
+    # 导入阶段不应访问数据库，仍指向临时路径以防污染开发数据
+    env.setdefault("SQLITE_DB_PATH", os.path.join(tempfile.gettempdir(), "aireviewer-import-budget.db"))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr}")
+
+    modules = []
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # 缩进为0的是顶层导入，其累计耗时之和即整个导入的耗时
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative_us)
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return total_us / 1000, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Reviewer 导入耗时检查")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=2000.0, help="导入总耗时上限（与机器性能相关，可按CI环境调整）")
+    parser.add_argument("--runs", type=int, default=3, help="运行次数，取总耗时最小的一次以减少抖动")
+    parser.add_argument("--top", type=int, default=15, help="输出累计耗时最多的模块数")
+    args = parser.parse_args()
+
+    results = [measure(args.module) for _ in range(max(1, args.runs))]
+    total_ms, modules = min(results, key=lambda result: result[0])
+
+    print(f"import {args.module}: {total_ms:.1f} ms (best of {len(results)}, budget {args.budget_ms:.0f} ms)\n")
+    print(f"{'module':<48}{'self ms':>10}{'cumulative ms':>15}")
+    for name, self_ms, cumulative_ms in sorted(modules, key=lambda row: -row[2])[:args.top]:
+        print(f"{name:<48}{self_ms:>10.1f}{cumulative_ms:>15.1f}")
+
+    loaded: Dict[str, float] = {}
+    for name, _, cumulative_ms in modules:
+        if name in DEFERRED_MODULES:
+            loaded[name] = cumulative_ms
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"导入耗时 {total_ms:.1f} ms 超过预算 {args.budget_ms:.0f} ms")
+    for name, cumulative_ms in loaded.items():
+        failures.append(f"{name} 在导入阶段被加载（{cumulative_ms:.1f} ms），应改为首次使用时导入")
+
+    if failures:
+        print("\nFAILED")
+        for failure in failures:
+            print(f"- {failure}")
+        sys.exit(1)
+    print("\nOK")
+
+if __name__ == "__main__":
+    main()
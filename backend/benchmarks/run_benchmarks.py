@@ -0,0 +1,357 @@
+"""
+后端基准测试与压测脚本
+
+在临时目录中启动一份独立的应用实例（独立的SQLite数据库与上传目录），大模型调用指向
+进程内启动的桩服务（benchmarks/stub_llm.py），依次运行以下场景并输出吞吐量与 p50/p95/p99 延迟：
+
+- bulk_create：批量创建业务场景、规则与审核项
+- list_endpoints：数据量较大时的列表接口
+- upload_large：大文件上传
+- audit_run：完整的审核任务运行
+- audit_batch：以离线批量方式（Batch API）运行审核任务，提交后轮询至批次结束并导入结果
+- encoding：结果与列表接口的JSON编码耗时（标准库json与orjson对比）及不同压缩方式下的响应字节数
+- search：全文检索接口（索引检索与短词扫描、按场景过滤）
+
+用法（在 backend 目录下）：
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json        # 与基线对比
+    python -m benchmarks.run_benchmarks --scenarios list_endpoints --scenes 50
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+SCENARIOS = ("bulk_create", "list_endpoints", "upload_large", "audit_run", "audit_batch", "encoding", "search")
+ENCODINGS = ("identity", "gzip", "br")
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法计算百分位"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class LatencyRecorder:
+    """按操作名记录单次请求耗时与错误数"""
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.wall: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float, ok: bool = True) -> None:
+        self.samples.setdefault(name, []).append(seconds)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self) -> Dict[str, dict]:
+        report = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            wall = self.wall.get(name) or sum(values)
+            report[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "throughput_rps": round(len(values) / wall, 2) if wall else 0.0,
+                "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+        return report
+
+async def _timed_request(recorder: LatencyRecorder, name: str, semaphore: asyncio.Semaphore, send):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            response = await send()
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        recorder.record(name, time.perf_counter() - start, ok)
+        return response
+
+async def _run_batch(recorder: LatencyRecorder, name: str, concurrency: int, senders: list) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    responses = await asyncio.gather(*[_timed_request(recorder, name, semaphore, send) for send in senders])
+    recorder.wall[name] = recorder.wall.get(name, 0.0) + (time.perf_counter() - start)
+    return responses
+
+def _json(response) -> Optional[dict]:
+    return response.json() if response is not None and response.status_code < 400 else None
+
+async def scenario_bulk_create(client, recorder: LatencyRecorder, args, state: dict) -> None:
+    scenes = await _run_batch(recorder, "create_scene", args.concurrency, [
+        (lambda i=i: client.post("/api/scenes/", json={"name": f"bench_scene_{i}", "description": "基准测试场景"}))
+        for i in range(args.scenes)
+    ])
+    scene_ids = [body["_id"] for body in map(_json, scenes) if body]
+
+    rules = await _run_batch(recorder, "create_rule", args.concurrency, [
+        (lambda scene_id=scene_id, j=j: client.post("/api/rules/", json={"name": f"bench_rule_{j}", "scene_id": scene_id, "description": "基准测试规则"}))
+        for scene_id in scene_ids for j in range(args.rules_per_scene)
+    ])
+    rule_ids = [body["_id"] for body in map(_json, rules) if body]
+
+    await _run_batch(recorder, "create_audit_item", args.concurrency, [
+        (lambda rule_id=rule_id, k=k: client.post("/api/audit-items/", json={"name": f"bench_item_{k}", "rule_id": rule_id, "type": "text", "criteria": f"内容需满足基准测试要求{k}"}))
+        for rule_id in rule_ids for k in range(args.items_per_rule)
+    ])
+    state["scene_ids"] = scene_ids
+
+async def scenario_list_endpoints(client, recorder: LatencyRecorder, args, state: dict) -> None:
+    for path in ("/api/scenes/", "/api/rules/", "/api/audit-items/", "/api/tasks/"):
+        await _run_batch(recorder, f"list {path}", args.concurrency, [
+            (lambda path=path: client.get(path)) for _ in range(args.list_requests)
+        ])
+
+async def scenario_upload_large(client, recorder: LatencyRecorder, args, state: dict) -> None:
+    payload = ("基准测试上传内容。" * 1024).encode("utf-8")
+    size = args.upload_mb * 1024 * 1024
+    body = (payload * (size // len(payload) + 1))[:size]
+    await _run_batch(recorder, f"upload {args.upload_mb}MB", args.concurrency, [
+        (lambda: client.post("/api/upload", files={"file": ("bench.txt", body, "text/plain")}))
+        for _ in range(args.uploads)
+    ])
+
+async def scenario_audit_run(client, recorder: LatencyRecorder, args, state: dict) -> None:
+    scene_ids = state.get("scene_ids") or []
+    if not scene_ids:
+        await scenario_bulk_create(client, recorder, args, state)
+        scene_ids = state["scene_ids"]
+
+    document = ("甲方与乙方就基准测试事项达成如下协议。" * 50).encode("utf-8")
+    upload = _json(await client.post("/api/upload", files={"file": ("bench_contract.txt", document, "text/plain")}))
+    if upload is None:
+        raise RuntimeError("上传审核文件失败")
+
+    tasks = await _run_batch(recorder, "create_task", args.concurrency, [
+        (lambda i=i: client.post("/api/tasks/", json={"name": f"bench_task_{i}", "scene_id": scene_ids[i % len(scene_ids)], "files": [upload["file"]]}))
+        for i in range(args.tasks)
+    ])
+    task_ids = [body["_id"] for body in map(_json, tasks) if body]
+
+    await _run_batch(recorder, "run_task", args.concurrency, [
+        (lambda task_id=task_id: client.post(f"/api/tasks/{task_id}/run")) for task_id in task_ids
+    ])
+    await _run_batch(recorder, "get_task_results", args.concurrency, [
+        (lambda task_id=task_id: client.get(f"/api/tasks/{task_id}/results")) for task_id in task_ids
+    ])
+    state["task_ids"] = task_ids
+
+async def scenario_audit_batch(client, recorder: LatencyRecorder, args, state: dict) -> None:
+    scene_ids = state.get("scene_ids") or []
+    if not scene_ids:
+        await scenario_bulk_create(client, recorder, args, state)
+        scene_ids = state["scene_ids"]
+
+    document = ("甲方与乙方就批量审核基准测试事项达成如下协议。" * 50).encode("utf-8")
+    upload = _json(await client.post("/api/upload", files={"file": ("bench_batch.txt", document, "text/plain")}))
+    if upload is None:
+        raise RuntimeError("上传审核文件失败")
+
+    tasks = await _run_batch(recorder, "create_batch_task", args.concurrency, [
+        (lambda i=i: client.post("/api/tasks/", json={"name": f"bench_batch_task_{i}", "scene_id": scene_ids[i % len(scene_ids)], "files": [upload["file"]]}))
+        for i in range(args.tasks)
+    ])
+    task_ids = [body["_id"] for body in map(_json, tasks) if body]
+
+    start = time.perf_counter()
+    await _run_batch(recorder, "submit_batch", args.concurrency, [
+        (lambda task_id=task_id: client.post(f"/api/tasks/{task_id}/batch")) for task_id in task_ids
+    ])
+    # 轮询到全部批次结束（结果在查询时导入）
+    pending = list(task_ids)
+    while pending:
+        responses = await _run_batch(recorder, "poll_batch", args.concurrency, [
+            (lambda task_id=task_id: client.get(f"/api/tasks/{task_id}/batch")) for task_id in pending
+        ])
+        pending = [
+            task_id for task_id, body in zip(pending, map(_json, responses))
+            if body is not None and body["batch_status"] == "submitted"
+        ]
+        if pending:
+            await asyncio.sleep(0.1)
+    recorder.record("batch_end_to_end", time.perf_counter() - start, True)
+
+def _encode_ms(encode, data, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encode(data)
+    return round((time.perf_counter() - start) / rounds * 1000, 3)
+
+async def scenario_encoding(client, recorder: LatencyRecorder, args, state: dict) -> None:
+    import orjson
+    from fastapi.encoders import jsonable_encoder
+
+    task_ids = state.get("task_ids") or []
+    if not task_ids:
+        await scenario_audit_run(client, recorder, args, state)
+        task_ids = state["task_ids"]
+
+    rows = {}
+    for path in (f"/api/tasks/{task_ids[0]}/results", "/api/tasks/", "/api/rules/", "/api/audit-items/", "/api/bootstrap"):
+        label = "/api/tasks/{id}/results" if task_ids[0] in path else path
+        row = {}
+        for encoding in ENCODINGS:
+            responses = await _run_batch(recorder, f"{label} [{encoding}]", args.concurrency, [
+                (lambda path=path, encoding=encoding: client.get(path, headers={"Accept-Encoding": encoding}))
+                for _ in range(args.list_requests)
+            ])
+            response = next((r for r in responses if r is not None and r.status_code < 400), None)
+            # 实际传输的字节数；服务端未安装brotli时br请求退回为未压缩
+            row[f"{encoding}_bytes"] = response.num_bytes_downloaded if response is not None else None
+            if encoding == "identity" and response is not None:
+                data = response.json()
+                # 以解析后的响应数据对比两种编码方式（原默认响应类为 jsonable_encoder + json.dumps）
+                row["stdlib_json_ms"] = _encode_ms(
+                    lambda value: json.dumps(jsonable_encoder(value), ensure_ascii=False).encode("utf-8"), data, args.encode_rounds
+                )
+                row["orjson_ms"] = _encode_ms(orjson.dumps, data, args.encode_rounds)
+        rows[label] = row
+    state["encoding"] = rows
+
+async def scenario_search(client, recorder: LatencyRecorder, args, state: dict) -> None:
+    scene_ids = state.get("scene_ids") or []
+    if not scene_ids:
+        await scenario_bulk_create(client, recorder, args, state)
+        scene_ids = state["scene_ids"]
+
+    queries = {
+        "search [fts]": {"q": "基准测试要求"},
+        "search [short]": {"q": "要求"},
+        "search [scene]": {"q": "基准测试", "scene_id": scene_ids[0]},
+    }
+    for name, params in queries.items():
+        await _run_batch(recorder, name, args.concurrency, [
+            (lambda params=params: client.get("/api/search", params=params)) for _ in range(args.list_requests)
+        ])
+
+SCENARIO_FUNCS = {
+    "bulk_create": scenario_bulk_create,
+    "list_endpoints": scenario_list_endpoints,
+    "upload_large": scenario_upload_large,
+    "audit_run": scenario_audit_run,
+    "audit_batch": scenario_audit_batch,
+    "encoding": scenario_encoding,
+    "search": scenario_search,
+}
+
+def print_report(report: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> None:
+    header = f"{'operation':<36}{'count':>7}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'Δp95':>9}{'Δrps':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in report.items():
+        line = f"{name:<36}{row['count']:>7}{row['errors']:>8}{row['throughput_rps']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        base = (baseline or {}).get(name)
+        if base:
+            delta_p95 = (row["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+            delta_rps = (row["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] * 100 if base["throughput_rps"] else 0.0
+            line += f"{delta_p95:>+8.1f}%{delta_rps:>+8.1f}%"
+        print(line)
+
+async def run(args) -> Dict[str, dict]:
+    import httpx
+    from benchmarks.stub_llm import StubConfig, StubServer
+
+    stub = StubServer(StubConfig(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate, args.llm_rate_limit_rate, seed=42))
+    stub.start()
+    try:
+        if args.target:
+            client = httpx.AsyncClient(base_url=args.target, timeout=300)
+            app_lifespan = None
+        else:
+            import main
+            from app.services.ai_service import ai_service
+            ai_service.load_config()
+            ai_service.provider = "openai"
+            ai_service.api_key = "stub-key"
+            ai_service.base_url = stub.base_url
+            ai_service.model = "stub-model"
+            ai_service.init_client()
+
+            app_lifespan = main.app.router.lifespan_context(main.app)
+            await app_lifespan.__aenter__()
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=300)
+
+        recorder = LatencyRecorder()
+        state: dict = {}
+        async with client:
+            for name in args.scenarios:
+                await SCENARIO_FUNCS[name](client, recorder, args, state)
+
+        if app_lifespan is not None:
+            await app_lifespan.__aexit__(None, None, None)
+        report = recorder.summary()
+        report["_stub_llm"] = dict(stub.config.stats)
+        report["_encoding"] = state.get("encoding")
+        return report
+    finally:
+        stub.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Reviewer 后端基准测试")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--target", default=None, help="压测已运行的服务（如 http://localhost:8000），默认在进程内启动应用")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenes", type=int, default=20)
+    parser.add_argument("--rules-per-scene", type=int, default=5)
+    parser.add_argument("--items-per-rule", type=int, default=5)
+    parser.add_argument("--list-requests", type=int, default=50)
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--upload-mb", type=int, default=5)
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--encode-rounds", type=int, default=20, help="encoding场景中每个接口重复编码的次数")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--output", default=None, help="将结果写入JSON文件，可作为后续对比的基线")
+    parser.add_argument("--baseline", default=None, help="与之前保存的结果对比")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aireviewer-bench-")
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    # 独立的数据库与上传目录，避免污染开发数据；必须在导入应用前设置
+    os.environ.setdefault("SQLITE_DB_PATH", os.path.join(workdir, "bench.db"))
+    os.environ.setdefault("TRACING_ENABLED", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # 批量审核结果由 audit_batch 场景的轮询请求导入，不启动后台轮询
+    os.environ.setdefault("AI_BATCH_POLL_INTERVAL_SECONDS", "0")
+    os.chdir(workdir)
+
+    report = asyncio.run(run(args))
+    stub_stats = report.pop("_stub_llm")
+    encoding_stats = report.pop("_encoding")
+
+    baseline = None
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_report(report, baseline)
+    if encoding_stats:
+        print(f"\n{'endpoint':<28}{'json ms':>10}{'orjson ms':>11}{'identity B':>12}{'gzip B':>10}{'br B':>10}")
+        for name, row in encoding_stats.items():
+            print(f"{name:<28}{row.get('stdlib_json_ms', '-'):>10}{row.get('orjson_ms', '-'):>11}"
+                  f"{str(row['identity_bytes']):>12}{str(row['gzip_bytes']):>10}{str(row['br_bytes']):>10}")
+    print(f"\nstub llm: {stub_stats}")
+    print(f"workdir: {workdir}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": report, "stub_llm": stub_stats, "encoding": encoding_stats}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
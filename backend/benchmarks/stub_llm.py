@@ -0,0 +1,236 @@
+"""
+离线的 OpenAI 兼容大模型桩服务，用于压测与基准测试
+
+支持可配置的响应延迟、错误率以及 429 限流注入，返回与 audit_result / rule_validation
+提示词约定一致的 JSON 结果。同时提供 Batch API（/v1/files、/v1/batches）：批次在后台逐行生成
+与 chat completion 相同的结果，注入的错误写入错误文件，取消后未执行的请求以 batch_cancelled 写入错误文件。
+
+用法：
+    python -m benchmarks.stub_llm --port 9100 --latency-ms 200 --jitter-ms 50 --error-rate 0.01 --rate-limit-rate 0.05
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 100.0
+    jitter_ms: float = 20.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: Optional[int] = None
+    # 批次从提交到完成的延迟（毫秒）
+    batch_latency_ms: float = 200.0
+    # 运行期统计
+    stats: dict = field(default_factory=lambda: {"requests": 0, "errors": 0, "rate_limited": 0, "batch_requests": 0})
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+def _verdict(prompt: str) -> dict:
+    """根据提示词内容哈希生成稳定的审核结论，便于重复运行得到一致结果"""
+    digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+    result = ("pass", "fail", "warning")[digest % 3]
+    confidence = round(0.5 + (digest % 50) / 100, 2)
+    return {"result": result, "reason": f"桩服务生成的审核结论（{result}）", "confidence": confidence}
+
+def _completion(body: dict, completion_id: str) -> dict:
+    """按请求体生成 chat completion 响应"""
+    messages = body.get("messages", [])
+    prompt = "".join(
+        part if isinstance(part, str) else json.dumps(part, ensure_ascii=False)
+        for message in messages
+        for part in ([message.get("content")] if not isinstance(message.get("content"), list) else message["content"])
+        if part
+    )
+    if "validation_results" in prompt:
+        content = {"validation_results": [dict(_verdict(prompt), audit_item_name="stub", suggestion="")]}
+    else:
+        content = _verdict(prompt)
+    text = json.dumps(content, ensure_ascii=False)
+
+    prompt_tokens = _estimate_tokens(prompt)
+    completion_tokens = _estimate_tokens(text)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub-model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    }
+
+def _jsonl(records) -> bytes:
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+    rng = random.Random(config.seed)
+    files: dict = {}
+    batches: dict = {}
+
+    def store_file(content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-stub-{len(files) + 1}"
+        files[file_id] = {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "content": content
+        }
+        return {key: value for key, value in files[file_id].items() if key != "content"}
+
+    async def process_batch(batch: dict):
+        lines = [json.loads(line) for line in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines() if line.strip()]
+        batch["status"] = "in_progress"
+        batch["request_counts"]["total"] = len(lines)
+        await asyncio.sleep(config.batch_latency_ms / 1000)
+        outputs, errors = [], []
+        for index, line in enumerate(lines):
+            if batch["status"] == "cancelling":
+                errors.append({"id": f"batch_req_{index}", "custom_id": line["custom_id"], "response": None,
+                               "error": {"code": "batch_cancelled", "message": "Batch was cancelled"}})
+                continue
+            config.stats["batch_requests"] += 1
+            if rng.random() < config.error_rate:
+                config.stats["errors"] += 1
+                errors.append({"id": f"batch_req_{index}", "custom_id": line["custom_id"],
+                               "response": {"status_code": 500, "request_id": f"req_{index}", "body": {"error": {"message": "Injected server error", "type": "server_error"}}},
+                               "error": None})
+                continue
+            outputs.append({"id": f"batch_req_{index}", "custom_id": line["custom_id"],
+                            "response": {"status_code": 200, "request_id": f"req_{index}", "body": _completion(line["body"], f"chatcmpl-batch-{index}")},
+                            "error": None})
+            # 让出事件循环，取消请求可以及时生效
+            if index % 100 == 99:
+                await asyncio.sleep(0)
+        batch["request_counts"].update(completed=len(outputs), failed=len(errors))
+        if outputs:
+            batch["output_file_id"] = store_file(_jsonl(outputs), f"{batch['id']}_output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = store_file(_jsonl(errors), f"{batch['id']}_error.jsonl", "batch_output")["id"]
+        batch["status"] = "cancelled" if batch["status"] == "cancelling" else "completed"
+        batch[f"{batch['status']}_at"] = int(time.time())
+
+    @app.post("/v1/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return store_file(await file.read(), file.filename or "upload.jsonl", purpose)
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="No such file")
+        return Response(files[file_id]["content"], media_type="application/jsonl")
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request):
+        body = await request.json()
+        if body.get("input_file_id") not in files:
+            raise HTTPException(status_code=400, detail="Invalid input_file_id")
+        batch_id = f"batch_stub_{len(batches) + 1}"
+        batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"), "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window"), "status": "validating", "output_file_id": None,
+            "error_file_id": None, "created_at": int(time.time()), "metadata": body.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        asyncio.get_running_loop().create_task(process_batch(batches[batch_id]))
+        return batches[batch_id]
+
+    @app.get("/v1/batches/{batch_id}")
+    async def get_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="No such batch")
+        return batches[batch_id]
+
+    @app.post("/v1/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="No such batch")
+        if batches[batch_id]["status"] in ("validating", "in_progress"):
+            batches[batch_id]["status"] = "cancelling"
+        return batches[batch_id]
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        config.stats["requests"] += 1
+
+        delay = max(0.0, rng.gauss(config.latency_ms, config.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            config.stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "1"},
+                content={"error": {"message": "Rate limit exceeded", "type": "rate_limit_error", "code": "rate_limit_exceeded"}}
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            config.stats["errors"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "Injected server error", "type": "server_error"}}
+            )
+
+        return _completion(body, f"chatcmpl-stub-{config.stats['requests']}")
+
+    return app
+
+class StubServer:
+    """在后台线程中运行桩服务，供基准测试进程内启动"""
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.host = host
+        self.port = port
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> None:
+        uvicorn_config = uvicorn.Config(create_app(self.config), host=self.host, port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(uvicorn_config)
+        self._thread = threading.Thread(target=self._server.run, name="stub-llm", daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        # 端口为0时取实际监听端口
+        self.port = self._server.servers[0].sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI兼容的离线大模型桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="平均响应延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="延迟标准差（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch-latency-ms", type=float, default=200.0, help="批次从提交到完成的延迟（毫秒）")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate, args.seed, args.batch_latency_ms)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
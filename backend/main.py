@@ -4,20 +4,50 @@ from contextlib import asynccontextmanager
 import uvicorn
 import os
 
+from app.core.config import settings
+from app.core.compression import CompressionMiddleware
+from app.core.responses import ORJSONResponse
+from app.core.logging import setup_logging, shutdown_logging, RequestContextMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.core.tracing import setup_tracing, shutdown_tracing
 from app.db.sqlite import init_sqlite_db, close_sqlite_db
-from app.routes import business_scenes, rules, audit_items, audit_tasks, templates, config, upload
+from app.db.repository import init_repository, close_repository
+from app.services.archive_service import start_archive_scheduler, stop_archive_scheduler
+from app.services.batch_audit_service import start_batch_poller, stop_batch_poller
+from app.services.image_service import shutdown_image_pool
+from app.services.ocr_service import shutdown_ocr_pool
+from app.services.ai_service import ai_service
+from app.routes import business_scenes, rules, audit_items, audit_tasks, templates, config, upload, metrics, data_import, knowledge_base, bootstrap, search
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    setup_logging()
+    setup_tracing()
+    # 本地SQLite始终初始化（缓存、知识库索引），业务数据按 STORAGE_BACKEND 选择存储
     await init_sqlite_db()
+    await init_repository()
+    # 只读取AI配置，大模型客户端（openai）在首次调用时创建
+    ai_service.ensure_config()
+    # 定时把旧任务的结果移入归档文件（ARCHIVE_ENABLED）
+    start_archive_scheduler()
+    # 恢复中断的批量审核任务，定时查询批量审核（Batch API）的批次状态并导入结果（AI_BATCH_POLL_INTERVAL_SECONDS）
+    start_batch_poller()
     yield
+    await stop_batch_poller()
+    await stop_archive_scheduler()
+    shutdown_image_pool()
+    shutdown_ocr_pool()
+    await close_repository()
     await close_sqlite_db()
+    shutdown_tracing()
+    shutdown_logging()
 
 app = FastAPI(
     title="AI Reviewer API",
     description="基于规则的大模型多模态智能审核平台API",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173,http://localhost:3000,http://localhost:5174").split(",")
@@ -28,8 +58,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "ETag"],
 )
 
+# 按 Accept-Encoding 压缩较大的响应
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    )
+
+# 请求关联ID，写入日志上下文
+app.add_middleware(RequestContextMiddleware)
+
+# 按路由记录请求耗时
+app.add_middleware(MetricsMiddleware)
+
 # 注册路由
 app.include_router(business_scenes.router, prefix="/api/scenes", tags=["业务场景"])
 app.include_router(rules.router, prefix="/api/rules", tags=["规则管理"])
@@ -38,6 +84,11 @@ app.include_router(audit_tasks.router, prefix="/api/tasks", tags=["审核任务"
 app.include_router(templates.router, prefix="/api/templates", tags=["版式库管理"])
 app.include_router(config.router, tags=["配置管理"])
 app.include_router(upload.router, prefix="/api", tags=["文件上传"])
+app.include_router(data_import.router, prefix="/api", tags=["批量导入"])
+app.include_router(knowledge_base.router, prefix="/api/knowledge-base", tags=["知识库"])
+app.include_router(bootstrap.router, prefix="/api", tags=["页面数据"])
+app.include_router(search.router, prefix="/api", tags=["全文检索"])
+app.include_router(metrics.router, tags=["监控指标"])
 
 @app.get("/")
 async def root():
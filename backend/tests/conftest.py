@@ -0,0 +1,58 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.db import repository
+from app.services.content_service import store_content
+
+@pytest.fixture(params=["sqlite", "mongodb"])
+def backend(request, tmp_path, monkeypatch):
+    """按存储后端参数化的测试客户端：SQLite使用临时数据库文件，MongoDB使用 mongomock_motor（未安装时跳过）"""
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", str(tmp_path / "ai_reviewer.db"))
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path / "archives"))
+    monkeypatch.setattr(settings, "KNOWLEDGE_BASE_DIR", str(tmp_path / "knowledge_base"))
+    monkeypatch.setattr(settings, "IMAGE_CACHE_DIR", str(tmp_path / "image_cache"))
+    monkeypatch.setattr(settings, "LOG_LEVEL", "CRITICAL")
+    if request.param == "mongodb":
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        from app.db.mongodb import MongoRepository
+        storage = MongoRepository(client=mongomock_motor.AsyncMongoMockClient())
+    else:
+        from app.db.sqlite import SQLiteRepository
+        storage = SQLiteRepository()
+    monkeypatch.setattr(repository, "_repository", storage)
+
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture
+def catalog(backend) -> dict:
+    """一个业务场景、一条规则与两个审核项"""
+    scene = backend.post("/api/scenes/", json={"name": "合同审核"}).json()
+    rule = backend.post("/api/rules/", json={"name": "签署规则", "scene_id": scene["_id"]}).json()
+    items = [
+        backend.post("/api/audit-items/", json={"name": name, "rule_id": rule["_id"], "type": "text", "criteria": criteria}).json()
+        for name, criteria in (("签字", "合同必须有双方签字"), ("日期", "必须注明签署日期"))
+    ]
+    return {"scene": scene, "rule": rule, "items": items}
+
+@pytest.fixture
+def make_task(backend, catalog):
+    """直接写入一个已完成的任务及其结果，results 为 (审核项序号, 结论, 内容)"""
+    def make(task_id: str, created_at: str, results: list):
+        storage = repository.get_repository()
+        backend.portal.call(storage.insert_one, "audit_tasks", {
+            "_id": task_id, "name": task_id, "scene_id": catalog["scene"]["_id"], "status": "completed",
+            "created_at": created_at, "updated_at": created_at, "completed_at": created_at, "files": "[]"
+        })
+        documents = []
+        for index, (item_index, result, content) in enumerate(results):
+            documents.append({
+                "_id": f"{task_id}-{index}", "task_id": task_id, "rule_id": catalog["rule"]["_id"],
+                "audit_item_id": catalog["items"][item_index]["_id"], "content": "",
+                "content_hash": backend.portal.call(store_content, content), "result": result,
+                "reason": f"理由{index}", "file_name": "contract.txt",
+                "created_at": f"{created_at[:10]}T00:00:0{index}", "updated_at": created_at
+            })
+        backend.portal.call(storage.insert_many, "audit_results", documents)
+    return make
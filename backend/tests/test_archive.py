@@ -0,0 +1,55 @@
+import os
+import pytest
+from app.db.repository import get_repository
+from app.services import archive_service
+
+def task_state(backend, task_id: str) -> tuple:
+    """(archived_at, archive_claim)"""
+    task = backend.portal.call(get_repository().find_one, "audit_tasks", {"_id": task_id}, ("archived_at", "archive_claim"))
+    return task.get("archived_at"), task.get("archive_claim")
+
+def test_archive_and_restore(backend, make_task):
+    make_task("t1", "2026-01-05T08:00:00", [(0, "pass", "甲"), (1, "fail", "乙")])
+    task = backend.get("/api/tasks/t1").json()
+
+    assert backend.portal.call(archive_service.archive_task, task) == 2
+    assert backend.portal.call(get_repository().count, "audit_results", {"task_id": "t1"}) == 0
+    assert task_state(backend, "t1")[1] is None
+    assert [result["result"] for result in backend.get("/api/tasks/t1/results").json()] == ["pass", "fail"]
+
+    assert backend.post("/api/tasks/t1/restore").json()["results"] == 2
+    assert task_state(backend, "t1") == (None, None)
+    assert backend.portal.call(get_repository().count, "audit_results", {"task_id": "t1"}) == 2
+
+def test_result_edited_while_archiving_is_kept(backend, make_task, monkeypatch):
+    make_task("t1", "2026-01-05T08:00:00", [(0, "pass", "甲"), (1, "fail", "乙")])
+    task = backend.get("/api/tasks/t1").json()
+    write_archive = archive_service._write_archive
+
+    async def write_then_edit(task):
+        versions = await write_archive(task)
+        # 其他请求在归档文件写完之后修改了一条结果
+        await get_repository().update_one("audit_results", {"_id": "t1-1"}, {"result": "pass", "updated_at": "2026-03-01T00:00:00"})
+        return versions
+
+    monkeypatch.setattr(archive_service, "_write_archive", write_then_edit)
+    assert backend.portal.call(archive_service.archive_task, task) is None
+
+    assert task_state(backend, "t1") == (None, None)
+    assert not os.path.exists(archive_service.archive_path(task))
+    results = backend.get("/api/tasks/t1/results", params={"include_content": True}).json()
+    assert {result["_id"]: (result["result"], result["content"]) for result in results} == {"t1-0": ("pass", "甲"), "t1-1": ("pass", "乙")}
+
+def test_claimed_task_is_not_archived_or_restored(backend, make_task):
+    make_task("t1", "2026-01-05T08:00:00", [(0, "pass", "甲")])
+    task = backend.get("/api/tasks/t1").json()
+    claim = backend.portal.call(archive_service._claim, "t1", {})
+
+    assert backend.portal.call(archive_service.archive_task, task) is None
+    backend.portal.call(archive_service._release, "t1", claim)
+    assert backend.portal.call(archive_service.archive_task, task) == 1
+
+    backend.portal.call(archive_service._claim, "t1", {})
+    with pytest.raises(archive_service.ArchiveConflictError):
+        backend.portal.call(archive_service.restore_task, task)
+    assert backend.post("/api/tasks/t1/restore").status_code == 409
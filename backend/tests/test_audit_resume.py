@@ -0,0 +1,20 @@
+from app.services.audit_service import completed_audits, document_audit_items, load_scene_bundle
+from app.services.content_service import store_content
+
+def test_resume_tells_same_named_files_apart(backend, catalog, make_task):
+    # 第一个 contract.txt 两个审核项都已完成
+    make_task("t1", "2026-01-05T08:00:00", [(0, "pass", "甲"), (1, "fail", "甲")])
+    task = {"_id": "t1", "use_knowledge_base": False}
+    bundle = backend.portal.call(load_scene_bundle, catalog["scene"]["_id"], True)
+    done = backend.portal.call(completed_audits, "t1")
+
+    def pending(content: str) -> list:
+        document = {"name": "contract.txt", "content": content, "kind": "text"}
+        items, _ = backend.portal.call(document_audit_items, task, bundle, document, backend.portal.call(store_content, content), done)
+        return [item["_id"] for _, item, _ in items]
+
+    item_ids = [item["_id"] for item in catalog["items"]]
+    assert pending("甲") == []
+    # 同名但内容不同的文件、同名同内容的第二个文件都需要审核
+    assert pending("乙") == item_ids
+    assert pending("甲") == item_ids
@@ -0,0 +1,101 @@
+import io
+import csv
+import json
+
+def test_statistics(backend, catalog, make_task):
+    make_task("t1", "2026-01-05T08:00:00", [(0, "pass", "甲"), (1, "fail", "乙")])
+    make_task("t2", "2026-02-05T08:00:00", [(0, "warning", "丙")])
+
+    summary = backend.get("/api/tasks/statistics/summary").json()
+    assert summary["tasks"]["completed"] == 2
+    assert summary["results"] == {"pass": 1, "warning": 1, "fail": 1}
+
+    january = backend.get("/api/tasks/statistics/summary", params={
+        "scene_id": catalog["scene"]["_id"], "date_from": "2026-01-01", "date_to": "2026-01-31"
+    }).json()
+    assert january["tasks"]["completed"] == 1
+    assert january["results"] == {"pass": 1, "warning": 0, "fail": 1}
+    assert backend.get("/api/tasks/statistics/summary", params={"rule_id": "missing"}).json()["results"]["pass"] == 0
+
+def test_export(backend, catalog, make_task):
+    make_task("t1", "2026-01-05T08:00:00", [(0, "pass", "=SUM(1)"), (1, "fail", "乙方内容")])
+
+    response = backend.get("/api/tasks/t1/results/download", params={"format": "csv", "include_content": True})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert [row["审核项"] for row in rows] == ["签字", "日期"]
+    assert rows[0]["规则"] == "签署规则"
+    assert [row["审核内容"] for row in rows] == ["'=SUM(1)", "乙方内容"]
+
+    lines = backend.get("/api/tasks/t1/results/download", params={"format": "jsonl"}).text.splitlines()
+    assert [json.loads(line)["result"] for line in lines] == ["pass", "fail"]
+
+    # 已归档任务从归档文件导出
+    assert backend.post("/api/tasks/t1/archive").status_code == 200
+    archived = backend.get("/api/tasks/t1/results/download", params={"format": "csv", "include_content": True})
+    assert archived.content == response.content
+    assert backend.get("/api/tasks/missing/results/download").status_code == 404
+
+def test_batch(backend, catalog):
+    rule_id = catalog["rule"]["_id"]
+
+    response = backend.post("/api/audit-items/batch", json={"operations": [
+        {"op": "create", "data": {"name": "新增", "rule_id": rule_id, "type": "text", "criteria": "c"}},
+        {"op": "update", "id": catalog["items"][0]["_id"], "data": {"name": "已改名"}},
+        {"op": "delete", "id": catalog["items"][1]["_id"]},
+        {"op": "update", "id": "missing", "data": {"name": "x"}},
+    ]})
+    assert response.status_code == 400
+    assert response.json()["detail"]["results"][3]["status"] == "not_found"
+    items = backend.get(f"/api/audit-items/rule/{rule_id}").json()
+    assert sorted(item["name"] for item in items) == ["日期", "签字"]
+
+    report = backend.post("/api/rules/batch", json={"operations": [
+        {"op": "update", "id": rule_id, "data": {"description": "d"}},
+        {"op": "delete", "id": "missing"},
+    ], "atomic": False}).json()
+    assert (report["committed"], report["succeeded"], report["failed"]) == (True, 1, 1)
+    assert report["results"][0]["item"]["description"] == "d"
+
+    report = backend.post("/api/rules/batch", json={"operations": [{"op": "delete", "id": rule_id}]}).json()
+    assert report["committed"]
+    assert backend.get(f"/api/audit-items/rule/{rule_id}").json() == []
+
+def test_import(backend):
+    rows = [
+        "record_type,name,scene_name,rule_name,type,criteria,description",
+        "audit_item,盖章,,采购规则,text,必须加盖公章,",
+        "rule,采购规则,采购,,,,",
+        "scene,采购,,,,,采购合同",
+        "audit_item,缺少标准,,采购规则,text,,",
+    ]
+    data = ("\n".join(rows) + "\n").encode("utf-8")
+
+    dry_run = backend.post("/api/import", params={"dry_run": True}, files={"file": ("catalog.csv", data, "text/csv")}).json()
+    assert dry_run["created"] == {"scene": 1, "rule": 1, "audit_item": 1}
+    assert dry_run["failed"] == 1
+    assert backend.get("/api/scenes/").json() == []
+
+    report = backend.post("/api/import", files={"file": ("catalog.csv", data, "text/csv")}).json()
+    assert report["created"] == {"scene": 1, "rule": 1, "audit_item": 1}
+    rule = backend.get("/api/rules/").json()[0]
+    created_at = rule["created_at"]
+    assert backend.get(f"/api/audit-items/rule/{rule['_id']}").json()[0]["criteria"] == "必须加盖公章"
+
+    report = backend.post("/api/import", files={"file": ("catalog.csv", data, "text/csv")}).json()
+    assert report["updated"] == {"scene": 1, "rule": 1, "audit_item": 1}
+    assert backend.get("/api/rules/").json()[0]["created_at"] == created_at
+
+def test_search(backend, catalog, make_task):
+    make_task("t1", "2026-01-05T08:00:00", [(0, "fail", "内容")])
+
+    found = backend.get("/api/search", params={"q": "签字"}).json()["results"]
+    assert [item["name"] for item in found["rules"]["items"]] == []
+    assert [item["name"] for item in found["audit_items"]["items"]] == ["签字"]
+    assert found["audit_items"]["items"][0]["scene_id"] == catalog["scene"]["_id"]
+    assert "<mark>签字</mark>" in found["audit_items"]["items"][0]["highlights"]["criteria"]
+
+    results = backend.get("/api/search", params={"q": "理由0", "task_id": "t1", "scene_id": catalog["scene"]["_id"]}).json()
+    assert [item["task_name"] for item in results["results"]["audit_results"]["items"]] == ["t1"]
+    assert backend.get("/api/search", params={"q": "签字", "scene_id": "other"}).json()["results"]["audit_items"]["items"] == []
+    assert backend.post("/api/search/rebuild").json()["documents"]["audit_items"] == 2
@@ -0,0 +1,53 @@
+import asyncio
+from app.core.tracing import OTLPJsonFileExporter, Tracer
+
+class ListExporter:
+    """记录每次导出的span名称"""
+    def __init__(self):
+        self.exported = []
+
+    def export(self, spans):
+        self.exported.append([span.name for span in spans])
+
+def make_tracer() -> Tracer:
+    tracer = Tracer()
+    tracer.exporter = ListExporter()
+    return tracer
+
+def test_trace_exported_when_root_ends():
+    tracer = make_tracer()
+    with tracer.span("root"):
+        with tracer.span("child"):
+            pass
+    assert tracer.exporter.exported == [["child", "root"]]
+    assert tracer._pending == {}
+
+def test_child_ending_after_root_is_exported_alone():
+    tracer = make_tracer()
+
+    async def child():
+        with tracer.span("child"):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        with tracer.span("root"):
+            task = asyncio.create_task(child())
+            await asyncio.sleep(0)
+        await task
+
+    asyncio.run(run())
+    assert tracer.exporter.exported == [["root"], ["child"]]
+    assert tracer._pending == {}
+
+def test_file_exporter_rotates(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    exporter = OTLPJsonFileExporter(path, "test", max_bytes=1)
+    tracer = Tracer()
+    tracer.exporter = exporter
+    exporter.start()
+    for name in ("first", "second"):
+        with tracer.span(name):
+            pass
+    exporter.stop()
+    assert "second" in open(path, encoding="utf-8").read()
+    assert "first" in open(path + ".1", encoding="utf-8").read()
@@ -27,7 +27,8 @@ interface AuditResult {
   task_id: string;
   rule_id: string;
   audit_item_id: string;
-  content: string;
+  content?: string;
+  content_hash?: string;
   result: string;
   reason: string;
   ai_generated: boolean;
@@ -68,36 +69,20 @@ const AuditTask: React.FC = () => {
   // 当前选中的任务ID
   const [selectedTaskId, setSelectedTaskId] = useState<string | null>(null);
 
-  // 获取业务场景列表
-  const fetchScenes = async () => {
-    try {
-      const response = await axios.get('http://localhost:8000/api/scenes');
-      setScenes(response.data);
-    } catch (error) {
-      message.error('获取业务场景失败');
-      console.error('Error fetching scenes:', error);
-    }
-  };
-
-  // 获取规则列表
-  const fetchRules = async () => {
-    try {
-      const response = await axios.get('http://localhost:8000/api/rules');
-      setRules(response.data);
-    } catch (error) {
-      message.error('获取规则失败');
-      console.error('Error fetching rules:', error);
-    }
-  };
-
-  // 获取审核项列表
-  const fetchAuditItems = async () => {
+  // 一次获取业务场景、规则、审核项与审核任务；数据未变更时浏览器凭ETag收到304，直接使用缓存
+  const fetchBootstrap = async () => {
+    setLoading(true);
     try {
-      const response = await axios.get('http://localhost:8000/api/audit-items');
-      setAuditItems(response.data);
+      const response = await axios.get('http://localhost:8000/api/bootstrap');
+      setScenes(response.data.scenes);
+      setRules(response.data.rules);
+      setAuditItems(response.data.audit_items);
+      setTasks(response.data.tasks);
     } catch (error) {
-      message.error('获取审核项失败');
-      console.error('Error fetching audit items:', error);
+      message.error('获取页面数据失败');
+      console.error('Error fetching bootstrap data:', error);
+    } finally {
+      setLoading(false);
     }
   };
 
@@ -118,7 +103,7 @@ const AuditTask: React.FC = () => {
   // 获取审核结果列表
   const fetchResults = async (taskId: string) => {
     try {
-      const response = await axios.get(`http://localhost:8000/api/tasks/${taskId}/results`);
+      const response = await axios.get(`http://localhost:8000/api/tasks/${taskId}/results`, { params: { include_content: true } });
       setResults(response.data);
       setSelectedTaskId(taskId);
     } catch (error) {
@@ -128,16 +113,13 @@ const AuditTask: React.FC = () => {
   };
 
   useEffect(() => {
-    fetchScenes();
-    fetchRules();
-    fetchAuditItems();
-    fetchTasks();
+    fetchBootstrap();
   }, []);
 
   // 创建/编辑审核任务
   const showTaskModal = async (task?: AuditTask) => {
-    // 重新获取业务场景列表，确保与业务场景管理页面一致
-    await fetchScenes();
+    // 重新获取页面数据，确保业务场景与业务场景管理页面一致（未变更时为304）
+    await fetchBootstrap();
     
     if (task) {
       setEditingTask(task);
@@ -221,22 +203,14 @@ const AuditTask: React.FC = () => {
     });
   };
 
-  // 下载审核结果
-  const downloadResults = async (taskId: string) => {
-    try {
-      const response = await axios.post(`http://localhost:8000/api/tasks/${taskId}/download`, {}, { responseType: 'blob' });
-      const url = window.URL.createObjectURL(new Blob([response.data]));
-      const link = document.createElement('a');
-      link.href = url;
-      link.setAttribute('download', `audit-results-${taskId}.zip`);
-      document.body.appendChild(link);
-      link.click();
-      link.remove();
-      message.success('下载审核结果成功');
-    } catch (error) {
-      message.error('下载审核结果失败');
-      console.error('Error downloading results:', error);
-    }
+  // 下载审核结果：直接由浏览器下载流式导出的文件，无需先缓存为Blob
+  const downloadResults = (taskId: string) => {
+    const link = document.createElement('a');
+    link.href = `http://localhost:8000/api/tasks/${taskId}/results/download?format=xlsx`;
+    link.setAttribute('download', `audit-results-${taskId}.xlsx`);
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
   };
 
   // 获取状态标签
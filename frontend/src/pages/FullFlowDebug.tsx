@@ -511,11 +511,33 @@ const FullFlowDebug: React.FC = () => {
         }))
       };
       
-      // 调用后端校验API
-      const response = await axios.post('http://localhost:8000/api/rules/validate', requestData);
+      // 调用后端校验API，以NDJSON流式接收，每个文件校验完成后立即展示
+      const response = await fetch('http://localhost:8000/api/rules/validate?stream=true', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(requestData)
+      });
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        throw { response: { data } };
+      }
       
       // 处理校验结果
-      setValidationResults(response.data.results || []);
+      setValidationResults([]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        const results = lines.filter(line => line.trim()).map(line => JSON.parse(line));
+        if (results.length > 0) {
+          setValidationResults(prev => [...prev, ...results].sort((a, b) => a.index - b.index));
+        }
+      }
       message.success('规则校验完成');
     } catch (error: any) {
       console.error('Error running validation:', error);